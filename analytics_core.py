@@ -0,0 +1,1342 @@
+"""
+Núcleo de análisis de CTR sin dependencias de Streamlit.
+
+Contiene la lectura de los CSV exportados de Google Analytics, la normalización por mes,
+el merge usuarios × CTA con el cálculo de CTR y los agregados que usan la app y la CLI.
+"""
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from app_config import INGEST_CONFIG, OUT_OF_CORE_CONFIG
+from column_schema import HEADER_PATTERN, has_source_column, normalize_column_name, resolve_columns
+from profiling import profile_stage
+
+logger = logging.getLogger(__name__)
+
+TOTAL_LABELS = ['total', 'totales']
+
+# Campo que se añade al final de cada línea del cuerpo para saber si la fila traía todos sus campos
+ROW_END = '\x1e'
+
+# Columnas de dimensión que se codifican como Categoricals compartidos
+DIMENSION_COLUMNS = ['landing_page', 'fuente', 'mes']
+
+# Clave de una fila dentro de un archivo mensual
+KEY_COLUMNS = ['fuente', 'landing_page']
+
+# Columna de recuento de cada tipo de datos y tasa (%) sobre total_users que se deriva de cada recuento
+COUNT_COLUMNS = {'cta': 'cta_clicks', 'users': 'total_users', 'forms': 'form_submissions'}
+RATE_COLUMNS = {'cta_clicks': 'CTR', 'form_submissions': 'conversion_rate'}
+RATE_DENOMINATOR = 'total_users'
+# Numerador de cada tasa
+RATE_NUMERATORS = {rate_col: count_col for count_col, rate_col in RATE_COLUMNS.items()}
+
+# Etiqueta del grupo que reúne los valores fuera del top en los gráficos
+OTHER_LABEL = 'Otros'
+
+def _is_header_line(line):
+    """
+    Indica si la línea contiene los nombres de columnas típicos de un export de GA
+    """
+    return HEADER_PATTERN.search(line) is not None and (',' in line or ';' in line)
+
+def _parse_header(header_line):
+    """
+    Detecta delimitador, nombres de columnas y formato (2 o 3 columnas) a partir de la fila de encabezados
+    """
+    delimiter = ',' if header_line.count(',') >= header_line.count(';') else ';'
+    header = [normalize_column_name(h) for h in header_line.split(delimiter)]
+    has_source = has_source_column(header)
+    return delimiter, header, has_source
+
+class _RowEndMarker:
+    """
+    Lectura del cuerpo del CSV que termina cada línea con n_cols - 1 campos ROW_END. El parser de pandas rellena
+    con '' los campos que faltan en una fila corta (una página sin valor o las líneas '# ...' que GA4 escribe
+    tras la tabla); con las marcas, una fila corta tiene ROW_END en una de sus n_cols columnas de datos y se
+    puede descartar. Además toda línea llega al menos a n_cols campos: con usecols, el parser falla si ninguna
+    fila de un bloque tiene tantos campos como nombres de columna.
+    """
+    def __init__(self, stream, delimiter, n_cols):
+        self.stream = stream
+        self.line_end = f"{delimiter}{ROW_END}" * (n_cols - 1) + "\n"
+        self.open_line = False
+
+    def read(self, size=-1):
+        block = self.stream.read(size)
+        if not block:
+            # Última línea sin salto de línea final
+            if self.open_line:
+                self.open_line = False
+                return self.line_end
+            return ''
+        self.open_line = not block.endswith('\n')
+        return block.replace('\n', self.line_end)
+
+def _filter_valid_rows(chunk):
+    """
+    Filtra filas cortas, vacías y totales de un bloque ya parseado usando operaciones por columna.
+    La penúltima columna es la página y la última el valor; una fila corta tiene ROW_END en alguna columna.
+    """
+    # Antes de quitar espacios: str.strip también elimina ROW_END
+    complete = ~chunk.eq(ROW_END).any(axis=1)
+    chunk = chunk.apply(lambda s: s.str.strip())
+    page = chunk.iloc[:, -2]
+    value = chunk.iloc[:, -1]
+    mask = complete & (page != '') & ~page.str.lower().isin(TOTAL_LABELS) & ~value.str.lower().isin(TOTAL_LABELS)
+    return chunk[mask]
+
+def _file_size(file):
+    """
+    Tamaño en bytes de un archivo subido (UploadedFile/BytesIO) o de un archivo abierto en disco
+    """
+    size = getattr(file, 'size', None)
+    if size is None and hasattr(file, 'getbuffer'):
+        size = file.getbuffer().nbytes
+    if size is None and hasattr(file, 'fileno'):
+        size = os.fstat(file.fileno()).st_size
+    return size
+
+def _should_stream(file):
+    """
+    Decide si un archivo se lee en modo streaming según su tamaño
+    """
+    size = _file_size(file)
+    return size is not None and size >= INGEST_CONFIG['streaming_threshold_mb'] * 1024 * 1024
+
+def iter_ga_chunks(file, chunk_rows=None):
+    """
+    Busca la fila de encabezados recorriendo solo las primeras líneas y parsea el resto con el parser C de pandas.
+    Genera (bloque de filas válidas con los nombres del encabezado, has_source): con chunk_rows el cuerpo
+    se procesa en bloques de tamaño acotado; sin él, en un único bloque. Siempre genera al menos un bloque.
+    """
+    file.seek(0)
+    # Saltos de línea universales: en el cuerpo todas las líneas terminan en '\n' y _RowEndMarker las reconoce
+    stream = io.TextIOWrapper(file, encoding='utf-8')
+    try:
+        header_line = None
+        with profile_stage('detección de encabezados'):
+            for line in iter(stream.readline, ''):
+                if _is_header_line(line):
+                    header_line = line.rstrip('\r\n')
+                    break
+        if header_line is None:
+            raise ValueError("No se encontró la fila de encabezados en el archivo CSV. Asegúrate de que exista una fila con los nombres de las columnas.")
+
+        delimiter, header, has_source = _parse_header(header_line)
+        # Formato de 3 columnas: fuente, page_path, valor / de 2 columnas: page_path, valor
+        n_cols = 3 if has_source else 2
+
+        # Las marcas de fin de línea de una fila completa caen fuera de las columnas leídas, igual que los
+        # campos de sobra, que se ignoran como antes
+        reader = pd.read_csv(
+            _RowEndMarker(stream, delimiter, n_cols),
+            sep=delimiter,
+            header=None,
+            names=list(range(n_cols)),
+            usecols=list(range(n_cols)),
+            dtype=str,
+            keep_default_na=False,
+            skip_blank_lines=True,
+            chunksize=chunk_rows
+        )
+        chunks = reader if chunk_rows else [reader]
+        emitted = False
+        for chunk in chunks:
+            with profile_stage('filtro de filas válidas') as stage:
+                chunk = _filter_valid_rows(chunk)
+                stage['rows'] = len(chunk)
+            chunk.columns = header[:n_cols]
+            emitted = True
+            yield chunk, has_source
+        if not emitted:
+            yield pd.DataFrame(columns=header[:n_cols], dtype=str), has_source
+    finally:
+        # Soltar el buffer subyacente sin cerrarlo (Streamlit lo reutiliza en cada rerun)
+        stream.detach()
+
+def _read_ga_csv(file, chunk_rows=None):
+    """
+    Lee un export de GA completo en un DataFrame (por bloques si se indica chunk_rows)
+    """
+    # Incluye la decodificación y el parser C, que pandas ejecuta juntos al consumir el lector
+    with profile_stage('lectura CSV', getattr(file, 'name', None)) as stage:
+        chunks = []
+        has_source = False
+        for chunk, has_source in iter_ga_chunks(file, chunk_rows):
+            chunks.append(chunk)
+        df = pd.concat(chunks, ignore_index=True)
+        stage['rows'] = len(df)
+    return df, has_source
+
+def read_ga_preamble(file, max_lines=100):
+    """
+    Lee solo el principio del archivo y devuelve (líneas del preámbulo de GA, fila de encabezados o None),
+    sin parsear el cuerpo. Sirve para clasificar un archivo antes de ingerirlo.
+    """
+    file.seek(0)
+    stream = io.TextIOWrapper(file, encoding='utf-8', errors='replace', newline='')
+    preamble = []
+    header_line = None
+    try:
+        for _, line in zip(range(max_lines), iter(stream.readline, '')):
+            line = line.rstrip('\r\n')
+            if _is_header_line(line):
+                header_line = line
+                break
+            preamble.append(line)
+    finally:
+        stream.detach()
+        file.seek(0)
+    return preamble, header_line
+
+def read_csv_streaming(file, chunk_rows=None):
+    """
+    Variante en streaming de read_csv_with_header_detection_and_clean.
+    El cuerpo del archivo se procesa en bloques de chunk_rows filas, sin cargarlo completo decodificado en memoria.
+    """
+    return _read_ga_csv(file, chunk_rows or INGEST_CONFIG['chunk_rows'])
+
+def read_csv_with_header_detection_and_clean(file, streaming=None):
+    """
+    Lee un CSV detectando automáticamente la fila donde empiezan los encabezados y filtra solo filas válidas.
+    Maneja tanto formato de 2 columnas (page_path, valor) como 3 columnas (fuente, page_path, valor).
+    Los archivos grandes (o si streaming=True) se leen por bloques con read_csv_streaming.
+    """
+    if streaming is None:
+        streaming = _should_stream(file)
+    if streaming:
+        return read_csv_streaming(file)
+    return _read_ga_csv(file)
+
+def clean_column(df, col):
+    # Elimina espacios, convierte a string y a minúsculas
+    return df[col].astype(str).str.strip().str.lower()
+
+class ParseCache:
+    """
+    Caché LRU de archivos mensuales ya normalizados, indexada por el hash del contenido y el tipo de datos.
+    Se limita por memoria ocupada y lleva contadores de aciertos y fallos.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, nbytes):
+        with self._lock:
+            if nbytes > self.max_bytes:
+                return
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, nbytes)
+            self._bytes += nbytes
+            # Expulsar las entradas menos usadas hasta respetar el límite
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._bytes -= evicted_bytes
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+def file_content_hash(file):
+    """
+    Hash del contenido del archivo subido, sin copiar el buffer
+    """
+    if hasattr(file, 'getbuffer'):
+        return hashlib.blake2b(file.getbuffer(), digest_size=16).hexdigest()
+    # Archivos abiertos en disco: hash por bloques
+    digest = hashlib.blake2b(digest_size=16)
+    file.seek(0)
+    for block in iter(lambda: file.read(1024 * 1024), b''):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+def normalize_ga_frame(df, has_source, data_type):
+    """
+    Normaliza un export de GA ya leído (o un bloque) a las columnas fuente, landing_page y
+    cta_clicks/total_users/form_submissions según data_type ('cta', 'users' o 'forms').
+    Devuelve None si faltan columnas.
+    """
+    df.columns = [normalize_column_name(col) for col in df.columns]
+    
+    # Columnas relevantes según el tipo de datos (resueltas una vez por formato de encabezado)
+    page_col, source_col, value_col = resolve_columns(df.columns, data_type)
+    source_col = source_col if has_source else None
+    col_name = COUNT_COLUMNS[data_type]
+    
+    if not (page_col and value_col):
+        return None
+
+    if has_source and source_col:
+        month_df = df[[source_col, page_col, value_col]].copy()
+        month_df.columns = ['fuente', 'landing_page', col_name]
+    else:
+        month_df = df[[page_col, value_col]].copy()
+        month_df.columns = ['landing_page', col_name]
+        month_df['fuente'] = 'no especificado'  # Valor por defecto
+    
+    with profile_stage('limpieza de texto', data_type) as stage:
+        if has_source and source_col:
+            month_df['fuente'] = clean_column(month_df, 'fuente')
+        month_df['landing_page'] = clean_column(month_df, 'landing_page')
+        stage['rows'] = len(month_df)
+    with profile_stage('conversión numérica', data_type) as stage:
+        month_df = month_df.dropna(subset=['landing_page', col_name])
+        month_df[col_name] = pd.to_numeric(month_df[col_name], errors='coerce').fillna(0).astype(int)
+        stage['rows'] = len(month_df)
+    return month_df
+
+def sum_repeated_keys(month_df):
+    """
+    Suma las filas de un archivo mensual con la misma clave (fuente, landing_page), también las que solo
+    coinciden tras pasar a minúsculas y quitar espacios, en el orden de primera aparición. Así cada clave
+    entra una sola vez en el join, igual que en el modo out-of-core, que suma por clave al leer cada bloque.
+    """
+    if not month_df.duplicated(KEY_COLUMNS).any():
+        return month_df
+    with profile_stage('suma de claves repetidas') as stage:
+        month_df = month_df.groupby(KEY_COLUMNS, sort=False, as_index=False).sum()[list(month_df.columns)]
+        stage['rows'] = len(month_df)
+    return month_df
+
+def normalize_monthly_file(file, data_type):
+    """
+    Lee un archivo mensual y lo normaliza a las columnas fuente, landing_page y cta_clicks/total_users,
+    con una fila por clave. Devuelve (DataFrame o None si faltan columnas, has_source).
+    """
+    df, has_source = read_csv_with_header_detection_and_clean(file)
+    month_df = normalize_ga_frame(df, has_source, data_type)
+    return (sum_repeated_keys(month_df) if month_df is not None else None), has_source
+
+def load_monthly_file(file, data_type, cache=None, store=None, month_name=None):
+    """
+    Igual que normalize_monthly_file pero consultando antes la caché de lectura en memoria
+    y, si se pasa un DatasetStore, el almacén en disco del mes
+    """
+    if cache is None and store is None:
+        return normalize_monthly_file(file, data_type)
+    content_hash = file_content_hash(file)
+    key = (content_hash, data_type)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            # El mes vuelve a esta versión también en el almacén (o se guarda si aún no estaba)
+            if store is not None and cached[0] is not None and not store.set_current(data_type, month_name, content_hash):
+                store.put(data_type, month_name, content_hash, *cached)
+            return cached
+
+    result = store.get(data_type, month_name, content_hash) if store is not None else None
+    if result is None:
+        result = normalize_monthly_file(file, data_type)
+        if store is not None and result[0] is not None:
+            store.put(data_type, month_name, content_hash, *result)
+
+    if cache is not None:
+        month_df = result[0]
+        nbytes = int(month_df.memory_usage(deep=True).sum()) if month_df is not None else 0
+        cache.put(key, result, nbytes)
+    return result
+
+def _load_month_safe(month_name, file, data_type, cache, store):
+    """
+    Carga un archivo mensual capturando el error para reportarlo desde el hilo principal
+    (en la app, st.error no se puede llamar desde los hilos del pool)
+    """
+    try:
+        with profile_stage('ingesta', f"{data_type} {month_name}") as stage:
+            month_df, has_source = load_monthly_file(file, data_type, cache, store, month_name)
+            stage['rows'] = len(month_df) if month_df is not None else 0
+        return month_df, has_source, None
+    except Exception as e:
+        return None, False, e
+
+def _log_month_error(month_name, error):
+    logger.error("Error procesando archivo de %s: %s", month_name, error)
+
+def load_monthly_frames(files_by_type, cache=None, max_workers=None, on_error=None, store=None):
+    """
+    Lee en paralelo los archivos mensuales de todos los tipos de datos ({'cta': {...}, 'users': {...}}).
+    Devuelve {(data_type, month_name): (month_df o None, has_source)} en el orden de entrada, sin los meses con error.
+    Los errores por mes se reportan con on_error(month_name, error), por defecto en el log.
+    """
+    on_error = on_error or _log_month_error
+    max_workers = max_workers or INGEST_CONFIG['max_workers']
+    futures = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for data_type, monthly_files in files_by_type.items():
+            for month_name, file in monthly_files.items():
+                if file is not None:
+                    # Cada tarea con una copia del contexto para que herede el profiler activo
+                    futures[(data_type, month_name)] = executor.submit(
+                        copy_context().run, _load_month_safe, month_name, file, data_type, cache, store)
+
+    frames = {}
+    # Recorrer en el orden original para que la salida sea idéntica a la del procesamiento en serie
+    for key, future in futures.items():
+        month_df, has_source, error = future.result()
+        if error is not None:
+            on_error(key[1], error)
+            continue
+        frames[key] = (month_df, has_source)
+    return frames
+
+def process_all_monthly_data(files_by_type, cache=None, max_workers=None, on_error=None, store=None):
+    """
+    Procesa en paralelo los archivos mensuales de todos los tipos de datos ({'cta': {...}, 'users': {...}}).
+    Devuelve {data_type: (DataFrame consolidado, has_source)} con el mismo resultado que process_monthly_data.
+    Los errores por mes se reportan con on_error(month_name, error), por defecto en el log.
+    """
+    frames = load_monthly_frames(files_by_type, cache, max_workers, on_error, store)
+
+    results = {}
+    for data_type, monthly_files in files_by_type.items():
+        all_monthly_data = []
+        has_source_data = False
+        
+        for month_name in monthly_files:
+            if (data_type, month_name) not in frames:
+                continue
+            month_df, has_source = frames[(data_type, month_name)]
+            if has_source:
+                has_source_data = True
+            if month_df is not None:
+                all_monthly_data.append(month_df.assign(mes=month_name))
+        
+        if all_monthly_data:
+            results[data_type] = (pd.concat(all_monthly_data, ignore_index=True), has_source_data)
+        else:
+            results[data_type] = (pd.DataFrame(), False)
+    return results
+
+def process_monthly_data(monthly_files, data_type, cache=None, max_workers=None, on_error=None, store=None):
+    """
+    Procesa los archivos mensuales y devuelve un DataFrame consolidado.
+    Si se pasa una ParseCache, los archivos ya leídos en un rerun anterior no se vuelven a parsear.
+    """
+    return process_all_monthly_data({data_type: monthly_files}, cache, max_workers, on_error, store)[data_type]
+
+def dimension_dtypes(frames, month_order=None):
+    """
+    Diccionario compartido de categorías para landing_page, fuente y mes a partir de varios DataFrames
+    """
+    dtypes = {}
+    for col in DIMENSION_COLUMNS:
+        present = [df[col] for df in frames if col in df.columns]
+        if not present:
+            continue
+        values = pd.concat([pd.Series(col_values.unique()) for col_values in present], ignore_index=True).unique()
+        if col == 'mes' and month_order is not None:
+            # Orden cronológico para los meses conocidos y al final cualquier otro valor
+            known = [m for m in month_order if m in set(values)]
+            categories = known + sorted(set(values) - set(month_order))
+            dtypes[col] = pd.CategoricalDtype(categories, ordered=True)
+        else:
+            dtypes[col] = pd.CategoricalDtype(sorted(values))
+    return dtypes
+
+def apply_dimension_dtypes(df, dtypes):
+    """
+    Aplica el diccionario compartido. Las columnas que ya son categóricas se recodifican con set_categories:
+    astype no reordena un Categorical sin orden cuyas categorías coinciden aunque estén en otro orden.
+    """
+    columns = {}
+    for col, dtype in dtypes.items():
+        if col not in df.columns:
+            continue
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            columns[col] = df[col].cat.set_categories(dtype.categories, ordered=dtype.ordered)
+        else:
+            columns[col] = df[col].astype(dtype)
+    return df.assign(**columns)
+
+def encode_dimensions(frames, month_order=None):
+    """
+    Convierte landing_page, fuente y mes en Categoricals con un único diccionario compartido
+    entre todos los DataFrames, para que merges y groupbys trabajen sobre códigos enteros.
+    """
+    with profile_stage('codificación de dimensiones') as stage:
+        dtypes = dimension_dtypes(frames, month_order)
+        encoded = [apply_dimension_dtypes(df, dtypes) for df in frames]
+        stage['rows'] = sum(len(df) for df in encoded)
+    return encoded
+
+class AggregationCube:
+    """
+    Cubo de agregados (mes × fuente × landing_page) con sumas y conteos, calculado una sola vez por dataset.
+    Los gráficos y tablas resumen leen sus agregados de aquí en lugar de repetir cada uno su propio groupby.
+
+    Las tasas (CTR y conversión) no se agregan: se guardan sus numeradores y denominadores, que son sumas,
+    y la tasa se deriva al final en cada nivel. Hay dos variantes: la ponderada (rate, por defecto), que es
+    el cociente de las sumas (Σclicks / Σusuarios), y la simple (mean), que es la media de la tasa de cada
+    fila original y se reconstruye con la suma y el conteo de las tasas por fila sin redondear.
+    """
+    SUM_COLUMNS = ['total_users', 'cta_clicks', 'form_submissions']
+    MEAN_COLUMNS = ['CTR', 'conversion_rate']
+
+    def __init__(self, df):
+        dims = [col for col in ['mes', 'fuente', 'landing_page'] if col in df.columns]
+        sum_columns = [col for col in self.SUM_COLUMNS if col in df.columns]
+        mean_columns = [col for col in self.MEAN_COLUMNS if {RATE_NUMERATORS[col], RATE_DENOMINATOR} <= set(sum_columns)]
+        with profile_stage('cubo de agregados', ' × '.join(dims)) as stage:
+            columns = {col: df[col] for col in sum_columns}
+            if mean_columns:
+                # Sin usuarios la tasa de la fila no está definida y no cuenta para la media simple
+                denominator = df[RATE_DENOMINATOR].where(df[RATE_DENOMINATOR] > 0)
+                for col in mean_columns:
+                    columns[col] = df[RATE_NUMERATORS[col]] / denominator * 100
+            aggregations = {col: (col, 'sum') for col in sum_columns}
+            for col in mean_columns:
+                # Suma y conteo de valores no nulos para poder reconstruir la media en cualquier nivel
+                aggregations[f'{col}_sum'] = (col, 'sum')
+                aggregations[f'{col}_count'] = (col, 'count')
+            frame = pd.DataFrame(columns).assign(**{dim: df[dim] for dim in dims})
+            self._set_cells(frame.groupby(dims, observed=True).agg(**aggregations))
+            stage['rows'] = len(df)
+
+    @classmethod
+    def from_cells(cls, cells):
+        """
+        Construye el cubo a partir de celdas ya agregadas (p. ej. las de varios meses concatenadas)
+        """
+        cube = cls.__new__(cls)
+        cube._set_cells(cells)
+        return cube
+
+    def _set_cells(self, cells):
+        self.cells = cells
+        self.dims = list(cells.index.names)
+        self.sum_columns = [col for col in self.SUM_COLUMNS if col in cells.columns]
+        self.mean_columns = [col for col in self.MEAN_COLUMNS if f'{col}_sum' in cells.columns]
+        self.rate_columns = [col for col in self.MEAN_COLUMNS if {RATE_NUMERATORS[col], RATE_DENOMINATOR} <= set(self.sum_columns)]
+        self._rollups = {}
+        self._fingerprint = None
+
+    def fingerprint(self):
+        """
+        Huella de los agregados: cambia solo si cambian los datos del cubo (memoizada)
+        """
+        if self._fingerprint is None:
+            self._fingerprint = frame_fingerprint(self.cells)
+        return self._fingerprint
+
+    def rollup(self, dims):
+        """
+        Agregados sumados a las dimensiones pedidas (memoizado)
+        """
+        key = tuple(dims)
+        if key not in self._rollups:
+            if list(key) == self.dims:
+                self._rollups[key] = self.cells
+            else:
+                self._rollups[key] = self.cells.groupby(list(key), observed=True).sum()
+        return self._rollups[key]
+
+    def _rollup(self, dims, top_k):
+        return self.bucket_top(dims, dims[-1], top_k) if top_k else self.rollup(dims)
+
+    @staticmethod
+    def _rate(sums, metric, weighted):
+        if weighted:
+            numerator, denominator = sums[RATE_NUMERATORS[metric]], sums[RATE_DENOMINATOR]
+        else:
+            numerator, denominator = sums[f'{metric}_sum'], sums[f'{metric}_count']
+        # Sin denominador la tasa no está definida
+        return numerator / denominator.where(denominator > 0) * (100 if weighted else 1)
+
+    def rate(self, dims, metric, top_k=None, weighted=True):
+        """
+        Tasa (CTR o conversion_rate) agrupada por las dimensiones pedidas: cociente de las sumas o,
+        con weighted=False, media simple de la tasa de cada fila original.
+        Con top_k, la última dimensión se reduce a sus top_k valores más un grupo "Otros".
+        """
+        return self._rate(self._rollup(dims, top_k), metric, weighted).rename(metric)
+
+    def overall_rate(self, metric, weighted=True):
+        """
+        Tasa sobre todo el dataset (cociente de las sumas o, con weighted=False, media simple por fila)
+        """
+        return self._rate(self.cells.sum().to_frame().T, metric, weighted).iat[0]
+
+    def mean(self, dims, metric, top_k=None):
+        """
+        Media simple de la tasa de cada fila original, agrupada por las dimensiones pedidas
+        """
+        return self.rate(dims, metric, top_k, weighted=False)
+
+    def overall_mean(self, metric):
+        """
+        Media simple de la tasa sobre todas las filas del dataset
+        """
+        return self.overall_rate(metric, weighted=False)
+
+    def summary(self, dims, top_k=None, weighted=True):
+        """
+        Tabla con las sumas y las tasas (ponderadas o, con weighted=False, medias simples) por las dimensiones pedidas
+        """
+        rollup = self._rollup(dims, top_k)
+        result = rollup[self.sum_columns].copy()
+        for col in (self.rate_columns if weighted else self.mean_columns):
+            result[col] = self._rate(rollup, col, weighted)
+        return result
+
+    def top_values(self, dim, k, by='total_users'):
+        """
+        Los k valores de la dimensión con mayor suma de `by`
+        """
+        return self.rollup([dim])[by].nlargest(k).index
+
+    def bucket_top(self, dims, dim, k, by='total_users', other_label=OTHER_LABEL):
+        """
+        Rollup por dims conservando solo los k valores de dim con mayor `by`; el resto se suma en other_label.
+        Mantiene acotado el número de series/filas de los gráficos con fuentes de cola larga.
+        """
+        rollup = self.rollup(dims)
+        if self.rollup([dim]).shape[0] <= k:
+            return rollup
+        top = self.top_values(dim, k, by)
+        frame = rollup.reset_index()
+        frame[dim] = frame[dim].astype(object).where(frame[dim].isin(top), other_label)
+        return frame.groupby(dims, observed=True).sum()
+
+    def pivot(self, index, columns, metric, index_values=None, top_k=None, weighted=True):
+        """
+        Matriz index × columns con la tasa (0 donde no hay datos).
+        index_values limita las filas antes de pivotar, como un filtro previo sobre los datos;
+        top_k agrupa las filas fuera de los top_k en "Otros".
+        """
+        rates = self.rate([columns, index], metric, top_k, weighted)
+        if index_values is not None:
+            rates = rates[rates.index.get_level_values(index).isin(index_values)]
+        return rates.unstack(columns).sort_index().dropna(how='all').dropna(how='all', axis=1).fillna(0)
+
+class DrillIndex:
+    """
+    Índice de filas y agregados por landing_page, fuente y mes para los filtros y el drill-down.
+    Las posiciones de cada grupo (groupby().indices) y las tablas resumen del cubo se calculan una vez
+    por combinación de dimensiones; después cada selección es una búsqueda en un dict o en un índice
+    en lugar de una máscara booleana sobre todo el DataFrame.
+    """
+    DIMS = ['landing_page', 'fuente', 'mes']
+
+    def __init__(self, df, cube=None):
+        self.df = df
+        self.cube = cube or AggregationCube(df)
+        self.dims = [col for col in self.DIMS if col in df.columns]
+        self._positions = {}
+        self._summaries = {}
+        self._values = {}
+
+    def _dims(self, filters, extra=None):
+        unknown = [dim for dim in list(filters) + ([extra] if extra else []) if dim not in self.dims]
+        if unknown:
+            raise KeyError(f"Dimensiones sin índice: {', '.join(unknown)}")
+        # Orden canónico, para que el mismo filtro reutilice siempre el mismo índice
+        return [dim for dim in self.dims if dim in filters]
+
+    def positions(self, **filters):
+        """
+        Posiciones (iloc) de las filas que cumplen los filtros dim=valor, en el orden original
+        """
+        dims = self._dims(filters)
+        if not dims:
+            return np.arange(len(self.df))
+        key = tuple(dims)
+        if key not in self._positions:
+            with profile_stage('índice de drill-down', ' × '.join(key)) as stage:
+                self._positions[key] = self.df.groupby(dims, observed=True, sort=False).indices
+                stage['rows'] = len(self.df)
+        lookup = tuple(filters[dim] for dim in dims)
+        return self._positions[key].get(lookup[0] if len(lookup) == 1 else lookup, np.array([], dtype=np.intp))
+
+    def rows(self, **filters):
+        """
+        Filas que cumplen los filtros (equivale a encadenar df[df[dim] == valor])
+        """
+        return self.df.iloc[self.positions(**filters)]
+
+    def values(self, dim, by=None):
+        """
+        Valores de la dimensión: en orden de aparición o, con by, de mayor a menor suma de esa columna
+        """
+        self._dims({}, dim)
+        key = (dim, by)
+        if key not in self._values:
+            if by is None:
+                self._values[key] = list(self.df[dim].unique())
+            else:
+                self._values[key] = list(self.cube.rollup([dim])[by].sort_values(ascending=False, kind='stable').index)
+        return self._values[key]
+
+    def _summary(self, dims):
+        key = tuple(dims)
+        if key not in self._summaries:
+            self._summaries[key] = self.cube.summary(dims)
+        return self._summaries[key]
+
+    def summary(self, **filters):
+        """
+        Sumas, tasas (cociente de las sumas) y número de filas de la selección, como dict
+        """
+        dims = self._dims(filters)
+        n_rows = len(self.positions(**filters))
+        if not dims:
+            result = {col: self.cube.cells[col].sum() for col in self.cube.sum_columns}
+            result.update({col: self.cube.overall_rate(col) for col in self.cube.rate_columns})
+            result['rows'] = n_rows
+            return result
+        table = self._summary(dims)
+        lookup = tuple(filters[dim] for dim in dims)
+        try:
+            position = table.index.get_loc(lookup[0] if len(lookup) == 1 else lookup)
+        except KeyError:
+            position = None
+        # Columna a columna para no convertir las sumas enteras a float al leer la fila
+        result = {col: (table[col].iat[position] if position is not None else (0 if col in self.cube.sum_columns else np.nan))
+                  for col in table.columns}
+        result['rows'] = n_rows
+        return result
+
+    def breakdown(self, dim, **filters):
+        """
+        Tabla resumen del siguiente nivel del drill-down: una fila por valor de dim dentro de la selección
+        """
+        dims = self._dims(filters, dim)
+        table = self._summary(dims + [dim])
+        if not dims:
+            return table
+        lookup = tuple(filters[d] for d in dims)
+        try:
+            return table.loc[lookup[0] if len(lookup) == 1 else lookup]
+        except KeyError:
+            return table.iloc[0:0].droplevel(list(range(len(dims))))
+
+def table_page(df, page, page_size, sort_by=None, ascending=True):
+    """
+    Página `page` (desde 1) de una tabla, ordenada por sort_by si se indica, sin copiar más que las filas de la página.
+    Las columnas categóricas de la página se pasan a texto para no serializar el diccionario completo.
+    Devuelve (DataFrame de la página, número de página efectivo, número de páginas).
+    """
+    n_pages = max(1, -(-len(df) // page_size))
+    page = min(max(int(page), 1), n_pages)
+    start = (page - 1) * page_size
+    if sort_by is None:
+        positions = np.arange(start, min(start + page_size, len(df)))
+    else:
+        # Orden estable sobre las posiciones (las categóricas se ordenan por su diccionario: meses en orden cronológico)
+        order = df[sort_by].reset_index(drop=True).sort_values(ascending=ascending, kind='stable', na_position='last').index
+        positions = order.to_numpy()[start:start + page_size]
+    result = df.iloc[positions]
+    categorical = {col: object for col in result.columns if isinstance(result[col].dtype, pd.CategoricalDtype)}
+    return (result.astype(categorical) if categorical else result), page, n_pages
+
+def frame_fingerprint(df):
+    """
+    Huella del contenido de un DataFrame (índice incluido) para detectar si cambió entre reruns
+    """
+    hashes = pd.util.hash_pandas_object(df, index=True)
+    return (df.shape, tuple(df.columns), int(hashes.sum()), int((hashes * pd.RangeIndex(1, len(hashes) + 1).to_numpy(dtype='uint64')).sum()))
+
+def as_cube(data):
+    """
+    Acepta un AggregationCube ya construido o un DataFrame a partir del cual construirlo
+    """
+    return data if isinstance(data, AggregationCube) else AggregationCube(data)
+
+def create_consolidated_analysis(df, has_source_analysis, cube=None):
+    """
+    Crea un análisis consolidado por landing page, sumando todas las fuentes
+    """
+    if has_source_analysis:
+        # Consolidar por landing page sumando todas las fuentes
+        cube = cube or AggregationCube(df)
+        with profile_stage('consolidación') as stage:
+            consolidated = cube.rollup(['mes', 'landing_page'])[cube.sum_columns].reset_index()
+            
+            # Calcular CTR (y conversión) consolidados
+            add_rates(consolidated)
+            stage['rows'] = len(consolidated)
+        
+        return consolidated
+    else:
+        # Ya está consolidado si no hay fuente
+        return df
+
+def add_rates(df):
+    """
+    Calcula en la misma pasada las tasas (%) sobre total_users de los recuentos presentes:
+    CTR a partir de cta_clicks y conversion_rate (Conversión Efectiva) a partir de form_submissions
+    """
+    for count_col, rate_col in RATE_COLUMNS.items():
+        if count_col in df.columns:
+            df[rate_col] = (df[count_col] / df[RATE_DENOMINATOR] * 100).round(2)
+    return df
+
+def cap_form_submissions(df):
+    """
+    Acota en el sitio form_submissions a total_users en cada fila: la Conversión Efectiva es una proporción de
+    usuarios y no pasa del 100%. Devuelve las filas acotadas con sus envíos originales, para avisar de ellas.
+    """
+    over = (df['form_submissions'] > df[RATE_DENOMINATOR]).to_numpy()
+    over_users = df.loc[over, [col for col in DIMENSION_COLUMNS + [RATE_DENOMINATOR, 'form_submissions'] if col in df.columns]]
+    over_users = over_users.reset_index(drop=True)
+    if len(over_users):
+        df['form_submissions'] = df['form_submissions'].clip(upper=df[RATE_DENOMINATOR])
+    return over_users
+
+def rate_of_sums(df, metric):
+    """
+    Tasa global (%) de un DataFrame como cociente de las sumas, no como media de las tasas por fila ya redondeadas
+    """
+    denominator = df[RATE_DENOMINATOR].sum()
+    return df[RATE_NUMERATORS[metric]].sum() / denominator * 100 if denominator else np.nan
+
+def mean_of_rates(df, metric):
+    """
+    Media simple (sin ponderar) de la tasa (%) de cada fila, sobre los recuentos sin redondear
+    """
+    denominator = df[RATE_DENOMINATOR]
+    return (df[RATE_NUMERATORS[metric]] / denominator.where(denominator > 0)).mean() * 100
+
+def join_keys(has_source_analysis):
+    """
+    Columnas por las que se unen usuarios, clicks CTA y formularios en el análisis temporal
+    """
+    return ['landing_page', 'mes', 'fuente'] if has_source_analysis else ['landing_page', 'mes']
+
+def composite_key(df, columns):
+    """
+    Clave entera por fila a partir de los códigos de columnas categóricas (una cifra en base mixta por columna).
+    Dos tablas solo tienen claves comparables si comparten las categorías, en el mismo orden.
+    """
+    key = np.zeros(len(df), dtype='int64')
+    for col in columns:
+        # +1 para que el código de los nulos (-1) sea 0 y, como en pandas.merge, un nulo case con otro nulo
+        key = key * (len(df[col].cat.categories) + 1) + (df[col].cat.codes.to_numpy(dtype='int64') + 1)
+    return key
+
+def _key_space(frames, columns):
+    space = 1
+    for col in columns:
+        space *= len(frames[0][col].cat.categories) + 1
+    return space
+
+def _shared_key_dtypes(frames, keys):
+    """
+    Recodifica las tablas con un diccionario compartido si alguna clave no es categórica o sus categorías difieren
+    """
+    shared = all(
+        all(isinstance(df[col].dtype, pd.CategoricalDtype) for df in frames)
+        and all(df[col].cat.categories.equals(frames[0][col].cat.categories) for df in frames[1:])
+        for col in keys
+    )
+    if shared:
+        return list(frames)
+    dtypes = {col: dtype for col, dtype in dimension_dtypes(frames).items() if col in keys}
+    return [apply_dimension_dtypes(df, dtypes) for df in frames]
+
+class KeyJoin:
+    """
+    Left join usuarios × CTA (× formularios) sobre una clave entera compuesta de los códigos categóricos.
+    La clave de usuarios se calcula una sola vez y cada tabla de la derecha se resuelve contra ella en la misma
+    pasada: si cada clave aparece una sola vez en esa tabla (lo normal en un export de GA) el join se reduce a
+    la posición de su fila para cada fila de usuarios, y traer una columna es un lookup alineado; si hay claves
+    repetidas se usa pandas.merge. También registra las claves sin correspondencia de cada lado, que el
+    left join descartaría sin avisar.
+    """
+    def __init__(self, users, cta, keys, forms=None):
+        self.keys = list(keys)
+        right = {'cta': cta} if forms is None else {'cta': cta, 'forms': forms}
+        frames = _shared_key_dtypes([users, *right.values()], self.keys)
+        self.users = frames[0]
+        self.sides = dict(zip(right, frames[1:]))
+        if 'forms' in self.sides:
+            # Los formularios solo aportan sus columnas nuevas (su recuento), no las que ya traen usuarios o CTA
+            taken = set(self.users.columns) | set(self.sides['cta'].columns)
+            forms = self.sides['forms']
+            self.sides['forms'] = forms[self.keys + [col for col in forms.columns if col not in taken]]
+        self.cta = self.sides['cta']
+        self.positions = {}
+        self._users_matched = {}
+        self._side_matched = {}
+        if _key_space([self.users], self.keys) >= 2 ** 63:
+            # La clave compuesta no cabe en int64: se unen las columnas directamente
+            users_index = pd.MultiIndex.from_frame(self.users[self.keys])
+            for name, side in self.sides.items():
+                side_index = pd.MultiIndex.from_frame(side[self.keys])
+                self.positions[name] = None
+                self._users_matched[name] = users_index.isin(side_index)
+                self._side_matched[name] = side_index.isin(users_index)
+            return
+        users_key = composite_key(self.users, self.keys)
+        for name, side in self.sides.items():
+            side_key = pd.Index(composite_key(side, self.keys))
+            positions = side_key.get_indexer(users_key) if side_key.is_unique else None
+            self.positions[name] = positions
+            self._users_matched[name] = positions >= 0 if positions is not None else pd.Index(users_key).isin(side_key)
+            self._side_matched[name] = side_key.isin(users_key)
+
+    def lookup(self, column, fill_value=np.nan, side='cta'):
+        """
+        Valores de una columna de la tabla side ('cta' o 'forms') alineados con las filas de usuarios
+        (fill_value donde no hay correspondencia). Solo disponible si las claves de esa tabla son únicas.
+        """
+        positions = self.positions[side]
+        if positions is None:
+            raise ValueError(f"Hay claves repetidas en {side}: el join no es un lookup alineado")
+        values = self.sides[side][column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            return values.array.take(positions, allow_fill=True)
+        return pd.api.extensions.take(values.to_numpy(), positions, allow_fill=True, fill_value=fill_value)
+
+    def merged(self, fill_values=None):
+        """
+        Mismo resultado que users.merge(cta, on=keys, how='left') (y después .merge(forms, ...));
+        fill_values ({columna: valor}) rellena las filas sin correspondencia sin pasar por NaN
+        """
+        fill_values = fill_values or {}
+        columns = {name: [col for col in side.columns if col not in self.keys] for name, side in self.sides.items()}
+        if any(positions is None for positions in self.positions.values()) or any(col in self.users.columns for col in columns['cta']):
+            # Claves repetidas o columnas con el mismo nombre (merge añadiría sufijos): merge genérico
+            merged = self.users
+            for side in self.sides.values():
+                merged = merged.merge(side, on=self.keys, how='left')
+            return merged.fillna(fill_values) if fill_values else merged
+        return self.users.reset_index(drop=True).assign(**{
+            col: self.lookup(col, fill_values.get(col, np.nan), name) for name, side_columns in columns.items() for col in side_columns
+        })
+
+    def unmatched(self):
+        """
+        Claves sin correspondencia: {'cta': filas de CTA cuya clave no existe en usuarios (sus clicks no entran en el CTR),
+        'users': número de filas de usuarios sin clicks de CTA (quedan con 0 clicks)} y, si hay formularios,
+        'forms': filas de formularios cuya clave no existe en usuarios
+        """
+        result = {name: side[~self._side_matched[name]].reset_index(drop=True) for name, side in self.sides.items()}
+        result['users'] = int((~self._users_matched['cta']).sum())
+        return result
+
+def merge_users_and_cta(users_data, cta_data, has_source_analysis, join=None, forms_data=None, report=None):
+    """
+    Une usuarios, clicks CTA y, si se pasan, formularios por landing page y mes (y fuente si existe) en un único
+    join por clave y calcula el CTR y la Conversión Efectiva en la misma pasada.
+    Se puede pasar un KeyJoin ya construido para reutilizar su clave y su informe de claves sin correspondencia.
+    Con formularios, los envíos se acotan a los usuarios de cada fila (ver cap_form_submissions) y, si se pasa
+    report (el dict de KeyJoin.unmatched), las filas acotadas se añaden en report['forms_over_users'].
+    """
+    with_forms = 'forms' in join.sides if join is not None else forms_data is not None
+    with profile_stage('merge usuarios × CTA × formularios' if with_forms else 'merge usuarios × CTA') as stage:
+        join = join or KeyJoin(users_data, cta_data, join_keys(has_source_analysis), forms_data)
+        counts = [COUNT_COLUMNS[name] for name in join.sides]
+        merged_monthly = join.merged({col: 0 for col in counts})
+        
+        # Rellenar valores nulos
+        for col in counts:
+            merged_monthly[col] = merged_monthly[col].fillna(0).astype(int)
+        if 'forms' in join.sides:
+            over_users = cap_form_submissions(merged_monthly)
+            if report is not None:
+                report['forms_over_users'] = over_users
+        
+        # Calcular CTR y conversión
+        add_rates(merged_monthly)
+        stage['rows'] = len(merged_monthly)
+    return merged_monthly
+
+def _has_data(df):
+    return df is not None and not df.empty
+
+def analyze_monthly_frames(cta_data, users_data, has_source_cta, has_source_users, month_order=None, forms_data=None, has_source_forms=False):
+    """
+    Merge, CTR, conversión y consolidación a partir de los DataFrames mensuales ya leídos (de CSV o del almacén).
+    forms_data es opcional: sin formularios no se calcula la Conversión Efectiva.
+    Devuelve un dict con merged_monthly, consolidated_data, has_source_analysis, los cubos de agregados
+    y las claves sin correspondencia del merge (ver KeyJoin.unmatched), o None si faltan usuarios o clicks CTA.
+    """
+    has_forms = _has_data(forms_data)
+    frames = encode_dimensions([cta_data, users_data] + ([forms_data] if has_forms else []), month_order)
+    cta_data, users_data = frames[:2]
+    forms_data = frames[2] if has_forms else None
+    
+    # Determinar si tenemos datos de fuente
+    has_source_analysis = has_source_cta or has_source_users or (has_forms and has_source_forms)
+    
+    if cta_data.empty or users_data.empty:
+        return None
+
+    join = KeyJoin(users_data, cta_data, join_keys(has_source_analysis), forms_data)
+    unmatched = join.unmatched()
+    merged_monthly = merge_users_and_cta(users_data, cta_data, has_source_analysis, join, report=unmatched)
+    detail_cube = AggregationCube(merged_monthly)
+    consolidated_data = create_consolidated_analysis(merged_monthly, has_source_analysis, detail_cube)
+    return {
+        'merged_monthly': merged_monthly,
+        'consolidated_data': consolidated_data,
+        'has_source_analysis': has_source_analysis,
+        'detail_cube': detail_cube,
+        'consolidated_cube': AggregationCube(consolidated_data),
+        'unmatched': unmatched
+    }
+
+def analyze_monthly_files(monthly_cta_files, monthly_users_files, month_order=None, cache=None, max_workers=None, on_error=None, store=None,
+                          monthly_forms_files=None):
+    """
+    Pipeline completo del análisis temporal: lectura de todos los meses, merge, CTR, conversión (si hay
+    archivos de formularios) y consolidación
+    """
+    files_by_type = {'cta': monthly_cta_files, 'users': monthly_users_files}
+    if monthly_forms_files:
+        files_by_type['forms'] = monthly_forms_files
+    monthly_results = process_all_monthly_data(
+        files_by_type,
+        cache,
+        max_workers,
+        on_error,
+        store
+    )
+    cta_data, has_source_cta = monthly_results['cta']
+    users_data, has_source_users = monthly_results['users']
+    forms_data, has_source_forms = monthly_results.get('forms', (None, False))
+    return analyze_monthly_frames(cta_data, users_data, has_source_cta, has_source_users, month_order, forms_data, has_source_forms)
+
+def analyze_stored_months(store, month_order=None):
+    """
+    Reabre el historial guardado en un DatasetStore sin volver a leer ningún CSV
+    """
+    cta_data, has_source_cta = store.load('cta', month_order)
+    users_data, has_source_users = store.load('users', month_order)
+    forms_data, has_source_forms = store.load('forms', month_order)
+    return analyze_monthly_frames(cta_data, users_data, has_source_cta, has_source_users, month_order, forms_data, has_source_forms)
+
+def file_version(file):
+    """
+    Versión de un archivo subido: el file_id de Streamlit si existe (cambia con cada subida) o el hash del contenido
+    """
+    return getattr(file, 'file_id', None) or file_content_hash(file)
+
+class IncrementalMonthlyAnalysis:
+    """
+    Análisis temporal versionado por mes y tipo de datos, pensado para conservarse entre reruns.
+    Al añadir o reemplazar el archivo de un mes solo se vuelve a leer, unir y agregar ese mes;
+    los demás meses reutilizan su merge y sus celdas del cubo, y el resultado se vuelve a ensamblar.
+    """
+    def __init__(self, month_order=None):
+        self.month_order = month_order
+        self.versions = {}          # (data_type, mes) -> versión del archivo
+        self._frames = {}           # (data_type, mes) -> (month_df, has_source)
+        self._slices = {}           # mes -> (merged, consolidated, celdas detalle, celdas consolidadas, sin correspondencia)
+        self._has_source_analysis = None
+        self._layout = None
+        self._result = None
+        self.last_changed = []
+
+    def update(self, monthly_cta_files, monthly_users_files, cache=None, max_workers=None, on_error=None, store=None,
+               monthly_forms_files=None):
+        """
+        Sincroniza el análisis con los archivos actuales y devuelve el mismo dict que analyze_monthly_files
+        """
+        files_by_type = {'cta': monthly_cta_files, 'users': monthly_users_files, 'forms': monthly_forms_files or {}}
+        current = {
+            (data_type, month_name): file_version(file)
+            for data_type, monthly_files in files_by_type.items()
+            for month_name, file in monthly_files.items()
+            if file is not None
+        }
+        changed = [key for key, version in current.items() if self.versions.get(key) != version]
+        removed = [key for key in self.versions if key not in current]
+        month_names = list(dict.fromkeys(list(monthly_users_files) + list(monthly_cta_files) + list(files_by_type['forms'])))
+        changed_months = {month_name for _, month_name in changed + removed}
+        self.last_changed = [m for m in month_names if m in changed_months]
+        if not changed and not removed and self._result is not None:
+            return self._result
+
+        to_load = {data_type: {} for data_type in files_by_type}
+        for data_type, month_name in changed:
+            to_load[data_type][month_name] = files_by_type[data_type][month_name]
+        loaded = load_monthly_frames(to_load, cache, max_workers, on_error, store)
+        for key in changed + removed:
+            if key in loaded:
+                self._frames[key] = loaded[key]
+                self.versions[key] = current[key]
+            else:
+                # Quitado o con error: sin versión, para volver a intentarlo en el próximo rerun
+                self._frames.pop(key, None)
+                self.versions.pop(key, None)
+
+        has_source_analysis = any(has_source for _, has_source in self._frames.values())
+        cta_template = self._template('cta')
+        forms_template = self._template('forms')
+        layout = tuple([has_source_analysis] + [None if t is None else tuple(t.columns) for t in (cta_template, forms_template)])
+        if layout != self._layout:
+            # Cambian las claves del merge o las columnas de CTA o de formularios: hay que rehacer todos los meses
+            affected = {month_name for _, month_name in self._frames} | changed_months
+            self._slices.clear()
+        else:
+            affected = changed_months
+        self._layout = layout
+        self._has_source_analysis = has_source_analysis
+
+        for month_name in affected:
+            self._slices.pop(month_name, None)
+            users = self._frames.get(('users', month_name), (None, False))[0]
+            if users is None or cta_template is None:
+                continue
+            cta = self._frames.get(('cta', month_name), (None, False))[0]
+            forms = self._frames.get(('forms', month_name), (None, False))[0]
+            self._slices[month_name] = self._analyze_month(
+                month_name, users, cta if cta is not None else cta_template, forms if forms is not None else forms_template)
+
+        self._result = self._assemble(list(monthly_users_files))
+        return self._result
+
+    def _template(self, template_type):
+        """
+        DataFrame vacío con las columnas de CTA o de formularios, para los meses sin ese archivo
+        (None si no hay ningún archivo de ese tipo)
+        """
+        for (data_type, _), (month_df, _) in self._frames.items():
+            if data_type == template_type and month_df is not None:
+                return month_df.iloc[0:0]
+        return None
+
+    def _analyze_month(self, month_name, users, cta, forms=None):
+        return analyze_month_slice(month_name, users, cta, self._has_source_analysis, forms)
+
+    def _assemble(self, month_names):
+        return assemble_month_slices([self._slices[m] for m in month_names if m in self._slices],
+                                     self._has_source_analysis, self.month_order)
+
+def analyze_month_slice(month_name, users, cta, has_source_analysis, forms=None):
+    """
+    Merge, CTR (y conversión si se pasan formularios) y celdas del cubo de un solo mes:
+    (merged, consolidated, celdas detalle, celdas consolidadas, claves sin correspondencia)
+    """
+    with profile_stage('análisis del mes', month_name):
+        # Diccionario propio del mes para unir y agregar sobre códigos enteros;
+        # assemble_month_slices lo recodifica después con el diccionario compartido
+        frames = [cta, users] + ([forms] if forms is not None else [])
+        cta, users, *forms = encode_dimensions([df.assign(mes=month_name) for df in frames])
+        join = KeyJoin(users, cta, join_keys(has_source_analysis), forms[0] if forms else None)
+        unmatched = join.unmatched()
+        merged = merge_users_and_cta(users, cta, has_source_analysis, join, report=unmatched)
+        detail_cells = AggregationCube(merged).cells
+        consolidated = create_consolidated_analysis(merged, has_source_analysis, AggregationCube.from_cells(detail_cells))
+        consolidated_cells = AggregationCube(consolidated).cells if has_source_analysis else detail_cells
+    return merged, consolidated, detail_cells, consolidated_cells, unmatched
+
+def assemble_month_slices(slices, has_source_analysis, month_order=None):
+    """
+    Concatena los meses en orden y vuelve a codificar las dimensiones con un diccionario compartido.
+    Devuelve el mismo dict que analyze_monthly_frames, o None si no hay ningún mes.
+    """
+    if not slices:
+        return None
+    with profile_stage('ensamblado de meses') as stage:
+        # Se codifica cada mes antes de concatenar para no duplicar el historial como texto
+        dtypes = dimension_dtypes([s[0] for s in slices], month_order)
+        merged_monthly = pd.concat([apply_dimension_dtypes(s[0], dtypes) for s in slices], ignore_index=True)
+        detail_cube = AggregationCube.from_cells(_concat_cells([s[2] for s in slices], dtypes))
+        if has_source_analysis:
+            consolidated_data = pd.concat([apply_dimension_dtypes(s[1], dtypes) for s in slices], ignore_index=True)
+            consolidated_cube = AggregationCube.from_cells(_concat_cells([s[3] for s in slices], dtypes))
+        else:
+            consolidated_data = merged_monthly
+            consolidated_cube = detail_cube
+        # Diccionario propio: las páginas de CTA (o formularios) sin usuarios no están en el de merged_monthly.
+        # Los meses sin formularios no tienen sus entradas
+        sides = list(dict.fromkeys(side for s in slices for side in s[4] if side != 'users'))
+        unmatched = {
+            side: pd.concat(encode_dimensions([s[4][side] for s in slices if side in s[4]], month_order), ignore_index=True)
+            for side in sides
+        }
+        unmatched['users'] = sum(s[4]['users'] for s in slices)
+        stage['rows'] = len(merged_monthly)
+    return {
+        'merged_monthly': merged_monthly,
+        'consolidated_data': consolidated_data,
+        'has_source_analysis': has_source_analysis,
+        'detail_cube': detail_cube,
+        'consolidated_cube': consolidated_cube,
+        'unmatched': unmatched
+    }
+
+def _concat_cells(cells, dtypes):
+    dims = list(cells[0].index.names)
+    combined = pd.concat([apply_dimension_dtypes(c.reset_index(), dtypes) for c in cells], ignore_index=True)
+    return combined.set_index(dims)
+
+def _sum_by_keys(month_df):
+    """
+    Suma la métrica por (fuente, landing_page) categóricas conservando el orden de primera aparición.
+    Se agrupa por los códigos enteros: con claves categóricas, sort=False seguiría el orden del diccionario.
+    """
+    codes = [month_df[col].cat.codes.rename(col) for col in KEY_COLUMNS]
+    summed = month_df.drop(columns=KEY_COLUMNS).groupby(codes, sort=False).sum()
+    result = pd.DataFrame({
+        col: pd.Categorical.from_codes(summed.index.get_level_values(col), dtype=month_df[col].dtype)
+        for col in KEY_COLUMNS
+    })
+    for col in summed.columns:
+        result[col] = summed[col].to_numpy()
+    return result
+
+def _combine_partials(partials):
+    """
+    Combina sumas parciales con claves categóricas uniendo sus diccionarios, sin pasar las claves a texto
+    """
+    if len(partials) == 1:
+        return partials[0]
+    combined = pd.DataFrame({
+        col: union_categoricals([p[col] for p in partials]) if col in KEY_COLUMNS
+        else pd.concat([p[col] for p in partials], ignore_index=True)
+        for col in partials[0].columns
+    })
+    return _sum_by_keys(combined)
+
+def aggregate_monthly_file(file, data_type, chunk_rows=None, compact_bytes=None):
+    """
+    Lee un archivo mensual por bloques y lo reduce a sumas parciales por (fuente, landing_page) con claves
+    categóricas, sin materializar el archivo completo. Los parciales de los bloques se compactan cuando
+    ocupan más de compact_bytes. Devuelve (DataFrame con las columnas de normalize_monthly_file o None, has_source).
+    """
+    with profile_stage('agregación por bloques', getattr(file, 'name', None)) as stage:
+        partials = []
+        pending_bytes = 0
+        has_source = False
+        columns = None
+        for chunk, has_source in iter_ga_chunks(file, chunk_rows or INGEST_CONFIG['chunk_rows']):
+            month_df = normalize_ga_frame(chunk, has_source, data_type)
+            if month_df is None:
+                return None, has_source
+            columns = list(month_df.columns)
+            with profile_stage('suma parcial por claves', data_type):
+                partial = _sum_by_keys(month_df.astype({col: 'category' for col in KEY_COLUMNS}))
+            partials.append(partial)
+            pending_bytes += int(partial.memory_usage(deep=True).sum())
+            if compact_bytes and pending_bytes > compact_bytes and len(partials) > 1:
+                with profile_stage('compactación de parciales', data_type):
+                    partials = [_combine_partials(partials)]
+                pending_bytes = int(partials[0].memory_usage(deep=True).sum())
+                # Umbral creciente: compactar de nuevo solo cuando lo pendiente duplique lo ya compactado
+                compact_bytes = max(compact_bytes, 2 * pending_bytes)
+        month_df = _combine_partials(partials)[columns]
+        stage['rows'] = len(month_df)
+    return month_df, has_source
+
+class _PartialStore:
+    """
+    Agregados parciales por (data_type, mes): se mantienen en memoria hasta budget_bytes y el resto se vuelca a disco
+    """
+    def __init__(self, budget_bytes, spill_dir):
+        self.budget_bytes = budget_bytes
+        self.spill_dir = spill_dir
+        self.resident_bytes = 0
+        self.spilled = 0
+        self._entries = {}
+
+    def put(self, key, month_df):
+        nbytes = int(month_df.memory_usage(deep=True).sum())
+        if self.resident_bytes + nbytes <= self.budget_bytes:
+            self._entries[key] = month_df
+            self.resident_bytes += nbytes
+            return
+        path = os.path.join(self.spill_dir, f"{key[0]}_{len(self._entries)}.pkl")
+        month_df.to_pickle(path)
+        self._entries[key] = path
+        self.spilled += 1
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        return pd.read_pickle(entry) if isinstance(entry, str) else entry
+
+    def pop(self, key):
+        month_df = self.get(key)
+        entry = self._entries.pop(key, None)
+        if isinstance(entry, str):
+            os.remove(entry)
+        elif entry is not None:
+            self.resident_bytes -= int(entry.memory_usage(deep=True).sum())
+        return month_df
+
+    def first(self, data_type):
+        return next((self.get(key) for key in self._entries if key[0] == data_type), None)
+
+def analyze_monthly_files_out_of_core(monthly_cta_files, monthly_users_files, month_order=None, memory_limit_mb=None, on_error=None, spill_dir=None,
+                                      monthly_forms_files=None):
+    """
+    Análisis temporal con memoria acotada para exports muy grandes. Cada archivo se lee por bloques y se
+    reduce a sumas parciales por (fuente, landing_page); los parciales que no caben en el techo de memoria
+    se vuelcan a disco y el merge, el CTR y los cubos se calculan mes a mes en lugar de sobre todo el historial.
+    Devuelve el mismo dict que analyze_monthly_files.
+    """
+    on_error = on_error or _log_month_error
+    limit_bytes = (memory_limit_mb or OUT_OF_CORE_CONFIG['memory_limit_mb']) * 1024 * 1024
+    # Un cuarto del techo para el bloque en lectura y sus parciales, la mitad para los agregados por mes
+    chunk_rows = max(1000, limit_bytes // 4 // OUT_OF_CORE_CONFIG['row_bytes_estimate'])
+    files_by_type = {'cta': monthly_cta_files, 'users': monthly_users_files, 'forms': monthly_forms_files or {}}
+
+    with tempfile.TemporaryDirectory(dir=spill_dir or OUT_OF_CORE_CONFIG['spill_dir']) as tmp_dir:
+        partials = _PartialStore(limit_bytes // 2, tmp_dir)
+        has_source_analysis = False
+        for data_type, monthly_files in files_by_type.items():
+            for month_name, file in monthly_files.items():
+                if file is None:
+                    continue
+                try:
+                    month_df, has_source = aggregate_monthly_file(file, data_type, chunk_rows, limit_bytes // 8)
+                except Exception as e:
+                    on_error(month_name, e)
+                    continue
+                has_source_analysis = has_source_analysis or has_source
+                if month_df is not None:
+                    partials.put((data_type, month_name), month_df)
+        if partials.spilled:
+            logger.info("Modo out-of-core: %d agregados parciales volcados a disco", partials.spilled)
+
+        cta_template = partials.first('cta')
+        if cta_template is None:
+            return None
+        cta_template = cta_template.iloc[0:0]
+        forms_template = partials.first('forms')
+        forms_template = forms_template.iloc[0:0] if forms_template is not None else None
+        slices = []
+        for month_name in monthly_users_files:
+            # Cada mes se libera en cuanto se ha unido
+            users = partials.pop(('users', month_name))
+            cta = partials.pop(('cta', month_name))
+            forms = partials.pop(('forms', month_name))
+            if users is None:
+                continue
+            slices.append(analyze_month_slice(month_name, users, cta if cta is not None else cta_template, has_source_analysis,
+                                              forms if forms is not None else forms_template))
+    return assemble_month_slices(slices, has_source_analysis, month_order)
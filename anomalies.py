@@ -0,0 +1,125 @@
+"""
+Detección de anomalías en las series mensuales de CTR (o Conversión Efectiva) de cada landing page y fuente.
+
+Las celdas del cubo de detalle se colocan en una matriz series × meses y cada mes se compara con la ventana
+de meses anteriores de su propia serie (mediana y MAD, o media y desviación típica), para todas las series a
+la vez con operaciones de NumPy. La escala nunca es menor que el ruido de muestreo de la tasa con los usuarios
+del mes, así que una página pequeña no genera alertas solo por azar. El coste crece con series × meses
+× ventana, sin bucles en Python por serie: cientos de miles de series se evalúan en segundos.
+"""
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from analytics_core import RATE_DENOMINATOR, RATE_NUMERATORS, composite_key
+from app_config import ANOMALY_CONFIG
+from profiling import profile_stage
+
+# Factor que convierte la MAD en una estimación de la desviación típica con datos normales
+MAD_SCALE = 1.4826
+
+ANOMALY_METHODS = ['mad', 'zscore']
+
+def _codes(values, sort=False):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    return pd.factorize(values, sort=sort)
+
+def _window_median(windows, valid):
+    # Mediana de la última dimensión ignorando NaN: al ordenar, los NaN quedan al final
+    ordered = np.sort(windows, axis=-1)
+    low = np.take_along_axis(ordered, np.maximum((valid - 1) // 2, 0)[..., None], axis=-1)[..., 0]
+    high = np.take_along_axis(ordered, np.maximum(valid // 2, 0)[..., None], axis=-1)[..., 0]
+    return np.where(valid > 0, (low + high) / 2, np.nan)
+
+def _trailing_windows(matrix, window):
+    # Ventana de los `window` meses anteriores de cada mes (sin incluirlo), con NaN antes del primer mes
+    padded = np.concatenate([np.full((matrix.shape[0], window), np.nan), matrix], axis=1)
+    return sliding_window_view(padded, window, axis=1)[:, :matrix.shape[1], :]
+
+def _baseline(windows, method):
+    """
+    Referencia y escala de cada (serie, mes) a partir de su ventana de meses anteriores
+    """
+    valid = np.sum(~np.isnan(windows), axis=-1)
+    if method == 'mad':
+        center = _window_median(windows, valid)
+        scale = MAD_SCALE * _window_median(np.abs(windows - center[..., None]), valid)
+    else:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            center = np.nansum(windows, axis=-1) / valid
+            scale = np.sqrt(np.nansum((windows - center[..., None]) ** 2, axis=-1) / (valid - 1))
+    return center, scale, valid
+
+def series_matrix(cube, metric):
+    """
+    Matriz series × meses de numeradores y denominadores de la tasa a partir de las celdas del cubo.
+    Devuelve (numeradores, denominadores, DataFrame con las dimensiones de cada serie, meses);
+    las celdas sin datos quedan en NaN.
+    """
+    if 'mes' not in cube.dims:
+        raise ValueError("La detección de anomalías necesita la dimensión mes")
+    series_dims = [dim for dim in cube.dims if dim != 'mes']
+    frame = cube.cells[[RATE_NUMERATORS[metric], RATE_DENOMINATOR]].reset_index()
+    # Meses en orden cronológico: el diccionario compartido ya lo está y los periodos 'YYYY-MM' también al ordenarlos
+    month_codes, months = _codes(frame['mes'], sort=True)
+    # Cada serie se identifica por la clave entera de sus dimensiones, sin construir tuplas
+    frame = frame.astype({dim: 'category' for dim in series_dims if not isinstance(frame[dim].dtype, pd.CategoricalDtype)})
+    series_codes, _ = pd.factorize(composite_key(frame, series_dims))
+    # Primera fila de cada serie, para recuperar sus dimensiones
+    first_rows = np.empty(series_codes.max() + 1 if len(series_codes) else 0, dtype='int64')
+    first_rows[series_codes[::-1]] = np.arange(len(series_codes))[::-1]
+    series_keys = frame[series_dims].iloc[first_rows].reset_index(drop=True)
+    shape = (len(series_keys), len(months))
+    numerators, denominators = np.full(shape, np.nan), np.full(shape, np.nan)
+    numerators[series_codes, month_codes] = frame[RATE_NUMERATORS[metric]].to_numpy(dtype=float)
+    denominators[series_codes, month_codes] = frame[RATE_DENOMINATOR].to_numpy(dtype=float)
+    return numerators, denominators, series_keys, months
+
+def detect_anomalies(cube, metric='CTR', method=None, window=None, min_history=None, threshold=None, min_users=None):
+    """
+    Tabla de alertas (una fila por serie y mes anómalos) ordenada de mayor a menor puntuación absoluta, con las
+    dimensiones de la serie, el mes, la tasa del mes, su referencia, el cambio en puntos porcentuales,
+    la puntuación, los usuarios del mes y la dirección ('caída' o 'subida').
+    Los parámetros que no se indican se toman de ANOMALY_CONFIG.
+    """
+    method = method or ANOMALY_CONFIG['method']
+    if method not in ANOMALY_METHODS:
+        raise ValueError(f"Método de detección desconocido: {method}")
+    window = window or ANOMALY_CONFIG['window']
+    min_history = min_history or ANOMALY_CONFIG['min_history']
+    threshold = threshold or ANOMALY_CONFIG['threshold']
+    min_users = ANOMALY_CONFIG['min_users'] if min_users is None else min_users
+
+    with profile_stage('detección de anomalías', metric) as stage:
+        numerators, denominators, series_keys, months = series_matrix(cube, metric)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rates = np.where(denominators > 0, numerators / denominators * 100, np.nan)
+        center, scale, history = _baseline(_trailing_windows(rates, window), method)
+
+        # Ruido de muestreo de la tasa con los usuarios del mes, con la proporción conjunta de la ventana
+        # (cociente de las sumas, con suavizado de Laplace para ventanas de 0% o 100%)
+        users = np.nan_to_num(denominators)
+        window_successes = np.nansum(_trailing_windows(np.fmin(numerators, denominators), window), axis=-1)
+        window_trials = np.nansum(_trailing_windows(denominators, window), axis=-1)
+        proportion = (window_successes + 0.5) / (window_trials + 1)
+        sampling = np.sqrt(proportion * (1 - proportion) / np.maximum(users, 1)) * 100
+        scale = np.fmax(scale, sampling)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            score = (rates - center) / scale
+
+        alerts = (history >= min_history) & (users >= min_users) & (np.abs(score) >= threshold)
+        series_positions, month_positions = np.nonzero(alerts)
+        order = np.argsort(-np.abs(score[series_positions, month_positions]), kind='stable')
+        series_positions, month_positions = series_positions[order], month_positions[order]
+
+        result = series_keys.iloc[series_positions].reset_index(drop=True)
+        result.insert(0, 'mes', months.take(month_positions))
+        result[metric] = rates[series_positions, month_positions]
+        result['baseline'] = center[series_positions, month_positions]
+        result['change'] = result[metric] - result['baseline']
+        result['score'] = score[series_positions, month_positions]
+        result[RATE_DENOMINATOR] = users[series_positions, month_positions].astype(int)
+        result['direction'] = np.where(result['score'] < 0, 'caída', 'subida')
+        stage['rows'] = rates.shape[0]
+    return result
@@ -1,10 +1,39 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
 import calendar
 
+from app_config import ANOMALY_CONFIG, CACHE_CONFIG, CHART_CONFIG, OUT_OF_CORE_CONFIG, SIGNIFICANCE_CONFIG, STORE_CONFIG, TABLE_CONFIG
+from analytics_core import (
+    AggregationCube,
+    DrillIndex,
+    IncrementalMonthlyAnalysis,
+    KeyJoin,
+    ParseCache,
+    add_rates,
+    analyze_monthly_files_out_of_core,
+    analyze_stored_months,
+    as_cube,
+    cap_form_submissions,
+    encode_dimensions,
+    file_version,
+    mean_of_rates,
+    frame_fingerprint,
+    load_monthly_file,
+    rate_of_sums,
+    table_page
+)
+from anomalies import detect_anomalies
+from bulk_upload import TYPE_LABELS, classify_files, iter_upload_files
+from dataset_store import DatasetStore
+from exports import EXPORT_FORMATS, available_formats, export_bytes, export_file_name
+from periods import period_axis, period_display
+from profiling import StageProfiler, profile_stage
+from significance import add_rate_intervals, compare_rows, compare_to_rest, is_significant, top_rates
+
 # Configuración de la página
 st.set_page_config(
     page_title="Analizador de CTR - Google Analytics",
@@ -52,168 +81,317 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
-def read_csv_with_header_detection_and_clean(file):
-    """
-    Lee un CSV detectando automáticamente la fila donde empiezan los encabezados y filtra solo filas válidas.
-    Maneja tanto formato de 2 columnas (page_path, valor) como 3 columnas (fuente, page_path, valor).
-    """
-    import io
-    import csv
-    lines = file.getvalue().decode('utf-8').splitlines()
-    header_row = None
-    for i, line in enumerate(lines):
-        # Busca la fila que contiene los nombres de columnas típicos
-        if (
-            ('page_path' in line.lower() or 'pagina' in line.lower() or 'url' in line.lower() or 'ruta' in line.lower())
-            and (',' in line or ';' in line)
-        ):
-            header_row = i
-            break
-    if header_row is None:
-        raise ValueError("No se encontró la fila de encabezados en el archivo CSV. Asegúrate de que exista una fila con los nombres de las columnas.")
-    
-    # Detectar delimitador
-    delimiter = ',' if lines[header_row].count(',') >= lines[header_row].count(';') else ';'
-    
-    # Obtener nombres de columnas del encabezado
-    header = [h.strip().lower() for h in lines[header_row].split(delimiter)]
-    
-    # Determinar si es formato de 2 o 3 columnas
-    has_source = len(header) >= 3 and any(col in header for col in ['fuente', 'fuente de la sesión', 'source', 'canal', 'channel', 'medium'])
+@st.cache_resource
+def get_parse_cache():
+    """
+    Devuelve la caché de lectura compartida entre reruns y sesiones
+    """
+    return ParseCache(CACHE_CONFIG['parse_cache_max_mb'] * 1024 * 1024)
+
+@st.cache_resource
+def get_dataset_store():
+    """
+    Devuelve el almacén Parquet de meses normalizados, o None si está desactivado o falta pyarrow
+    """
+    if not STORE_CONFIG['enabled']:
+        return None
+    try:
+        return DatasetStore(STORE_CONFIG['path'])
+    except ImportError as e:
+        st.warning(f"⚠️ Almacén de datos desactivado: {e}")
+        return None
+
+def report_month_error(month_name, error):
+    st.error(f"Error procesando archivo de {period_display(month_name)}: {error}")
+
+def expand_uploads(uploads):
+    """
+    Expande los ZIP subidos; los miembros se guardan en la sesión para no descomprimir en cada rerun
+    """
+    previous = st.session_state.get('expanded_uploads', {})
+    expanded = {}
+    files = []
+    for upload in uploads or []:
+        if not upload.name.lower().endswith('.zip'):
+            files.append(upload)
+            continue
+        key = getattr(upload, 'file_id', None) or upload.name
+        expanded[key] = previous[key] if key in previous else list(iter_upload_files([upload]))
+        files.extend(expanded[key])
+    # Solo se conservan los ZIP que siguen subidos
+    st.session_state['expanded_uploads'] = expanded
+    return files
+
+def classify_uploads(bulk_uploads, cta_uploads, users_uploads, default_year, forms_uploads=None):
+    """
+    Clasifica por tipo y periodo la carga masiva y los uploaders por tipo, y avisa de los archivos ignorados
+    """
+    files_by_type, skipped = classify_files(expand_uploads(bulk_uploads), default_year)
+    for data_type, uploads in (('cta', cta_uploads), ('users', users_uploads), ('forms', forms_uploads)):
+        files_by_type, typed_skipped = classify_files(uploads or [], default_year, data_type, files_by_type)
+        skipped += typed_skipped
+    for name, reason in skipped:
+        st.warning(f"⚠️ Se ignora '{name}': {reason}")
     
-    # Leer solo las filas válidas (ignorando totales y vacíos)
-    data = []
-    reader = csv.reader(lines[header_row+1:], delimiter=delimiter)
-    for row in reader:
-        if has_source:
-            # Formato de 3 columnas: fuente, page_path, valor
-            if len(row) < 3:
-                continue
-            source, page, value = row[0].strip(), row[1].strip(), row[2].strip()
-            # Ignorar filas vacías, totales o encabezados
-            if not page or page.lower() == 'total' or page.lower() == 'totales' or page == '':
-                continue
-            if value.lower() == 'total' or value.lower() == 'totales':
-                continue
-            data.append([source, page, value])
-        else:
-            # Formato de 2 columnas: page_path, valor
-            if len(row) < 2:
-                continue
-            page, value = row[0].strip(), row[1].strip()
-            # Ignorar filas vacías, totales o encabezados
-            if not page or page.lower() == 'total' or page.lower() == 'totales' or page == '':
-                continue
-            if value.lower() == 'total' or value.lower() == 'totales':
-                continue
-            data.append([page, value])
+    if bulk_uploads:
+        with st.expander("📦 Clasificación de los archivos subidos"):
+            st.dataframe(pd.DataFrame(
+                [(period_display(period), TYPE_LABELS[data_type], file.name)
+                 for data_type, periods in files_by_type.items() for period, file in periods.items()],
+                columns=['Mes', 'Tipo', 'Archivo']
+            ), use_container_width=True)
+    return files_by_type
+
+def upload_size_mb(*monthly_files):
+    return sum(file.size for files in monthly_files for file in files.values() if file is not None) / 1024 / 1024
+
+def analyze_out_of_core(monthly_cta_files, monthly_users_files, monthly_forms_files=None):
+    """
+    Análisis con memoria acotada; el resultado se guarda en la sesión mientras no cambien los archivos
+    """
+    versions = tuple(
+        (data_type, month_name, file_version(file))
+        for data_type, files in (('cta', monthly_cta_files), ('users', monthly_users_files), ('forms', monthly_forms_files or {}))
+        for month_name, file in files.items()
+    )
+    cached = st.session_state.get('out_of_core_analysis')
+    if cached is not None and cached[0] == versions:
+        return cached[1]
+    analysis = analyze_monthly_files_out_of_core(monthly_cta_files, monthly_users_files, on_error=report_month_error,
+                                                 monthly_forms_files=monthly_forms_files)
+    st.session_state['out_of_core_analysis'] = (versions, analysis)
+    return analysis
+
+def show_unmatched_keys(unmatched, key_label):
+    """
+    Avisa de las claves del merge sin correspondencia: clicks de CTA que no entran en el CTR
+    y filas de usuarios sin clicks registrados, y de las filas con más formularios que usuarios
+    """
+    unmatched_cta = unmatched['cta']
+    if len(unmatched_cta):
+        lost_clicks = unmatched_cta['cta_clicks'].sum()
+        st.warning(f"⚠️ {len(unmatched_cta):,} filas de clicks CTA ({lost_clicks:,.0f} clicks) no tienen {key_label} "
+                   f"equivalente en el archivo de usuarios y no entran en el CTR.")
+        with st.expander("🔗 Filas de clicks CTA sin correspondencia en usuarios"):
+            display_df = unmatched_cta.sort_values('cta_clicks', ascending=False).rename(
+                columns={'mes': 'Mes', 'fuente': 'Fuente', 'landing_page': 'Landing Page', 'cta_clicks': 'Clicks CTA'})
+            st.dataframe(display_df, use_container_width=True, hide_index=True)
+    if unmatched['users']:
+        st.caption(f"🔗 {unmatched['users']:,} filas de usuarios no tienen clicks CTA registrados (CTR 0).")
+    unmatched_forms = unmatched.get('forms')
+    if unmatched_forms is not None and len(unmatched_forms):
+        st.warning(f"⚠️ {len(unmatched_forms):,} filas de formularios ({unmatched_forms['form_submissions'].sum():,.0f} envíos) "
+                   f"no tienen {key_label} equivalente en el archivo de usuarios y no entran en la Conversión Efectiva.")
+        with st.expander("🔗 Filas de formularios sin correspondencia en usuarios"):
+            display_df = unmatched_forms.sort_values('form_submissions', ascending=False).rename(
+                columns={'mes': 'Mes', 'fuente': 'Fuente', 'landing_page': 'Landing Page', 'form_submissions': 'Formularios'})
+            st.dataframe(display_df, use_container_width=True, hide_index=True)
+    forms_over_users = unmatched.get('forms_over_users')
+    if forms_over_users is not None and len(forms_over_users):
+        st.warning(f"⚠️ {len(forms_over_users):,} filas tienen más formularios que usuarios; "
+                   f"su Conversión Efectiva se acota al 100%.")
+        with st.expander("🔗 Filas con más formularios que usuarios"):
+            display_df = forms_over_users.sort_values('form_submissions', ascending=False).rename(
+                columns={'mes': 'Mes', 'fuente': 'Fuente', 'landing_page': 'Landing Page',
+                         'total_users': 'Total Usuarios', 'form_submissions': 'Formularios'})
+            st.dataframe(display_df, use_container_width=True, hide_index=True)
+
+# Columnas de las tablas de detalle y su formato (printf de st.column_config.NumberColumn)
+DETAIL_COLUMNS = {
+    'mes': 'Mes',
+    'fuente': 'Fuente',
+    'landing_page': 'Landing Page',
+    'total_users': 'Total Usuarios',
+    'cta_clicks': 'Clicks CTA',
+    'form_submissions': 'Formularios',
+    'CTR': 'CTR (%)',
+    'conversion_rate': 'Conversión Efectiva (%)',
+    'baseline': 'Referencia (%)',
+    'change': 'Cambio (pp)',
+    'score': 'Puntuación',
+    'direction': 'Dirección'
+}
+DETAIL_FORMATS = {
+    'Total Usuarios': '%d',
+    'Clicks CTA': '%d',
+    'Formularios': '%d',
+    'CTR (%)': '%.2f%%',
+    'Conversión Efectiva (%)': '%.2f%%',
+    'Referencia (%)': '%.2f%%',
+    'Cambio (pp)': '%+.2f',
+    'Puntuación': '%+.1f'
+}
+
+def metric_columns(df):
+    """
+    Recuentos y tasas presentes en df, en el orden de las tablas de detalle (formularios y conversión solo si se cargaron)
+    """
+    return [col for col in ['total_users', 'cta_clicks', 'form_submissions', 'CTR', 'conversion_rate'] if col in df.columns]
+
+def paginated_table(df, key, columns):
+    """
+    Tabla de detalle paginada y ordenable en el servidor: solo la página visible se envía al navegador,
+    con los números como números y el formato de columna de st.dataframe en lugar de un Styler sobre toda la tabla.
+    columns son las columnas de df que se muestran, con las etiquetas de DETAIL_COLUMNS.
+    """
+    labels = {col: DETAIL_COLUMNS[col] for col in columns}
+    col_sort, col_order, col_size, col_page = st.columns([3, 2, 2, 2])
+    with col_sort:
+        sort_label = st.selectbox("Ordenar por", ['(orden original)'] + list(labels.values()), key=f"{key}_sort")
+    with col_order:
+        ascending = st.radio("Orden", ['Descendente', 'Ascendente'], horizontal=True, key=f"{key}_order") == 'Ascendente'
+    with col_size:
+        options = TABLE_CONFIG['page_size_options']
+        page_size = st.selectbox("Filas por página", options, index=options.index(TABLE_CONFIG['page_size']), key=f"{key}_size")
     
-    # Crear DataFrame con las columnas correctas
-    if has_source:
-        df = pd.DataFrame(data, columns=header[:3])
-    else:
-        df = pd.DataFrame(data, columns=header[:2])
+    n_pages = max(1, -(-len(df) // page_size))
+    page_key = f"{key}_page"
+    # Si el filtro deja menos páginas, volver a la última en lugar de fallar
+    if st.session_state.get(page_key, 1) > n_pages:
+        st.session_state[page_key] = n_pages
+    with col_page:
+        page = st.number_input(f"Página (de {n_pages:,})", min_value=1, max_value=n_pages, step=1, key=page_key)
     
-    return df, has_source
+    sort_by = next((col for col, label in labels.items() if label == sort_label), None)
+    with profile_stage('tabla paginada', key) as stage:
+        page_df, page, _ = table_page(df, page, page_size, sort_by, ascending)
+        page_df = page_df[columns].rename(columns=labels)
+        stage['rows'] = len(page_df)
+    st.dataframe(
+        page_df,
+        use_container_width=True,
+        hide_index=True,
+        column_config={label: st.column_config.NumberColumn(label, format=fmt) for label, fmt in DETAIL_FORMATS.items() if label in page_df.columns}
+    )
+    start = (page - 1) * page_size
+    st.caption(f"Filas {min(start + 1, len(df)):,}–{start + len(page_df):,} de {len(df):,}")
 
-def clean_column(df, col):
-    # Elimina espacios, convierte a string y a minúsculas
-    return df[col].astype(str).str.strip().str.lower()
+def drill_index(name, df, cube):
+    """
+    Índice de drill-down guardado en la sesión mientras no cambien los datos del cubo:
+    los grupos se calculan una vez y cada selección posterior es una búsqueda
+    """
+    indexes = st.session_state.setdefault('drill_indexes', {})
+    fingerprint = (cube.fingerprint(), len(df))
+    cached = indexes.get(name)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    index = DrillIndex(df, cube)
+    indexes[name] = (fingerprint, index)
+    return index
 
-def find_column(df, options):
-    for col in df.columns:
-        if col in options:
-            return col
-    return None
+def anomaly_alerts(cube, metric):
+    """
+    Alertas de anomalías de la métrica guardadas en la sesión mientras no cambien los datos del cubo:
+    se calculan una vez por cada análisis nuevo, no en cada rerun
+    """
+    alerts = st.session_state.setdefault('anomaly_alerts', {})
+    fingerprint = cube.fingerprint()
+    cached = alerts.get(metric)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    result = detect_anomalies(cube, metric)
+    alerts[metric] = (fingerprint, result)
+    return result
 
-def process_monthly_data(monthly_files, data_type):
+def breakdown_table(breakdown):
     """
-    Procesa los archivos mensuales y devuelve un DataFrame consolidado
+    Tabla de un nivel del drill-down (resultado de DrillIndex.breakdown) con las etiquetas de DETAIL_COLUMNS
     """
-    all_monthly_data = []
-    has_source_data = False
+    table = breakdown.reset_index()
+    table[table.columns[0]] = table[table.columns[0]].astype(object)
+    table = table.rename(columns=DETAIL_COLUMNS)
+    st.dataframe(
+        table,
+        use_container_width=True,
+        hide_index=True,
+        column_config={label: st.column_config.NumberColumn(label, format=fmt) for label, fmt in DETAIL_FORMATS.items() if label in table.columns}
+    )
+
+def export_controls(df, key, base_name, label, version, help=None):
+    """
+    Descarga bajo demanda: el archivo solo se genera (por bloques, en el formato elegido) al pulsar «Preparar»
+    y se conserva en la sesión mientras no cambien version ni el formato; sin pulsar no se serializa nada
+    """
+    fmt = st.selectbox(f"Formato ({label})", available_formats(), format_func=lambda f: EXPORT_FORMATS[f]['label'], key=f"{key}_format")
+    version = (version, fmt)
+    prepared = st.session_state.setdefault('prepared_exports', {})
+    if key in prepared and prepared[key][0] != version:
+        # Datos o formato distintos: se libera el archivo anterior
+        del prepared[key]
     
-    for month_name, file in monthly_files.items():
-        if file is not None:
+    if st.button(f"⚙️ Preparar {label}", key=f"{key}_prepare", help=help):
+        with st.spinner(f"Generando {EXPORT_FORMATS[fmt]['label']}..."), profile_stage('exportación', f"{key} ({fmt})") as stage:
             try:
-                df, has_source = read_csv_with_header_detection_and_clean(file)
-                if has_source:
-                    has_source_data = True
-                df.columns = [col.strip().lower() for col in df.columns]
-                
-                # Encontrar columnas relevantes según el tipo de datos
-                page_col = find_column(df, ['page_path', 'pagina', 'url', 'ruta'])
-                source_col = find_column(df, ['fuente', 'fuente de la sesión', 'source', 'canal', 'channel', 'medium']) if has_source else None
-                
-                if data_type == 'cta':
-                    value_col = find_column(df, ['cta_clicks', 'clicks', 'clics', 'clicks_cta', 'total de usuarios', 'total_usuarios'])
-                    col_name = 'cta_clicks'
-                elif data_type == 'users':
-                    value_col = find_column(df, ['total_usuarios', 'usuarios', 'total users', 'total de usuarios', 'usuarios únicos', 'usuarios_unicos'])
-                    col_name = 'total_users'
-                
-                if page_col and value_col:
-                    if has_source and source_col:
-                        month_df = df[[source_col, page_col, value_col]].copy()
-                        month_df.columns = ['fuente', 'landing_page', col_name]
-                        month_df['fuente'] = clean_column(month_df, 'fuente')
-                    else:
-                        month_df = df[[page_col, value_col]].copy()
-                        month_df.columns = ['landing_page', col_name]
-                        month_df['fuente'] = 'no especificado'  # Valor por defecto
-                    
-                    month_df['landing_page'] = clean_column(month_df, 'landing_page')
-                    month_df = month_df.dropna(subset=['landing_page', col_name])
-                    month_df[col_name] = pd.to_numeric(month_df[col_name], errors='coerce').fillna(0).astype(int)
-                    month_df['mes'] = month_name
-                    all_monthly_data.append(month_df)
-                    
-            except Exception as e:
-                st.error(f"Error procesando archivo de {month_name}: {e}")
-                continue
+                prepared[key] = (version, export_bytes(df, fmt))
+            except (ImportError, ValueError) as e:
+                st.error(f"No se pudo exportar: {e}")
+            stage['rows'] = len(df)
     
-    if all_monthly_data:
-        result_df = pd.concat(all_monthly_data, ignore_index=True)
-        return result_df, has_source_data
-    return pd.DataFrame(), False
+    if key in prepared:
+        st.download_button(
+            label=f"📥 Descargar {label} ({EXPORT_FORMATS[fmt]['label']})",
+            data=prepared[key][1],
+            file_name=export_file_name(base_name, fmt),
+            mime=EXPORT_FORMATS[fmt]['mime'],
+            key=f"{key}_download"
+        )
+
+def lazy_figure(name, data, builder):
+    """
+    Devuelve la figura guardada en la sesión si sus datos de entrada no cambiaron; si no, la construye con builder()
+    """
+    figure_cache = st.session_state.setdefault('figure_cache', {})
+    fingerprint = data.fingerprint() if isinstance(data, AggregationCube) else frame_fingerprint(data)
+    cached = figure_cache.get(name)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    with profile_stage('gráfico', name):
+        fig = builder()
+    figure_cache[name] = (fingerprint, fig)
+    return fig
+
+def show_charts(label, key, expanded=False):
+    """
+    Interruptor de un grupo de gráficos: los gráficos solo se construyen cuando el grupo está abierto
+    """
+    return st.toggle(label, value=expanded, key=key)
 
 def create_trend_chart(df, metric, title):
     """
     Crea un gráfico de tendencias mensuales
     """
-    monthly_avg = df.groupby('mes')[metric].mean().reset_index()
+    # Tasa de cada mes como cociente de las sumas del mes
+    monthly_rate = as_cube(df).rate(['mes'], metric).reset_index()
     
-    # Ordenar por mes
-    month_order = ['enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 
-                   'julio', 'agosto', 'septiembre', 'octubre', 'noviembre', 'diciembre']
-    monthly_avg['mes'] = pd.Categorical(monthly_avg['mes'], categories=month_order, ordered=True)
-    monthly_avg = monthly_avg.sort_values('mes')
+    # Eje temporal real, ordenado por periodo
+    monthly_rate = monthly_rate.sort_values('mes')
+    monthly_rate['mes'] = period_axis(monthly_rate['mes'].astype(str)).to_numpy()
     
-    fig = px.line(monthly_avg, x='mes', y=metric, 
+    fig = px.line(monthly_rate, x='mes', y=metric, 
                   title=title,
                   markers=True,
                   line_shape='spline')
     
     fig.update_layout(
         xaxis_title="Mes",
-        yaxis_title=f"{metric} (%)" if 'CTR' in metric else metric,
+        yaxis_title=DETAIL_COLUMNS.get(metric, metric),
         hovermode='x unified'
     )
     
     return fig
 
-def create_source_trend_chart(df, metric, title):
+def create_source_trend_chart(df, metric, title, top_k=None):
     """
-    Crea un gráfico de tendencias mensuales por fuente
+    Crea un gráfico de tendencias mensuales por fuente (top fuentes por usuarios + "Otros")
     """
     # Agrupar por mes y fuente
-    source_monthly = df.groupby(['mes', 'fuente'])[metric].mean().reset_index()
+    top_k = top_k or CHART_CONFIG['top_sources']
+    source_monthly = as_cube(df).rate(['mes', 'fuente'], metric, top_k).reset_index()
     
-    # Ordenar por mes
-    month_order = ['enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 
-                   'julio', 'agosto', 'septiembre', 'octubre', 'noviembre', 'diciembre']
-    source_monthly['mes'] = pd.Categorical(source_monthly['mes'], categories=month_order, ordered=True)
-    source_monthly = source_monthly.sort_values('mes')
+    # Eje temporal real, ordenado por periodo
+    source_monthly = source_monthly.sort_values('mes', kind='stable')
+    source_monthly['mes'] = period_axis(source_monthly['mes'].astype(str)).to_numpy()
     
     fig = px.line(source_monthly, x='mes', y=metric, color='fuente',
                   title=title,
@@ -221,21 +399,18 @@ def create_source_trend_chart(df, metric, title):
     
     fig.update_layout(
         xaxis_title="Mes",
-        yaxis_title=f"{metric} (%)" if 'CTR' in metric else metric,
+        yaxis_title=DETAIL_COLUMNS.get(metric, metric),
         hovermode='x unified'
     )
     
     return fig
 
-def create_source_performance_chart(df, title):
+def create_source_performance_chart(df, title, top_k=None):
     """
-    Crea un gráfico de barras del CTR promedio por fuente
+    Crea un gráfico de barras del CTR de cada fuente, clicks / usuarios de la fuente (top fuentes por usuarios + "Otros")
     """
-    source_performance = df.groupby('fuente').agg({
-        'CTR': 'mean',
-        'total_users': 'sum',
-        'cta_clicks': 'sum'
-    }).round(2).reset_index()
+    top_k = top_k or CHART_CONFIG['top_sources']
+    source_performance = as_cube(df).summary(['fuente'], top_k).round(2).reset_index()
     
     source_performance = source_performance.sort_values('CTR', ascending=True)
     
@@ -250,7 +425,7 @@ def create_source_performance_chart(df, title):
     
     fig.update_layout(
         yaxis_title="Fuente de Tráfico",
-        xaxis_title="CTR Promedio (%)",
+        xaxis_title="CTR (%)",
         height=400
     )
     
@@ -260,16 +435,11 @@ def create_monthly_volume_chart(df, title):
     """
     Crea un gráfico de barras para volúmenes mensuales
     """
-    monthly_totals = df.groupby('mes').agg({
-        'total_users': 'sum',
-        'cta_clicks': 'sum'
-    }).reset_index()
+    monthly_totals = as_cube(df).rollup(['mes'])[['total_users', 'cta_clicks']].reset_index()
     
-    # Ordenar por mes
-    month_order = ['enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 
-                   'julio', 'agosto', 'septiembre', 'octubre', 'noviembre', 'diciembre']
-    monthly_totals['mes'] = pd.Categorical(monthly_totals['mes'], categories=month_order, ordered=True)
+    # Eje temporal real, ordenado por periodo
     monthly_totals = monthly_totals.sort_values('mes')
+    monthly_totals['mes'] = period_axis(monthly_totals['mes'].astype(str)).to_numpy()
     
     fig = go.Figure()
     
@@ -304,22 +474,13 @@ def create_heatmap(df, metric, title):
     """
     Crea un heatmap de landing pages vs meses
     """
-    # Tomar solo las top 10 landing pages por rendimiento promedio
-    top_pages = df.groupby('landing_page')[metric].mean().nlargest(10).index
-    filtered_df = df[df['landing_page'].isin(top_pages)]
+    # Tomar solo las top 10 landing pages por su tasa en todo el periodo
+    cube = as_cube(df)
+    top_pages = cube.rate(['landing_page'], metric).nlargest(10).index
+    pivot_data = cube.pivot('landing_page', 'mes', metric, index_values=top_pages)
     
-    pivot_data = filtered_df.pivot_table(
-        values=metric, 
-        index='landing_page', 
-        columns='mes', 
-        fill_value=0
-    )
-    
-    # Ordenar columnas por mes
-    month_order = ['enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 
-                   'julio', 'agosto', 'septiembre', 'octubre', 'noviembre', 'diciembre']
-    available_months = [month for month in month_order if month in pivot_data.columns]
-    pivot_data = pivot_data[available_months]
+    # Ordenar columnas por periodo
+    pivot_data = pivot_data.sort_index(axis=1)
     
     fig = px.imshow(pivot_data, 
                     title=title,
@@ -333,22 +494,15 @@ def create_heatmap(df, metric, title):
     
     return fig
 
-def create_source_heatmap(df, metric, title):
+def create_source_heatmap(df, metric, title, top_k=None):
     """
-    Crea un heatmap de fuentes vs meses
+    Crea un heatmap de fuentes vs meses (top fuentes por usuarios + "Otros")
     """
-    pivot_data = df.pivot_table(
-        values=metric, 
-        index='fuente', 
-        columns='mes', 
-        fill_value=0
-    )
+    top_k = top_k or CHART_CONFIG['top_sources']
+    pivot_data = as_cube(df).pivot('fuente', 'mes', metric, top_k=top_k)
     
-    # Ordenar columnas por mes
-    month_order = ['enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 
-                   'julio', 'agosto', 'septiembre', 'octubre', 'noviembre', 'diciembre']
-    available_months = [month for month in month_order if month in pivot_data.columns]
-    pivot_data = pivot_data[available_months]
+    # Ordenar columnas por periodo
+    pivot_data = pivot_data.sort_index(axis=1)
     
     fig = px.imshow(pivot_data, 
                     title=title,
@@ -362,11 +516,15 @@ def create_source_heatmap(df, metric, title):
     
     return fig
 
-def create_top_performers_chart(df, metric, title, top_n=10):
+def create_top_performers_chart(df, metric, title, top_n=10, by_lower_bound=None):
     """
-    Crea un gráfico de barras horizontales para top performers
+    Crea un gráfico de barras horizontales para top performers, con el intervalo de confianza de cada tasa.
+    Con by_lower_bound se eligen y ordenan por el límite inferior del intervalo en lugar de por la tasa observada.
     """
-    top_data = df.nlargest(top_n, metric)
+    top_data = top_rates(df, metric, top_n, by_lower_bound)
+    # Barras de error hasta los límites del intervalo (acotadas en 0 si la tasa supera el 100%)
+    top_data = top_data.assign(error_plus=(top_data[f'{metric}_high'] - top_data[metric]).clip(lower=0),
+                               error_minus=(top_data[metric] - top_data[f'{metric}_low']).clip(lower=0))
     
     fig = px.bar(top_data, 
                  x=metric, 
@@ -374,28 +532,95 @@ def create_top_performers_chart(df, metric, title, top_n=10):
                  orientation='h',
                  title=title,
                  color=metric,
-                 color_continuous_scale='Blues')
+                 color_continuous_scale='Blues',
+                 error_x='error_plus',
+                 error_x_minus='error_minus',
+                 hover_data=['total_users', f'{metric}_low', f'{metric}_high'])
     
     fig.update_layout(
         yaxis_title="Landing Page",
-        xaxis_title=f"{metric} (%)" if 'CTR' in metric else metric,
+        xaxis_title=DETAIL_COLUMNS.get(metric, metric),
         height=400
     )
     
     return fig
 
-def create_scatter_plot(df, title):
-    """
-    Crea un scatter plot de usuarios vs clicks con CTR como color
-    """
-    fig = px.scatter(df, 
-                     x='total_users', 
-                     y='cta_clicks',
-                     color='CTR',
-                     size='total_users',
-                     hover_data=['landing_page'],
-                     title=title,
-                     color_continuous_scale='Viridis')
+def rank_by_lower_bound():
+    """
+    Criterio de los rankings elegido en la barra lateral: límite inferior del intervalo o tasa observada
+    """
+    st.sidebar.subheader("🏆 Rankings")
+    return st.sidebar.toggle(
+        f"Ordenar por límite inferior del IC {SIGNIFICANCE_CONFIG['confidence']:.0%}",
+        value=SIGNIFICANCE_CONFIG['rank_by_lower_bound'],
+        key="rank_by_lower_bound",
+        help="Ordena landing pages, fuentes y meses por el valor más bajo plausible de su tasa, "
+             "para que una página con pocos usuarios no encabece el ranking por azar"
+    )
+
+def best_and_worst(summary, metric, by_lower_bound):
+    """
+    Etiquetas del mejor y del peor grupo de una tabla resumen con intervalos: por la tasa observada o,
+    con by_lower_bound, por el mayor límite inferior y el menor límite superior
+    """
+    if by_lower_bound:
+        return summary[f'{metric}_low'].idxmax(), summary[f'{metric}_high'].idxmin()
+    return summary[metric].idxmax(), summary[metric].idxmin()
+
+def rate_with_interval(summary, metric, label):
+    row = summary.loc[label]
+    return f"{row[metric]:.2f}% (IC {row[f'{metric}_low']:.2f}–{row[f'{metric}_high']:.2f}%)"
+
+def difference_note(summary, metric, best, worst, format_label=str):
+    """
+    Texto con el resultado del test de dos proporciones entre el mejor y el peor grupo
+    """
+    if best == worst:
+        return None
+    _, p_value = compare_rows(summary, metric, best, worst)
+    verdict = "significativa" if is_significant(p_value) else "no significativa"
+    return (f"Diferencia entre {format_label(best)} y {format_label(worst)}: **{verdict}** al "
+            f"{SIGNIFICANCE_CONFIG['confidence']:.0%} (p = {p_value:.3g}, test de dos proporciones)")
+
+def create_scatter_plot(df, title, max_points=None):
+    """
+    Crea un scatter plot de usuarios vs clicks con CTR como color.
+    Con más de max_points landing pages se muestra un mapa de densidad con el CTR medio por celda,
+    para que el tamaño del gráfico no crezca con el número de páginas.
+    """
+    max_points = max_points or CHART_CONFIG['scatter_max_points']
+    if len(df) > max_points:
+        # Binning en el servidor: al navegador solo llega la matriz de celdas, no los puntos
+        x = df['total_users'].to_numpy(dtype=float)
+        y = df['cta_clicks'].to_numpy(dtype=float)
+        ctr = df['CTR'].to_numpy(dtype=float)
+        valid = np.isfinite(ctr)
+        pages, x_edges, y_edges = np.histogram2d(x, y, bins=CHART_CONFIG['scatter_bins'])
+        valid_pages, _, _ = np.histogram2d(x[valid], y[valid], bins=[x_edges, y_edges])
+        ctr_sum, _, _ = np.histogram2d(x[valid], y[valid], bins=[x_edges, y_edges], weights=ctr[valid])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ctr_avg = np.where(valid_pages > 0, ctr_sum / valid_pages, np.nan)
+        
+        fig = go.Figure(go.Heatmap(
+            x=(x_edges[:-1] + x_edges[1:]) / 2,
+            y=(y_edges[:-1] + y_edges[1:]) / 2,
+            z=ctr_avg.T.round(2),
+            customdata=pages.T,
+            colorscale='Viridis',
+            colorbar=dict(title='CTR'),
+            hovertemplate='Usuarios: %{x:,.0f}<br>Clicks CTA: %{y:,.0f}<br>CTR medio: %{z:.2f}%<br>Landing pages: %{customdata:,.0f}<extra></extra>'
+        ))
+        fig.update_layout(title=title)
+    else:
+        fig = px.scatter(df, 
+                         x='total_users', 
+                         y='cta_clicks',
+                         color='CTR',
+                         size='total_users',
+                         hover_data=['landing_page'],
+                         title=title,
+                         render_mode='webgl',
+                         color_continuous_scale='Viridis')
     
     fig.update_layout(
         xaxis_title="Total Usuarios",
@@ -420,10 +645,10 @@ def create_ctr_distribution(df, title):
         showlegend=False
     )
     
-    # Añadir línea de promedio
-    mean_ctr = df['CTR'].mean()
-    fig.add_vline(x=mean_ctr, line_dash="dash", line_color="red", 
-                  annotation_text=f"Promedio: {mean_ctr:.2f}%")
+    # Añadir línea del CTR global (clicks / usuarios de todas las landing pages)
+    global_ctr = rate_of_sums(df, 'CTR')
+    fig.add_vline(x=global_ctr, line_dash="dash", line_color="red", 
+                  annotation_text=f"Global: {global_ctr:.2f}%")
     
     return fig
 
@@ -451,11 +676,12 @@ def create_traffic_distribution(df, title):
     
     return fig
 
-def create_source_distribution(df, title):
+def create_source_distribution(df, title, top_k=None):
     """
-    Crea un gráfico de pastel para distribución de tráfico por fuente
+    Crea un gráfico de pastel para distribución de tráfico por fuente (top fuentes por usuarios + "Otros")
     """
-    source_totals = df.groupby('fuente')['total_users'].sum().reset_index()
+    top_k = top_k or CHART_CONFIG['top_sources']
+    source_totals = as_cube(df).summary(['fuente'], top_k)[['total_users']].reset_index()
     
     fig = px.pie(source_totals, 
                  values='total_users', 
@@ -466,7 +692,7 @@ def create_source_distribution(df, title):
 
 def create_gauge_chart(value, title):
     """
-    Crea un gráfico de gauge para CTR promedio
+    Crea un gráfico de gauge para el CTR global
     """
     fig = go.Figure(go.Indicator(
         mode = "gauge+number+delta",
@@ -492,87 +718,85 @@ def create_gauge_chart(value, title):
     
     return fig
 
-def create_consolidated_analysis(df, has_source_analysis):
-    """
-    Crea un análisis consolidado por landing page, sumando todas las fuentes
-    """
-    if has_source_analysis:
-        # Consolidar por landing page sumando todas las fuentes
-        consolidated = df.groupby(['mes', 'landing_page']).agg({
-            'total_users': 'sum',
-            'cta_clicks': 'sum'
-        }).reset_index()
-        
-        # Calcular CTR consolidado
-        consolidated['CTR'] = (consolidated['cta_clicks'] / consolidated['total_users'] * 100).round(2)
-        
-        return consolidated
-    else:
-        # Ya está consolidado si no hay fuente
-        return df
-
-def create_source_analysis_section(merged_monthly, complete_months):
+def create_source_analysis_section(merged_monthly, complete_months, cube=None):
     """
     Crea la sección completa de análisis por fuente
     """
+    cube = cube or AggregationCube(merged_monthly)
     st.subheader("🎯 Análisis Detallado por Fuente de Tráfico")
     st.info("💡 **Análisis granular**: Aquí puedes ver el rendimiento específico de cada canal (Facebook, Google, etc.)")
     
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        # Gráfico de tendencias por fuente
-        fig_source_ctr = create_source_trend_chart(merged_monthly, 'CTR', 'Evolución del CTR por Fuente y Mes')
-        st.plotly_chart(fig_source_ctr, use_container_width=True)
-    
-    with col2:
-        # Performance por fuente
-        fig_source_performance = create_source_performance_chart(merged_monthly, 'CTR Promedio por Fuente de Tráfico')
-        st.plotly_chart(fig_source_performance, use_container_width=True)
-    
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        # Distribución de tráfico por fuente
-        fig_source_dist = create_source_distribution(merged_monthly, 'Distribución de Usuarios por Fuente')
-        st.plotly_chart(fig_source_dist, use_container_width=True)
-    
-    with col2:
-        # Heatmap por fuente
-        fig_source_heatmap = create_source_heatmap(merged_monthly, 'CTR', 'Heatmap CTR: Fuentes vs Meses')
-        st.plotly_chart(fig_source_heatmap, use_container_width=True)
+    if show_charts("📊 Mostrar gráficos por fuente", key="show_source_charts"):
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            # Gráfico de tendencias por fuente
+            fig_source_ctr = lazy_figure('source_trend', cube, lambda: create_source_trend_chart(cube, 'CTR', 'Evolución del CTR por Fuente y Mes'))
+            st.plotly_chart(fig_source_ctr, use_container_width=True)
+        
+        with col2:
+            # Performance por fuente
+            fig_source_performance = lazy_figure('source_performance', cube, lambda: create_source_performance_chart(cube, 'CTR por Fuente de Tráfico'))
+            st.plotly_chart(fig_source_performance, use_container_width=True)
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            # Distribución de tráfico por fuente
+            fig_source_dist = lazy_figure('source_distribution', cube, lambda: create_source_distribution(cube, 'Distribución de Usuarios por Fuente'))
+            st.plotly_chart(fig_source_dist, use_container_width=True)
+        
+        with col2:
+            # Heatmap por fuente
+            fig_source_heatmap = lazy_figure('source_heatmap', cube, lambda: create_source_heatmap(cube, 'CTR', 'Heatmap CTR: Fuentes vs Meses'))
+            st.plotly_chart(fig_source_heatmap, use_container_width=True)
     
-    # Filtro por fuente
+    # Filtro por fuente (las filas y los totales de cada fuente salen del índice, sin recorrer todo el historial)
+    index = drill_index('source_analysis', merged_monthly, cube)
     st.subheader("🔍 Análisis Filtrado por Fuente")
-    available_sources = ['Todas'] + list(merged_monthly['fuente'].unique())
+    available_sources = ['Todas'] + index.values('fuente')
     selected_source = st.selectbox("Selecciona una fuente específica:", available_sources)
     
     if selected_source != 'Todas':
-        filtered_monthly = merged_monthly[merged_monthly['fuente'] == selected_source]
+        filtered_monthly = index.rows(fuente=selected_source)
+        source_summary = index.summary(fuente=selected_source)
         st.write(f"**📊 Análisis específico para: {selected_source}**")
         
         # Métricas específicas de la fuente
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("Total Usuarios", f"{filtered_monthly['total_users'].sum():,}")
+            st.metric("Total Usuarios", f"{source_summary['total_users']:,}")
         with col2:
-            st.metric("Total Clicks CTA", f"{filtered_monthly['cta_clicks'].sum():,}")
+            st.metric("Total Clicks CTA", f"{source_summary['cta_clicks']:,}")
         with col3:
-            st.metric("CTR Promedio", f"{filtered_monthly['CTR'].mean():.2f}%")
+            st.metric("CTR", f"{source_summary['CTR']:.2f}%")
         
         # Tabla específica por fuente
         st.write("**Detalle por landing page:**")
-        source_detail = filtered_monthly[['mes', 'landing_page', 'total_users', 'cta_clicks', 'CTR']].copy()
-        source_detail.columns = ['Mes', 'Landing Page', 'Total Usuarios', 'Clicks CTA', 'CTR (%)']
+        paginated_table(filtered_monthly, "source_detail_table", ['mes', 'landing_page'] + metric_columns(filtered_monthly))
+    
+    # Drill-down landing page → fuente → mes
+    st.subheader("🧭 Drill-down: Landing Page → Fuente → Mes")
+    landing_pages = index.values('landing_page', by='total_users')
+    selected_page = st.selectbox("Landing page (de más a menos usuarios):", landing_pages, key="drill_landing_page")
+    if selected_page is not None:
+        page_summary = index.summary(landing_page=selected_page)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Total Usuarios", f"{page_summary['total_users']:,}")
+        with col2:
+            st.metric("Total Clicks CTA", f"{page_summary['cta_clicks']:,}")
+        with col3:
+            st.metric("CTR", f"{page_summary['CTR']:.2f}%")
         
-        st.dataframe(
-            source_detail.style.format({
-                'Total Usuarios': '{:,.0f}',
-                'Clicks CTA': '{:,.0f}',
-                'CTR (%)': '{:.2f}%'
-            }),
-            use_container_width=True
-        )
+        by_source = index.breakdown('fuente', landing_page=selected_page).sort_values('total_users', ascending=False)
+        st.write("**Fuentes de la landing page:**")
+        breakdown_table(by_source)
+        
+        selected_page_source = st.selectbox("Fuente:", list(by_source.index), key="drill_source")
+        if selected_page_source is not None:
+            st.write(f"**Evolución mensual de {selected_page_source} en {selected_page}:**")
+            breakdown_table(index.breakdown('mes', landing_page=selected_page, fuente=selected_page_source))
 
 def main():
     # Título y descripción
@@ -581,6 +805,9 @@ def main():
     Esta herramienta analiza la evolución temporal del Click Through Rate (CTR) de tus landing pages, con **análisis inteligente** que muestra primero los datos consolidados y luego permite profundizar por fuente de tráfico.
     """)
 
+    # Criterio de los rankings (barra lateral)
+    by_lower_bound = rank_by_lower_bound()
+
     # Selector de modo de análisis
     analysis_mode = st.radio(
         "Selecciona el tipo de análisis:",
@@ -607,70 +834,125 @@ def main():
             - `page_path` | `Total de usuarios`
             - Ejemplo: `/landing-page` | `1250`
             
+            **Formularios enviados (opcional):** mismo formato, con los usuarios que enviaron el formulario;
+            con ellos se calcula también la **Conversión Efectiva** (Formularios / Usuarios × 100).
+            
             ⚡ **La app detecta automáticamente** el formato de tus archivos.
             """)
         
-        # Crear tabs para cada tipo de archivo
-        tab1, tab2 = st.tabs(["📈 Clicks CTA", "👥 Usuarios"])
+        # Año para los archivos cuyo nombre solo indica el mes (p. ej. 'usuarios_enero.csv')
+        default_year = int(st.number_input(
+            "Año de los archivos nombrados solo con el mes",
+            min_value=2000,
+            max_value=2100,
+            value=datetime.now().year,
+            step=1
+        ))
         
-        # Diccionarios para almacenar archivos mensuales
-        monthly_cta_files = {}
-        monthly_users_files = {}
+        # Crear tabs para la carga masiva y para cada tipo de archivo
+        tab_bulk, tab1, tab2, tab3 = st.tabs(["📦 Carga masiva (CSV o ZIP)", "📈 Clicks CTA", "👥 Usuarios", "📝 Formularios (opcional)"])
         
-        months = ['enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 
-                 'julio', 'agosto', 'septiembre', 'octubre', 'noviembre', 'diciembre']
+        with tab_bulk:
+            st.markdown("**Sube de una vez todos los CSV (o uno o varios ZIP) de clicks CTA, usuarios y, si los tienes, formularios enviados.** "
+                        "Cada archivo se clasifica por su nombre, el preámbulo de GA (`# Fecha de inicio`) o sus columnas.")
+            bulk_uploads = st.file_uploader(
+                "CSV o ZIP de todos los meses",
+                type=['csv', 'zip'],
+                accept_multiple_files=True,
+                key="bulk_files"
+            )
         
         with tab1:
-            st.markdown("**Carga los archivos CSV de clicks CTA por mes:**")
-            for month in months:
-                monthly_cta_files[month] = st.file_uploader(
-                    f"Clicks CTA - {month.capitalize()}", 
-                    type=['csv'], 
-                    key=f"cta_{month}"
-                )
+            st.markdown("**Carga los archivos CSV de clicks CTA, uno por mes (p. ej. `cta_2024-01.csv` o `cta_enero_2024.csv`):**")
+            cta_uploads = st.file_uploader(
+                "Clicks CTA",
+                type=['csv'],
+                accept_multiple_files=True,
+                key="cta_files"
+            )
         
         with tab2:
-            st.markdown("**Carga los archivos CSV de usuarios por mes:**")
-            for month in months:
-                monthly_users_files[month] = st.file_uploader(
-                    f"Usuarios - {month.capitalize()}", 
-                    type=['csv'], 
-                    key=f"users_{month}"
-                )
+            st.markdown("**Carga los archivos CSV de usuarios, uno por mes (p. ej. `usuarios_2024-01.csv` o `usuarios_enero_2024.csv`):**")
+            users_uploads = st.file_uploader(
+                "Usuarios",
+                type=['csv'],
+                accept_multiple_files=True,
+                key="users_files"
+            )
+        
+        with tab3:
+            st.markdown("**Carga los archivos CSV de formularios enviados, uno por mes (p. ej. `formularios_2024-01.csv`), "
+                        "para calcular la Conversión Efectiva:**")
+            forms_uploads = st.file_uploader(
+                "Formularios enviados",
+                type=['csv'],
+                accept_multiple_files=True,
+                key="forms_files"
+            )
+        
+        # Diccionarios {periodo 'YYYY-MM': archivo} en orden cronológico
+        files_by_type = classify_uploads(bulk_uploads, cta_uploads, users_uploads, default_year, forms_uploads)
+        monthly_cta_files = files_by_type['cta']
+        monthly_users_files = files_by_type['users']
+        monthly_forms_files = files_by_type['forms']
+        months = sorted(set(monthly_cta_files) | set(monthly_users_files))
         
         # Verificar qué meses tienen datos completos
-        complete_months = []
-        for month in months:
-            if (monthly_cta_files[month] is not None and 
-                monthly_users_files[month] is not None):
-                complete_months.append(month)
+        complete_months = [month for month in months if month in monthly_cta_files and month in monthly_users_files]
         
-        if len(complete_months) >= 2:
-            st.success(f"✅ Datos completos para {len(complete_months)} meses: {', '.join(complete_months)}")
+        # Historial guardado en el almacén local (si está activado)
+        dataset_store = get_dataset_store()
+        use_stored_history = (
+            dataset_store is not None
+            and len(complete_months) < 2
+            and st.checkbox("📂 Analizar el historial guardado (sin subir archivos)", key="use_stored_history")
+        )
+        
+        if len(complete_months) >= 2 or use_stored_history:
+            if not use_stored_history:
+                st.success(f"✅ Datos completos para {len(complete_months)} meses: {', '.join(period_display(m) for m in complete_months)}")
             
             with st.spinner('Procesando datos mensuales...'):
-                # Procesar datos por tipo
-                cta_data, has_source_cta = process_monthly_data(monthly_cta_files, 'cta')
-                users_data, has_source_users = process_monthly_data(monthly_users_files, 'users')
-                
-                # Determinar si tenemos datos de fuente
-                has_source_analysis = has_source_cta or has_source_users
+                if use_stored_history:
+                    # Leer los meses normalizados directamente del almacén, sin parsear CSV
+                    analysis = analyze_stored_months(dataset_store)
+                    complete_months = [str(m) for m in analysis['merged_monthly']['mes'].unique()] if analysis is not None else []
+                    st.caption(f"📂 Historial guardado: {len(complete_months)} meses")
+                elif upload_size_mb(monthly_cta_files, monthly_users_files, monthly_forms_files) >= OUT_OF_CORE_CONFIG['auto_threshold_mb']:
+                    # Exports muy grandes: lectura por bloques y sumas parciales con memoria acotada
+                    analysis = analyze_out_of_core(monthly_cta_files, monthly_users_files, monthly_forms_files)
+                    st.caption(f"🧮 Modo de memoria acotada: {upload_size_mb(monthly_cta_files, monthly_users_files, monthly_forms_files):,.0f} MB subidos, "
+                               f"techo de {OUT_OF_CORE_CONFIG['memory_limit_mb']:,} MB")
+                else:
+                    # Procesar datos por tipo, merge y consolidación
+                    # de forma incremental: solo se recalculan los meses cuyo archivo cambió
+                    parse_cache = get_parse_cache()
+                    incremental = st.session_state.setdefault('monthly_analysis', IncrementalMonthlyAnalysis())
+                    analysis = incremental.update(
+                        monthly_cta_files,
+                        monthly_users_files,
+                        cache=parse_cache,
+                        on_error=report_month_error,
+                        store=dataset_store,
+                        monthly_forms_files=monthly_forms_files
+                    )
+                    cache_stats = parse_cache.stats()
+                    recomputed = ', '.join(incremental.last_changed) if incremental.last_changed else 'ninguno'
+                    st.caption(f"⚡ Caché de lectura: {cache_stats['hits']} aciertos, {cache_stats['misses']} fallos, "
+                               f"{cache_stats['entries']} archivos ({cache_stats['bytes'] / 1024 / 1024:.1f} MB) · "
+                               f"Meses recalculados: {recomputed}")
                 
-                if not cta_data.empty and not users_data.empty:
-                    # Consolidar todos los datos
-                    if has_source_analysis:
-                        merged_monthly = users_data.merge(cta_data, on=['landing_page', 'mes', 'fuente'], how='left')
-                    else:
-                        merged_monthly = users_data.merge(cta_data, on=['landing_page', 'mes'], how='left')
-                    
-                    # Rellenar valores nulos
-                    merged_monthly['cta_clicks'] = merged_monthly['cta_clicks'].fillna(0).astype(int)
-                    
-                    # Calcular CTR
-                    merged_monthly['CTR'] = (merged_monthly['cta_clicks'] / merged_monthly['total_users'] * 100).round(2)
-                    
-                    # *** ANÁLISIS PRINCIPAL CONSOLIDADO ***
-                    consolidated_data = create_consolidated_analysis(merged_monthly, has_source_analysis)
+                if analysis is not None:
+                    merged_monthly = analysis['merged_monthly']
+                    consolidated_data = analysis['consolidated_data']
+                    has_source_analysis = analysis['has_source_analysis']
+                    detail_cube = analysis['detail_cube']
+                    consolidated_cube = analysis['consolidated_cube']
+                    # Conversión Efectiva solo si se cargaron formularios (se calcula en el mismo merge que el CTR)
+                    has_conversion = 'conversion_rate' in consolidated_cube.mean_columns
+                    missing_forms = [m for m in complete_months if m not in monthly_forms_files] if has_conversion and not use_stored_history else []
+                    if missing_forms:
+                        st.caption(f"📝 Sin archivo de formularios (Conversión Efectiva 0): {', '.join(period_display(m) for m in missing_forms)}")
                     
                     # Mostrar información sobre el análisis
                     if has_source_analysis:
@@ -678,80 +960,93 @@ def main():
                         st.info(f"🎯 **Análisis inteligente activado!** Detectadas {len(sources_found)} fuentes: {', '.join(sources_found[:3])}{'...' if len(sources_found) > 3 else ''}")
                         st.success("💡 **Mostrando análisis principal consolidado por landing page.** El análisis detallado por fuente está disponible más abajo.")
                     
+                    show_unmatched_keys(analysis['unmatched'], "landing page, fuente y mes" if has_source_analysis else "landing page y mes")
+                    
                     # Análisis temporal consolidado
                     st.markdown("---")
                     st.subheader("📈 Análisis Principal - Consolidado por Landing Page") 
                     
-                    # Métricas resumen por mes (consolidadas)
-                    monthly_summary = consolidated_data.groupby('mes').agg({
-                        'total_users': 'sum',
-                        'cta_clicks': 'sum', 
-                        'CTR': 'mean'
-                    }).round(2)
-                    
-                    # Ordenar por mes
-                    month_order = ['enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 
-                                  'julio', 'agosto', 'septiembre', 'octubre', 'noviembre', 'diciembre']
-                    monthly_summary = monthly_summary.reindex([m for m in month_order if m in monthly_summary.index])
+                    # Métricas resumen por mes (consolidadas), con el intervalo de confianza de cada tasa
+                    # (la dimensión mes ya está ordenada cronológicamente)
+                    monthly_summary = add_rate_intervals(consolidated_cube.summary(['mes'])).round(2)
                     
                     # Mostrar tabla resumen mensual
                     st.subheader("📊 Resumen Mensual (Todos los Canales)")
+                    summary_formats = {
+                        'total_users': '{:,.0f}',
+                        'cta_clicks': '{:,.0f}',
+                        'form_submissions': '{:,.0f}',
+                        'CTR': '{:.2f}%',
+                        'CTR_low': '{:.2f}%',
+                        'CTR_high': '{:.2f}%',
+                        'conversion_rate': '{:.2f}%',
+                        'conversion_rate_low': '{:.2f}%',
+                        'conversion_rate_high': '{:.2f}%'
+                    }
                     st.dataframe(
-                        monthly_summary.style.format({
-                            'total_users': '{:,.0f}',
-                            'cta_clicks': '{:,.0f}',
-                            'CTR': '{:.2f}%'
-                        }),
+                        monthly_summary.style.format({col: fmt for col, fmt in summary_formats.items() if col in monthly_summary.columns}),
                         use_container_width=True
                     )
                     
                     # Gráficos principales consolidados
                     st.subheader("📈 Visualizaciones Principales")
                     
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        # Gráfico de tendencias CTR consolidado
-                        fig_ctr = create_trend_chart(consolidated_data, 'CTR', 'Evolución del CTR Consolidado por Mes')
-                        st.plotly_chart(fig_ctr, use_container_width=True)
-                    
-                    with col2:
-                        # Gauge Chart CTR Promedio
-                        avg_ctr = consolidated_data['CTR'].mean()
-                        fig_gauge = create_gauge_chart(avg_ctr, f'CTR Promedio General: {avg_ctr:.2f}%')
-                        st.plotly_chart(fig_gauge, use_container_width=True)
-                    
-                    # Gráfico de volúmenes mensuales consolidados
-                    fig_volume = create_monthly_volume_chart(consolidated_data, 'Volúmenes Mensuales Consolidados: Usuarios vs Clicks CTA')
-                    st.plotly_chart(fig_volume, use_container_width=True)
+                    if show_charts("Mostrar visualizaciones principales", key="show_main_charts", expanded=True):
+                        col1, col2 = st.columns(2)
+                        
+                        with col1:
+                            # Gráfico de tendencias CTR consolidado
+                            fig_ctr = lazy_figure('trend', consolidated_cube, lambda: create_trend_chart(consolidated_cube, 'CTR', 'Evolución del CTR Consolidado por Mes'))
+                            st.plotly_chart(fig_ctr, use_container_width=True)
+                        
+                        with col2:
+                            # Gauge Chart CTR global (clicks / usuarios de todo el periodo)
+                            global_ctr = consolidated_cube.overall_rate('CTR')
+                            fig_gauge = lazy_figure('gauge', consolidated_cube, lambda: create_gauge_chart(global_ctr, f'CTR Global: {global_ctr:.2f}%'))
+                            st.plotly_chart(fig_gauge, use_container_width=True)
+                        
+                        # Gráfico de volúmenes mensuales consolidados
+                        fig_volume = lazy_figure('volume', consolidated_cube, lambda: create_monthly_volume_chart(consolidated_cube, 'Volúmenes Mensuales Consolidados: Usuarios vs Clicks CTA'))
+                        st.plotly_chart(fig_volume, use_container_width=True)
+                        
+                        if has_conversion:
+                            col1, col2 = st.columns(2)
+                            
+                            with col1:
+                                # Tendencia de la Conversión Efectiva consolidada
+                                fig_conversion = lazy_figure('trend_conversion', consolidated_cube, lambda: create_trend_chart(consolidated_cube, 'conversion_rate', 'Evolución de la Conversión Efectiva Consolidada por Mes'))
+                                st.plotly_chart(fig_conversion, use_container_width=True)
+                            
+                            with col2:
+                                global_conversion = consolidated_cube.overall_rate('conversion_rate')
+                                fig_gauge_conversion = lazy_figure('gauge_conversion', consolidated_cube, lambda: create_gauge_chart(global_conversion, f'Conversión Efectiva Global: {global_conversion:.2f}%'))
+                                st.plotly_chart(fig_gauge_conversion, use_container_width=True)
                     
                     # Heatmap de landing pages consolidado
                     st.subheader("🔥 Mapa de Calor - Top 10 Landing Pages (Consolidado)")
-                    fig_heatmap_ctr = create_heatmap(consolidated_data, 'CTR', 'Heatmap CTR Consolidado por Landing Page y Mes')
-                    st.plotly_chart(fig_heatmap_ctr, use_container_width=True)
+                    if show_charts("Mostrar mapa de calor", key="show_heatmap"):
+                        fig_heatmap_ctr = lazy_figure('heatmap', consolidated_cube, lambda: create_heatmap(consolidated_cube, 'CTR', 'Heatmap CTR Consolidado por Landing Page y Mes'))
+                        st.plotly_chart(fig_heatmap_ctr, use_container_width=True)
                     
                     # *** ANÁLISIS DETALLADO POR FUENTE (OPCIONAL) ***
                     if has_source_analysis:
                         st.markdown("---")
-                        create_source_analysis_section(merged_monthly, complete_months)
+                        create_source_analysis_section(merged_monthly, complete_months, detail_cube)
                     
                     # Análisis de rendimiento consolidado
                     st.markdown("---")
                     st.subheader("🏆 Análisis de Rendimiento (Consolidado)")
                     
                     col1, col2, col3 = st.columns(3)
+                    best_ctr_month, worst_ctr_month = best_and_worst(monthly_summary, 'CTR', by_lower_bound)
                     
                     with col1:
                         st.write("**🏅 Mejor Mes por CTR:**")
-                        best_ctr_month = monthly_summary['CTR'].idxmax()
-                        best_ctr_value = monthly_summary.loc[best_ctr_month, 'CTR']
-                        st.metric("Mes", best_ctr_month.capitalize(), f"{best_ctr_value:.2f}%")
+                        st.metric("Mes", period_display(best_ctr_month).capitalize(), rate_with_interval(monthly_summary, 'CTR', best_ctr_month))
                     
                     with col2:
                         st.write("**📉 Peor Mes por CTR:**")
-                        worst_ctr_month = monthly_summary['CTR'].idxmin()
-                        worst_ctr_value = monthly_summary.loc[worst_ctr_month, 'CTR']
-                        st.metric("Mes", worst_ctr_month.capitalize(), f"{worst_ctr_value:.2f}%")
+                        st.metric("Mes", period_display(worst_ctr_month).capitalize(), rate_with_interval(monthly_summary, 'CTR', worst_ctr_month))
                     
                     with col3:
                         st.write("**📊 Crecimiento CTR:**")
@@ -759,57 +1054,87 @@ def main():
                             first_month_ctr = monthly_summary['CTR'].iloc[0]
                             last_month_ctr = monthly_summary['CTR'].iloc[-1]
                             growth = ((last_month_ctr - first_month_ctr) / first_month_ctr * 100)
-                            st.metric("Crecimiento", f"{growth:+.1f}%", f"vs {monthly_summary.index[0]}")
+                            st.metric("Crecimiento", f"{growth:+.1f}%", f"vs {period_display(monthly_summary.index[0])}")
+                    
+                    ctr_note = difference_note(monthly_summary, 'CTR', best_ctr_month, worst_ctr_month, period_display)
+                    if ctr_note:
+                        st.caption(ctr_note)
+                    
+                    if has_conversion:
+                        col1, col2, col3 = st.columns(3)
+                        best_conversion_month, worst_conversion_month = best_and_worst(monthly_summary, 'conversion_rate', by_lower_bound)
+                        
+                        with col1:
+                            st.write("**🏅 Mejor Mes por Conversión Efectiva:**")
+                            st.metric("Mes", period_display(best_conversion_month).capitalize(), rate_with_interval(monthly_summary, 'conversion_rate', best_conversion_month))
+                        
+                        with col2:
+                            st.write("**📉 Peor Mes por Conversión Efectiva:**")
+                            st.metric("Mes", period_display(worst_conversion_month).capitalize(), rate_with_interval(monthly_summary, 'conversion_rate', worst_conversion_month))
+                        
+                        with col3:
+                            st.write("**📝 Formularios Enviados:**")
+                            st.metric("Total", f"{monthly_summary['form_submissions'].sum():,.0f}")
+                        
+                        conversion_note = difference_note(monthly_summary, 'conversion_rate', best_conversion_month, worst_conversion_month, period_display)
+                        if conversion_note:
+                            st.caption(conversion_note)
+                    
+                    # Alertas de anomalías sobre todas las series landing page (× fuente) × mes
+                    st.subheader("🚨 Alertas de Anomalías")
+                    anomaly_metric = 'CTR'
+                    if has_conversion:
+                        anomaly_metric = st.radio("Métrica:", ['CTR', 'conversion_rate'], format_func=DETAIL_COLUMNS.get,
+                                                  horizontal=True, key="anomaly_metric")
+                    alerts = anomaly_alerts(detail_cube, anomaly_metric)
+                    method_label = "mediana y MAD" if ANOMALY_CONFIG['method'] == 'mad' else "media y desviación típica"
+                    st.caption(f"Cada mes se compara con los {ANOMALY_CONFIG['window']} meses anteriores de su serie ({method_label}); "
+                               f"se marca si la puntuación supera ±{ANOMALY_CONFIG['threshold']} con al menos {ANOMALY_CONFIG['min_users']:,} usuarios. "
+                               "Ordenadas de mayor a menor desviación.")
+                    if alerts.empty:
+                        st.success("✅ Ningún mes se desvía de forma anómala de la referencia de su serie.")
+                    else:
+                        drops = int((alerts['direction'] == 'caída').sum())
+                        st.warning(f"⚠️ {len(alerts):,} alertas: {drops:,} caídas y {len(alerts) - drops:,} subidas")
+                        series_columns = [col for col in ['landing_page', 'fuente'] if col in alerts.columns]
+                        paginated_table(alerts, "anomaly_table", ['mes'] + series_columns + [anomaly_metric, 'baseline', 'change', 'score', 'total_users', 'direction'])
                     
                     # Tabla detallada consolidada
                     st.subheader("📋 Datos Detallados Consolidados por Landing Page")
                     
                     # Filtro por mes
-                    selected_month = st.selectbox("Filtrar por mes:", ['Todos'] + complete_months)
+                    selected_month = st.selectbox("Filtrar por mes:", ['Todos'] + complete_months, format_func=period_display)
                     
-                    # Aplicar filtro
+                    # Aplicar filtro (búsqueda en el índice por mes en lugar de una máscara sobre toda la tabla)
                     if selected_month != 'Todos':
-                        filtered_data = consolidated_data[consolidated_data['mes'] == selected_month]
+                        filtered_data = drill_index('consolidated', consolidated_data, consolidated_cube).rows(mes=selected_month)
                     else:
                         filtered_data = consolidated_data
                     
-                    # Mostrar datos consolidados
-                    display_columns = ['mes', 'landing_page', 'total_users', 'cta_clicks', 'CTR']
-                    display_df = filtered_data[display_columns].copy()
-                    display_df.columns = ['Mes', 'Landing Page', 'Total Usuarios', 'Clicks CTA', 'CTR (%)']
-                    
-                    st.dataframe(
-                        display_df.style.format({
-                            'Total Usuarios': '{:,.0f}',
-                            'Clicks CTA': '{:,.0f}',
-                            'CTR (%)': '{:.2f}%'
-                        }),
-                        use_container_width=True
-                    )
+                    # Mostrar datos consolidados (solo la página visible)
+                    paginated_table(filtered_data, "consolidated_table", ['mes', 'landing_page'] + metric_columns(filtered_data))
                     
                     # Descargar datos
+                    # (los archivos se generan solo al pedirlos; la huella de los cubos identifica los datos)
                     col1, col2 = st.columns(2)
+                    date_suffix = datetime.now().strftime('%Y%m%d')
                     with col1:
-                        st.download_button(
-                            label="📥 Descargar análisis consolidado como CSV",
-                            data=consolidated_data.to_csv(index=False),
-                            file_name=f"analisis_consolidado_ctr_{datetime.now().strftime('%Y%m%d')}.csv",
-                            mime="text/csv",
+                        export_controls(
+                            consolidated_data, "export_consolidated", f"analisis_consolidado_ctr_{date_suffix}",
+                            "análisis consolidado", consolidated_cube.fingerprint(),
                             help="Descarga el análisis consolidado por landing page"
                         )
                     
                     if has_source_analysis:
                         with col2:
-                            st.download_button(
-                                label="📥 Descargar análisis detallado (con fuentes) como CSV",
-                                data=merged_monthly.to_csv(index=False),
-                                file_name=f"analisis_detallado_con_fuentes_{datetime.now().strftime('%Y%m%d')}.csv",
-                                mime="text/csv",
+                            export_controls(
+                                merged_monthly, "export_detailed", f"analisis_detallado_con_fuentes_{date_suffix}",
+                                "análisis detallado (con fuentes)", detail_cube.fingerprint(),
                                 help="Descarga el análisis detallado con información de fuentes"
                             )
         
         elif len(complete_months) == 1:
-            st.info(f"📊 Tienes datos completos para 1 mes ({complete_months[0]}). Para análisis temporal necesitas al menos 2 meses.")
+            st.info(f"📊 Tienes datos completos para 1 mes ({period_display(complete_months[0])}). Para análisis temporal necesitas al menos 2 meses.")
         
         else:
             st.info("📁 Carga los archivos CSV para al menos 2 meses para comenzar el análisis temporal.")
@@ -834,8 +1159,9 @@ def main():
             - `page_path` | `Total de usuarios`
             - Análisis general sin segmentación por fuente
             
-            **Métrica calculada:**
+            **Métricas calculadas:**
             - **CTR**: (Clicks CTA / Total Usuarios) × 100
+            - **Conversión Efectiva** (si cargas formularios): (Formularios Enviados / Total Usuarios) × 100
             """)
         
         # Sección de carga de archivos
@@ -854,103 +1180,81 @@ def main():
             if users_file:
                 st.success("✅ Archivo de usuarios cargado correctamente")
         
+        st.subheader("📝 Datos de Formularios Enviados (CSV, opcional)")
+        forms_file = st.file_uploader("Carga el CSV de formularios enviados para calcular la Conversión Efectiva", type=['csv'], key="forms_single")
+        if forms_file:
+            st.success("✅ Archivo de formularios cargado correctamente")
+        
         st.markdown('</div>', unsafe_allow_html=True)
 
         if cta_file and users_file:
             with st.spinner('Procesando archivos...'):
                 try:
-                    cta_df, has_source_cta = read_csv_with_header_detection_and_clean(cta_file)
-                    users_df, has_source_users = read_csv_with_header_detection_and_clean(users_file)
+                    # Los tres archivos se normalizan igual que un mes del análisis temporal, con la misma caché
+                    # de lectura: un rerun con los mismos archivos no vuelve a leer los CSV
+                    parse_cache = get_parse_cache()
+                    cta_df, has_source_cta = load_monthly_file(cta_file, 'cta', cache=parse_cache)
+                    users_df, has_source_users = load_monthly_file(users_file, 'users', cache=parse_cache)
+                    
+                    # Formularios (opcional)
+                    forms_df, has_source_forms = None, False
+                    if forms_file:
+                        forms_df, has_source_forms = load_monthly_file(forms_file, 'forms', cache=parse_cache)
+                        if forms_df is None:
+                            st.warning("⚠️ No se encontraron las columnas de página y formularios en el CSV de formularios; se omite la Conversión Efectiva.")
                     
                     # Determinar si tenemos análisis por fuente
-                    has_source_analysis = has_source_cta or has_source_users
+                    has_source_analysis = has_source_cta or has_source_users or (forms_df is not None and has_source_forms)
                     
                 except Exception as e:
                     st.error(f"Error al leer los archivos CSV: {e}")
                     return
 
-                # Normalizar nombres de columnas
-                cta_df.columns = [col.strip().lower() for col in cta_df.columns]
-                users_df.columns = [col.strip().lower() for col in users_df.columns]
-
-                # Buscar columnas
-                cta_page_col = find_column(cta_df, ['page_path', 'pagina', 'url', 'ruta'])
-                cta_clicks_col = find_column(cta_df, ['cta_clicks', 'clicks', 'clics', 'clicks_cta', 'total de usuarios', 'total_usuarios'])
-                users_page_col = find_column(users_df, ['page_path', 'pagina', 'url', 'ruta'])
-                users_total_col = find_column(users_df, ['total_usuarios', 'usuarios', 'total users', 'total de usuarios', 'usuarios únicos', 'usuarios_unicos'])
-                
-                # Buscar columnas de fuente si existen
-                cta_source_col = find_column(cta_df, ['fuente', 'fuente de la sesión', 'source', 'canal', 'channel', 'medium']) if has_source_cta else None
-                users_source_col = find_column(users_df, ['fuente', 'fuente de la sesión', 'source', 'canal', 'channel', 'medium']) if has_source_users else None
-
-                if not all([cta_page_col, cta_clicks_col, users_page_col, users_total_col]):
+                if cta_df is None or users_df is None:
                     st.error("No se encontraron las columnas necesarias en los archivos CSV.")
                     return
 
-                # Procesar datos según el formato
+                frames = [users_df, cta_df] + ([forms_df] if forms_df is not None else [])
                 if has_source_analysis:
-                    # Formato con fuente
-                    if has_source_cta and cta_source_col:
-                        cta_df = cta_df[[cta_source_col, cta_page_col, cta_clicks_col]].copy()
-                        cta_df.columns = ['fuente', 'landing_page', 'cta_clicks']
-                    else:
-                        cta_df = cta_df[[cta_page_col, cta_clicks_col]].copy()
-                        cta_df.columns = ['landing_page', 'cta_clicks']
-                        cta_df['fuente'] = 'no especificado'
-                    
-                    if has_source_users and users_source_col:
-                        users_df = users_df[[users_source_col, users_page_col, users_total_col]].copy()
-                        users_df.columns = ['fuente', 'landing_page', 'total_users']
-                    else:
-                        users_df = users_df[[users_page_col, users_total_col]].copy()
-                        users_df.columns = ['landing_page', 'total_users']
-                        users_df['fuente'] = 'no especificado'
-                    
-                    # Limpiar datos
-                    cta_df['landing_page'] = clean_column(cta_df, 'landing_page')
-                    cta_df['fuente'] = clean_column(cta_df, 'fuente')
-                    users_df['landing_page'] = clean_column(users_df, 'landing_page')
-                    users_df['fuente'] = clean_column(users_df, 'fuente')
-                    
-                    # Merge con fuente
-                    merged_df = pd.merge(users_df, cta_df, on=['landing_page', 'fuente'], how='left')
-                    
+                    keys = ['landing_page', 'fuente']
                 else:
-                    # Formato básico sin fuente
-                    cta_df = cta_df[[cta_page_col, cta_clicks_col]].copy()
-                    users_df = users_df[[users_page_col, users_total_col]].copy()
-                    
-                    cta_df.columns = ['landing_page', 'cta_clicks']
-                    users_df.columns = ['landing_page', 'total_users']
-                    
-                    # Limpiar datos
-                    cta_df['landing_page'] = clean_column(cta_df, 'landing_page')
-                    users_df['landing_page'] = clean_column(users_df, 'landing_page')
-                    
-                    # Merge básico
-                    merged_df = pd.merge(users_df, cta_df, on='landing_page', how='left')
+                    # Formato básico: sin la fuente por defecto que añade la normalización
+                    frames = [df.drop(columns=['fuente']) for df in frames]
+                    keys = ['landing_page']
+                
+                # Merge usuarios × CTA × formularios en un único join
+                users_df, cta_df, *forms_frames = encode_dimensions(frames)
+                join = KeyJoin(users_df, cta_df, keys, forms_frames[0] if forms_frames else None)
+                
+                has_conversion = 'forms' in join.sides
+                with profile_stage('merge usuarios × CTA × formularios' if has_conversion else 'merge usuarios × CTA'):
+                    merged_df = join.merged()
 
-                # Limpiar datos
+                # Limpiar datos: los recuentos ya son enteros; solo faltan los de las claves sin clicks (o sin formularios)
                 merged_df = merged_df.dropna(subset=['landing_page'])
-                merged_df['cta_clicks'] = pd.to_numeric(merged_df['cta_clicks'], errors='coerce').fillna(0).astype(int)
-                merged_df['total_users'] = pd.to_numeric(merged_df['total_users'], errors='coerce').fillna(0).astype(int)
+                merged_df['cta_clicks'] = merged_df['cta_clicks'].fillna(0).astype(int)
+                unmatched = join.unmatched()
+                if has_conversion:
+                    merged_df['form_submissions'] = merged_df['form_submissions'].fillna(0).astype(int)
+                    unmatched['forms_over_users'] = cap_form_submissions(merged_df)
                 
-                # Calcular CTR
-                merged_df['CTR'] = (merged_df['cta_clicks'] / merged_df['total_users'] * 100).round(2)
+                # Calcular CTR (y Conversión Efectiva)
+                add_rates(merged_df)
                 
                 # *** CREAR ANÁLISIS CONSOLIDADO ***
                 if has_source_analysis:
-                    consolidated_df = merged_df.groupby('landing_page').agg({
-                        'total_users': 'sum',
-                        'cta_clicks': 'sum'
+                    consolidated_df = merged_df.groupby('landing_page', observed=True).agg({
+                        col: 'sum' for col in ['total_users', 'cta_clicks', 'form_submissions'] if col in merged_df.columns
                     }).reset_index()
-                    consolidated_df['CTR'] = (consolidated_df['cta_clicks'] / consolidated_df['total_users'] * 100).round(2)
+                    add_rates(consolidated_df)
                     
                     sources_found = merged_df['fuente'].unique()
                     st.info(f"🎯 **Análisis inteligente activado!** Detectadas {len(sources_found)} fuentes: {', '.join(sources_found[:3])}{'...' if len(sources_found) > 3 else ''}")
                     st.success("💡 **Mostrando análisis principal consolidado por landing page.** El análisis detallado por fuente está disponible más abajo.")
                 else:
                     consolidated_df = merged_df
+                
+                show_unmatched_keys(unmatched, "landing page y fuente" if has_source_analysis else "landing page")
 
             # *** MÉTRICAS PRINCIPALES CONSOLIDADAS ***
             st.markdown('<div class="result-section">', unsafe_allow_html=True)
@@ -962,43 +1266,62 @@ def main():
             with col2:
                 st.metric("Total Clicks CTA", f"{consolidated_df['cta_clicks'].sum():,}")
             with col3:
-                st.metric("CTR Promedio", f"{consolidated_df['CTR'].mean():.2f}%")
+                st.metric("CTR Global", f"{rate_of_sums(consolidated_df, 'CTR'):.2f}%",
+                          help=f"Clicks CTA / usuarios de todas las landing pages. Media simple por landing page: {mean_of_rates(consolidated_df, 'CTR'):.2f}%")
+            
+            if has_conversion:
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.metric("Total Formularios", f"{consolidated_df['form_submissions'].sum():,}")
+                with col2:
+                    st.metric("Conversión Efectiva Global", f"{rate_of_sums(consolidated_df, 'conversion_rate'):.2f}%",
+                              help="Formularios / usuarios de todas las landing pages")
+                with col3:
+                    st.metric("Conversión Efectiva Media", f"{mean_of_rates(consolidated_df, 'conversion_rate'):.2f}%",
+                              help="Media simple de la Conversión Efectiva de cada landing page, sin ponderar por usuarios")
 
             # *** VISUALIZACIONES PRINCIPALES CONSOLIDADAS ***
             st.subheader("📈 Análisis Visual Consolidado")
             
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                # Top performers consolidado
-                fig_top = create_top_performers_chart(consolidated_df, 'CTR', 'Top 10 Landing Pages por CTR (Consolidado)')
-                st.plotly_chart(fig_top, use_container_width=True)
-            
-            with col2:
-                # Distribución de tráfico consolidado
-                fig_traffic = create_traffic_distribution(consolidated_df, 'Distribución de Tráfico Consolidado por Landing Page')
-                st.plotly_chart(fig_traffic, use_container_width=True)
+            if show_charts("Mostrar visualizaciones", key="show_single_charts", expanded=True):
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    # Top performers consolidado
+                    fig_top = lazy_figure(f'single_top_{by_lower_bound}', consolidated_df, lambda: create_top_performers_chart(consolidated_df, 'CTR', 'Top 10 Landing Pages por CTR (Consolidado)', by_lower_bound=by_lower_bound))
+                    st.plotly_chart(fig_top, use_container_width=True)
+                
+                with col2:
+                    # Distribución de tráfico consolidado
+                    fig_traffic = lazy_figure('single_traffic', consolidated_df, lambda: create_traffic_distribution(consolidated_df, 'Distribución de Tráfico Consolidado por Landing Page'))
+                    st.plotly_chart(fig_traffic, use_container_width=True)
+                
+                if has_conversion:
+                    # Top performers por Conversión Efectiva
+                    fig_top_conversion = lazy_figure(f'single_top_conversion_{by_lower_bound}', consolidated_df, lambda: create_top_performers_chart(consolidated_df, 'conversion_rate', 'Top 10 Landing Pages por Conversión Efectiva (Consolidado)', by_lower_bound=by_lower_bound))
+                    st.plotly_chart(fig_top_conversion, use_container_width=True)
 
             # *** TABLA DE RESULTADOS CONSOLIDADA ***
             st.subheader("📋 Resultados Consolidados por Landing Page")
             
-            display_df = consolidated_df[['landing_page', 'total_users', 'cta_clicks', 'CTR']].copy()
-            display_df.columns = ['Landing Page', 'Total Usuarios', 'Clicks CTA', 'CTR (%)']
-            
-            st.dataframe(
-                display_df.style.format({
-                    'Total Usuarios': '{:,.0f}',
-                    'Clicks CTA': '{:,.0f}',
-                    'CTR (%)': '{:.2f}%'
-                }),
-                use_container_width=True
-            )
+            paginated_table(consolidated_df, "single_table", ['landing_page'] + metric_columns(consolidated_df))
 
             # Top 5 Landing Pages por CTR consolidado
             st.subheader("🏆 Top 5 Landing Pages por CTR (Consolidado)")
-            top_ctr_consolidated = consolidated_df.nlargest(5, 'CTR')[['landing_page', 'CTR']].copy()
-            top_ctr_consolidated.columns = ['Landing Page', 'CTR (%)']
-            st.dataframe(top_ctr_consolidated.style.format({'CTR (%)': '{:.2f}%'}))
+            ranking_caption = (f"Ordenado por el límite inferior del intervalo de confianza ({SIGNIFICANCE_CONFIG['confidence']:.0%})" if by_lower_bound
+                               else "Ordenado por la tasa observada")
+            st.caption(ranking_caption)
+            top_ctr_consolidated = top_rates(consolidated_df, 'CTR', 5, by_lower_bound)[['landing_page', 'total_users', 'CTR', 'CTR_low', 'CTR_high']]
+            top_ctr_consolidated.columns = ['Landing Page', 'Usuarios', 'CTR (%)', 'IC inferior (%)', 'IC superior (%)']
+            st.dataframe(top_ctr_consolidated.style.format({'Usuarios': '{:,.0f}', 'CTR (%)': '{:.2f}%', 'IC inferior (%)': '{:.2f}%', 'IC superior (%)': '{:.2f}%'}))
+            
+            if has_conversion:
+                st.subheader("🏆 Top 5 Landing Pages por Conversión Efectiva (Consolidado)")
+                st.caption(ranking_caption)
+                top_conversion_consolidated = top_rates(consolidated_df, 'conversion_rate', 5, by_lower_bound)[
+                    ['landing_page', 'total_users', 'conversion_rate', 'conversion_rate_low', 'conversion_rate_high']]
+                top_conversion_consolidated.columns = ['Landing Page', 'Usuarios', 'Conversión Efectiva (%)', 'IC inferior (%)', 'IC superior (%)']
+                st.dataframe(top_conversion_consolidated.style.format({'Usuarios': '{:,.0f}', 'Conversión Efectiva (%)': '{:.2f}%', 'IC inferior (%)': '{:.2f}%', 'IC superior (%)': '{:.2f}%'}))
 
             # *** ANÁLISIS DETALLADO POR FUENTE (SI ESTÁ DISPONIBLE) ***
             if has_source_analysis:
@@ -1013,74 +1336,73 @@ def main():
                 with col2:
                     st.metric("Clicks CTA Detallado", f"{merged_df['cta_clicks'].sum():,}")
                 with col3:
-                    st.metric("CTR Detallado", f"{merged_df['CTR'].mean():.2f}%")
+                    st.metric("CTR Detallado", f"{rate_of_sums(merged_df, 'CTR'):.2f}%")
                 with col4:
                     st.metric("Fuentes de Tráfico", len(merged_df['fuente'].unique()))
                 
                 # Visualizaciones por fuente
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    # Performance por fuente
-                    fig_source_performance = create_source_performance_chart(merged_df, 'CTR Promedio por Fuente de Tráfico')
-                    st.plotly_chart(fig_source_performance, use_container_width=True)
-                
-                with col2:
-                    # Distribución por fuente
-                    fig_source_dist = create_source_distribution(merged_df, 'Distribución de Usuarios por Fuente')
-                    st.plotly_chart(fig_source_dist, use_container_width=True)
+                detail_cube = AggregationCube(merged_df)
+                if show_charts("📊 Mostrar gráficos por fuente", key="show_single_source_charts"):
+                    col1, col2 = st.columns(2)
+                    
+                    with col1:
+                        # Performance por fuente
+                        fig_source_performance = lazy_figure('single_source_performance', detail_cube, lambda: create_source_performance_chart(detail_cube, 'CTR por Fuente de Tráfico'))
+                        st.plotly_chart(fig_source_performance, use_container_width=True)
+                    
+                    with col2:
+                        # Distribución por fuente
+                        fig_source_dist = lazy_figure('single_source_distribution', detail_cube, lambda: create_source_distribution(detail_cube, 'Distribución de Usuarios por Fuente'))
+                        st.plotly_chart(fig_source_dist, use_container_width=True)
                 
                 # Filtro por fuente
                 st.subheader("🔍 Análisis Filtrado por Fuente")
-                available_sources = ['Todas'] + list(merged_df['fuente'].unique())
+                single_index = drill_index('single_source', merged_df, detail_cube)
+                available_sources = ['Todas'] + single_index.values('fuente')
                 selected_source = st.selectbox("Selecciona una fuente específica:", available_sources, key="single_source")
                 
                 if selected_source != 'Todas':
-                    filtered_df = merged_df[merged_df['fuente'] == selected_source]
+                    filtered_df = single_index.rows(fuente=selected_source)
+                    source_summary = single_index.summary(fuente=selected_source)
                     st.write(f"**📊 Análisis específico para: {selected_source}**")
                     
                     col1, col2, col3 = st.columns(3)
                     with col1:
-                        st.metric("Landing Pages", len(filtered_df))
+                        st.metric("Landing Pages", source_summary['rows'])
                     with col2:
-                        st.metric("Total Usuarios", f"{filtered_df['total_users'].sum():,}")
+                        st.metric("Total Usuarios", f"{source_summary['total_users']:,}")
                     with col3:
-                        st.metric("CTR Promedio", f"{filtered_df['CTR'].mean():.2f}%")
+                        st.metric("CTR", f"{source_summary['CTR']:.2f}%")
                     
                     # Tabla detallada por fuente
                     st.write("**Detalle por landing page:**")
-                    source_detail_df = filtered_df[['fuente', 'landing_page', 'total_users', 'cta_clicks', 'CTR']].copy()
-                    source_detail_df.columns = ['Fuente', 'Landing Page', 'Total Usuarios', 'Clicks CTA', 'CTR (%)']
-                    
-                    st.dataframe(
-                        source_detail_df.style.format({
-                            'Total Usuarios': '{:,.0f}',
-                            'Clicks CTA': '{:,.0f}',
-                            'CTR (%)': '{:.2f}%'
-                        }),
-                        use_container_width=True
-                    )
+                    paginated_table(filtered_df, "single_source_table", ['fuente', 'landing_page'] + metric_columns(filtered_df))
 
             # *** INSIGHTS ADICIONALES ***
             st.subheader("🔍 Insights Adicionales")
             
+            # Mejor landing page según el criterio de los rankings y páginas por encima del resto
+            best_page = top_rates(consolidated_df, 'CTR', 1, by_lower_bound).iloc[0]
+            z_vs_rest, p_vs_rest = compare_to_rest(consolidated_df, 'CTR')
+            above_global = consolidated_df['CTR'].to_numpy() > rate_of_sums(consolidated_df, 'CTR')
+            significant_high = int((above_global & (z_vs_rest > 0) & is_significant(p_vs_rest)).sum())
+            
             if has_source_analysis:
                 col1, col2, col3, col4 = st.columns(4)
                 
                 with col1:
                     st.metric(
                         "Mejor CTR Consolidado", 
-                        f"{consolidated_df['CTR'].max():.2f}%",
-                        f"Landing: {consolidated_df.loc[consolidated_df['CTR'].idxmax(), 'landing_page'][:15]}..."
+                        f"{best_page['CTR']:.2f}%",
+                        f"Landing: {str(best_page['landing_page'])[:15]}..."
                     )
                 
                 with col2:
-                    best_source = merged_df.groupby('fuente')['CTR'].mean().idxmax()
-                    best_source_ctr = merged_df.groupby('fuente')['CTR'].mean().max()
+                    best_source = top_rates(detail_cube.summary(['fuente']).reset_index(), 'CTR', 1, by_lower_bound).iloc[0]
                     st.metric(
                         "Mejor Fuente", 
-                        f"{best_source}",
-                        f"{best_source_ctr:.2f}% CTR promedio"
+                        f"{best_source['fuente']}",
+                        f"{best_source['CTR']:.2f}% CTR"
                     )
                 
                 with col3:
@@ -1091,11 +1413,11 @@ def main():
                     )
                 
                 with col4:
-                    high_performers = len(consolidated_df[consolidated_df['CTR'] > consolidated_df['CTR'].mean()])
+                    high_performers = len(consolidated_df[consolidated_df['CTR'] > rate_of_sums(consolidated_df, 'CTR')])
                     st.metric(
-                        "Sobre Promedio", 
+                        "Sobre el CTR Global", 
                         f"{high_performers}",
-                        f"de {len(consolidated_df)} landing pages"
+                        f"de {len(consolidated_df)} landing pages ({significant_high} con diferencia significativa)"
                     )
             else:
                 col1, col2, col3 = st.columns(3)
@@ -1103,8 +1425,8 @@ def main():
                 with col1:
                     st.metric(
                         "Mejor CTR", 
-                        f"{consolidated_df['CTR'].max():.2f}%",
-                        f"Landing: {consolidated_df.loc[consolidated_df['CTR'].idxmax(), 'landing_page'][:20]}..."
+                        f"{best_page['CTR']:.2f}%",
+                        f"Landing: {str(best_page['landing_page'])[:20]}..."
                     )
                 
                 with col2:
@@ -1115,43 +1437,84 @@ def main():
                     )
                 
                 with col3:
-                    high_performers = len(consolidated_df[consolidated_df['CTR'] > consolidated_df['CTR'].mean()])
+                    high_performers = len(consolidated_df[consolidated_df['CTR'] > rate_of_sums(consolidated_df, 'CTR')])
                     st.metric(
-                        "Sobre Promedio", 
+                        "Sobre el CTR Global", 
                         f"{high_performers}",
-                        f"de {len(consolidated_df)} landing pages"
+                        f"de {len(consolidated_df)} landing pages ({significant_high} con diferencia significativa)"
                     )
 
             # *** OPCIONES DE DESCARGA ***
             st.subheader("📥 Descargar Resultados")
             
+            # Los datos solo cambian si cambia alguno de los archivos subidos (o se añade o quita el de formularios)
+            files_version = (file_version(cta_file), file_version(users_file), file_version(forms_file) if forms_file else None)
             if has_source_analysis:
                 col1, col2 = st.columns(2)
                 with col1:
-                    st.download_button(
-                        label="📊 Descargar análisis consolidado como CSV",
-                        data=consolidated_df.to_csv(index=False),
-                        file_name="ctr_analysis_consolidado.csv",
-                        mime="text/csv",
+                    export_controls(
+                        consolidated_df, "export_single_consolidated", "ctr_analysis_consolidado",
+                        "análisis consolidado", files_version,
                         help="Análisis principal consolidado por landing page"
                     )
                 with col2:
-                    st.download_button(
-                        label="🔍 Descargar análisis detallado (con fuentes) como CSV",
-                        data=merged_df.to_csv(index=False),
-                        file_name="ctr_analysis_detallado_fuentes.csv",
-                        mime="text/csv",
+                    export_controls(
+                        merged_df, "export_single_detailed", "ctr_analysis_detallado_fuentes",
+                        "análisis detallado (con fuentes)", files_version,
                         help="Análisis detallado con información de fuentes"
                     )
             else:
-                st.download_button(
-                    label="📥 Descargar resultados como CSV",
-                    data=consolidated_df.to_csv(index=False),
-                    file_name="ctr_analysis_single.csv",
-                    mime="text/csv"
-                )
+                export_controls(consolidated_df, "export_single", "ctr_analysis_single", "resultados", files_version)
             
             st.markdown('</div>', unsafe_allow_html=True)
 
+def show_diagnostics_panel(profiler):
+    """
+    Panel de diagnóstico con las etapas medidas en esta ejecución y la exportación en JSON
+    """
+    st.markdown("---")
+    with st.expander("🩺 Diagnóstico de rendimiento", expanded=True):
+        stages = profiler.report()
+        if len(stages) <= 1:
+            # Solo la ejecución completa: no se leyó ni se calculó nada
+            st.info("No se ejecutó ninguna etapa del pipeline en esta ejecución (sin archivos o con todos los resultados en caché).")
+            return
+        summary = pd.DataFrame(profiler.summary())
+        summary.columns = ['Etapa', 'Llamadas', 'Segundos', 'Filas', 'Pico memoria (MB)']
+        st.write("**Totales por etapa** (de más a menos lenta; las etapas anidadas o en paralelo se solapan):")
+        st.dataframe(summary, use_container_width=True, hide_index=True)
+        
+        detail = pd.DataFrame(stages)
+        # Sangría según el anidamiento para leer la tabla como un árbol de llamadas
+        detail['stage'] = ['\u2003' * depth + stage for depth, stage in zip(detail['depth'], detail['stage'])]
+        detail = detail[['start_s', 'stage', 'detail', 'seconds', 'rows', 'peak_mb', 'thread']]
+        detail.columns = ['Inicio (s)', 'Etapa', 'Detalle', 'Segundos', 'Filas', 'Pico memoria (MB)', 'Hilo']
+        st.write("**Etapas en orden de ejecución:**")
+        st.dataframe(detail, use_container_width=True, hide_index=True)
+        if not profiler.trace_memory:
+            st.caption("Activa «Medir pico de memoria» en la barra lateral para rellenar la columna de memoria.")
+        
+        st.download_button(
+            label="📥 Descargar diagnóstico como JSON",
+            data=profiler.to_json(),
+            file_name=f"diagnostico_ctr_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            mime="application/json"
+        )
+
+def run_with_diagnostics(page):
+    """
+    Ejecuta la página; con el diagnóstico activado en la barra lateral mide sus etapas y muestra el panel al final
+    """
+    st.sidebar.subheader("🩺 Diagnóstico")
+    if not st.sidebar.toggle("Diagnóstico de rendimiento", key="diagnostics_enabled",
+                             help="Mide tiempo, filas y memoria de cada etapa de lectura, merge, agregación y gráficos"):
+        page()
+        return
+    trace_memory = st.sidebar.checkbox("Medir pico de memoria (más lento)", key="diagnostics_trace_memory")
+    with StageProfiler(trace_memory) as profiler:
+        with profile_stage('ejecución completa'):
+            page()
+    show_diagnostics_panel(profiler)
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    run_with_diagnostics(main) 
\ No newline at end of file
@@ -11,6 +11,7 @@ APP_CONFIG = {
 # Configuración de columnas CSV reconocidas
 CSV_COLUMNS = {
     "page_columns": ['page_path', 'pagina', 'url', 'ruta'],
+    "source_columns": ['fuente', 'fuente de la sesión', 'source', 'canal', 'channel', 'medium'],
     "cta_columns": ['cta_clicks', 'clicks', 'clics', 'clicks_cta', 'total de usuarios', 'total_usuarios'],
     "users_columns": ['total_usuarios', 'usuarios', 'total users', 'total de usuarios', 'usuarios únicos', 'usuarios_unicos'],
     "forms_columns": ['form_submit', 'formularios', 'envios', 'formularios_enviados', 'total de usuarios', 'total_usuarios', 'usuarios']
@@ -18,4 +19,87 @@ CSV_COLUMNS = {
 
 # Configuración de meses
 MONTHS = ['enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 
-          'julio', 'agosto', 'septiembre', 'octubre', 'noviembre', 'diciembre'] 
\ No newline at end of file
+          'julio', 'agosto', 'septiembre', 'octubre', 'noviembre', 'diciembre'] 
+
+# Configuración de lectura de CSV
+INGEST_CONFIG = {
+    # Archivos a partir de este tamaño se leen en streaming por bloques
+    "streaming_threshold_mb": 20,
+    # Filas por bloque del parser en modo streaming
+    "chunk_rows": 200_000,
+    # Hilos para leer en paralelo los archivos mensuales
+    "max_workers": 8
+}
+
+# Configuración de la caché de lectura entre reruns
+CACHE_CONFIG = {
+    # Memoria máxima ocupada por los archivos mensuales ya normalizados
+    "parse_cache_max_mb": 512
+}
+
+# Configuración de reducción de datos en los gráficos
+CHART_CONFIG = {
+    # Fuentes que se muestran por separado; el resto se agrupa en "Otros"
+    "top_sources": 10,
+    # A partir de este número de landing pages el scatter se muestra como mapa de densidad
+    "scatter_max_points": 5000,
+    # Celdas por eje del mapa de densidad
+    "scatter_bins": 60
+}
+
+# Almacén local (Parquet) de los meses ya normalizados; requiere pyarrow
+STORE_CONFIG = {
+    "enabled": False,
+    "path": "datos_ctr",
+    # Versiones guardadas por mes (la vigente y las anteriores más recientes); las demás se eliminan
+    "max_versions": 3
+}
+
+# Modo out-of-core para exports muy grandes: lectura por bloques y sumas parciales con memoria acotada
+OUT_OF_CORE_CONFIG = {
+    # Techo de memoria (MB) para los bloques en lectura y los agregados parciales; lo que no cabe se vuelca a disco
+    "memory_limit_mb": 1024,
+    # Estimación de memoria por fila leída (bytes), para dimensionar los bloques
+    "row_bytes_estimate": 300,
+    # En la app se usa automáticamente cuando los archivos subidos suman al menos este tamaño
+    "auto_threshold_mb": 500,
+    # Carpeta para los agregados volcados a disco (None: carpeta temporal del sistema)
+    "spill_dir": None
+}
+
+# Tablas de detalle paginadas en el servidor: solo se envía al navegador la página visible
+TABLE_CONFIG = {
+    "page_size": 50,
+    "page_size_options": [25, 50, 100, 250, 500]
+}
+
+# Exportación de resultados (CSV, CSV gzip, Parquet y Excel)
+EXPORT_CONFIG = {
+    # Filas que se escriben de una vez en el archivo exportado
+    "chunk_rows": 100_000
+}
+
+# Intervalos de confianza y tests de significación de las tasas (CTR y Conversión Efectiva)
+SIGNIFICANCE_CONFIG = {
+    # Nivel de confianza de los intervalos y umbral de los tests (1 - confidence)
+    "confidence": 0.95,
+    # 'wilson' o 'bayes' (posterior Beta con el prior indicado; exacta con scipy, aproximación normal sin él)
+    "method": "wilson",
+    "prior": (1, 1),
+    # Ordenar los rankings por el límite inferior del intervalo en lugar de por la tasa observada
+    "rank_by_lower_bound": True
+}
+
+# Detección de anomalías en la serie mensual de cada landing page (y fuente)
+ANOMALY_CONFIG = {
+    # 'mad' (mediana y desviación absoluta mediana, robusto) o 'zscore' (media y desviación típica)
+    "method": "mad",
+    # Meses anteriores que forman la referencia de cada mes
+    "window": 6,
+    # Meses con datos necesarios en la ventana para evaluar un mes
+    "min_history": 3,
+    # Puntuación absoluta a partir de la cual se genera una alerta
+    "threshold": 3.5,
+    # Usuarios mínimos del mes evaluado (por debajo, las variaciones son sobre todo ruido)
+    "min_users": 100
+}
@@ -0,0 +1,243 @@
+"""
+Benchmarks del pipeline de CTR con exports sintéticos de Google Analytics.
+
+Genera CSV con el formato de GA (líneas de preámbulo, fila de totales, filas cortas sin valor, secciones
+'# ...' tras la tabla, formato de 2 o 3 columnas, delimitador ',' o ';') y mide tiempo y pico de memoria
+de cada etapa (el tiempo sin tracemalloc y el pico en una segunda ejecución con tracemalloc): lectura, ingesta mensual,
+merge/CTR/consolidación (también en modo out-of-core), página de la tabla de detalle, índice de drill-down
+y construcción de gráficos.
+
+Ejemplo:
+    python benchmark.py --pages 5000 --sources 20 --months 12 --layout both --delimiter both
+"""
+import argparse
+import calendar
+import io
+import json
+import logging
+import random
+import time
+import tracemalloc
+
+from analytics_core import (
+    AggregationCube,
+    DrillIndex,
+    analyze_monthly_files,
+    analyze_monthly_files_out_of_core,
+    process_all_monthly_data,
+    read_csv_with_header_detection_and_clean,
+    table_page
+)
+from anomalies import detect_anomalies
+from app_config import TABLE_CONFIG
+from periods import period_label
+from significance import add_rate_intervals, compare_to_rest
+
+SOURCES = ['google', 'facebook', 'instagram', '(direct)', '(not set)', 'bing', 'linkedin', 'newsletter', 'tiktok', 'youtube']
+
+# Proporción de filas seguidas de una fila corta sin valor, como las que aparecen en los exports reales
+SHORT_ROW_RATE = 0.01
+
+class SyntheticUpload(io.BytesIO):
+    """
+    Imita el UploadedFile de Streamlit (BytesIO con name y size)
+    """
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+        self.size = len(data)
+
+def generate_ga_csv(n_pages, n_sources, with_source=True, delimiter=',', metric='Total de usuarios', seed=0, fill_rate=0.7, period='2024-01'):
+    """
+    Genera un export sintético de GA con preámbulo, fila de totales, una fila por página (y fuente) y,
+    como en los exports reales, algunas filas cortas sin valor y una sección '# ...' después de la tabla
+    """
+    rng = random.Random(seed)
+    year, month = (int(part) for part in period.split('-'))
+    out = io.StringIO()
+    out.write("# ----------------------------------------\n")
+    out.write("# Landing pages\n")
+    out.write(f"# Fecha de inicio: {year:04d}{month:02d}01\n")
+    out.write(f"# Fecha de finalización: {year:04d}{month:02d}{calendar.monthrange(year, month)[1]:02d}\n")
+    out.write("# ----------------------------------------\n\n")
+    sources = [SOURCES[i] if i < len(SOURCES) else f'utm_source_{i}' for i in range(n_sources)]
+    rows = []
+    for page in range(n_pages):
+        for source in (sources if with_source else [None]):
+            if rng.random() > fill_rate:
+                continue
+            value = str(int(rng.paretovariate(1.2) * 10))
+            row = [source, f"/landing-{page}", value] if with_source else [f"/landing-{page}", value]
+            rows.append(delimiter.join(row))
+            if rng.random() < SHORT_ROW_RATE:
+                # Fila sin el campo de valor: el lector la descarta
+                rows.append(delimiter.join(row[:-1]).replace('/landing-', '/sin-valor-'))
+    total = ['', 'Total', '0'] if with_source else ['Totales', '0']
+    header = ['Fuente de la sesión', 'page_path', metric] if with_source else ['page_path', metric]
+    out.write(delimiter.join(header) + "\n")
+    out.write(delimiter.join(total) + "\n")
+    out.write("\n".join(rows) + "\n")
+    out.write("\n# ----------------------------------------\n# Serie temporal\n# ----------------------------------------\n")
+    return out.getvalue().encode('utf-8')
+
+def generate_monthly_uploads(n_pages, n_sources, n_months, with_source=True, delimiter=',', start_year=2024):
+    """
+    Genera los uploads mensuales de CTA y usuarios para n_months periodos consecutivos desde enero de start_year
+    """
+    monthly_cta_files = {}
+    monthly_users_files = {}
+    for i in range(n_months):
+        period = period_label(start_year + i // 12, i % 12 + 1)
+        monthly_cta_files[period] = SyntheticUpload(
+            generate_ga_csv(n_pages, n_sources, with_source, delimiter, metric='clicks', seed=i, period=period), f"cta_{period}.csv")
+        monthly_users_files[period] = SyntheticUpload(
+            generate_ga_csv(n_pages, n_sources, with_source, delimiter, seed=100 + i, period=period), f"users_{period}.csv")
+    return monthly_cta_files, monthly_users_files
+
+def measure(func, *args, **kwargs):
+    """
+    Ejecuta func dos veces y devuelve (resultado, segundos, pico de memoria en MB). El tiempo se toma en la
+    primera ejecución, sin tracemalloc, que multiplica el coste de las asignaciones de pandas y NumPy;
+    el pico, en la segunda. func no debe reutilizar lo que la primera ejecución deje en caché.
+    """
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        result = func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+def _build_charts(app, analysis):
+    """
+    Construye los mismos gráficos que el análisis temporal de la app
+    """
+    consolidated_cube = AggregationCube(analysis['consolidated_data'])
+    detail_cube = analysis['detail_cube']
+    figures = [
+        app.create_trend_chart(consolidated_cube, 'CTR', 'trend'),
+        app.create_monthly_volume_chart(consolidated_cube, 'volume'),
+        app.create_heatmap(consolidated_cube, 'CTR', 'heatmap'),
+        app.create_gauge_chart(consolidated_cube.overall_rate('CTR'), 'gauge'),
+        app.create_top_performers_chart(analysis['consolidated_data'], 'CTR', 'top'),
+        app.create_scatter_plot(analysis['consolidated_data'], 'scatter')
+    ]
+    if analysis['has_source_analysis']:
+        figures += [
+            app.create_source_trend_chart(detail_cube, 'CTR', 'source trend'),
+            app.create_source_performance_chart(detail_cube, 'source performance'),
+            app.create_source_distribution(detail_cube, 'source distribution'),
+            app.create_source_heatmap(detail_cube, 'CTR', 'source heatmap')
+        ]
+    # Serializar como lo haría st.plotly_chart
+    return sum(len(fig.to_json()) for fig in figures) / 1024
+
+def run_scenario(n_pages, n_sources, n_months, with_source, delimiter, include_charts=True, memory_limit_mb=None):
+    """
+    Mide cada etapa para un escenario y devuelve la lista de resultados
+    """
+    monthly_cta_files, monthly_users_files = generate_monthly_uploads(n_pages, n_sources, n_months, with_source, delimiter)
+    scenario = {
+        'layout': '3 columnas' if with_source else '2 columnas',
+        'delimiter': delimiter,
+        'pages': n_pages,
+        'sources': n_sources if with_source else 1,
+        'months': n_months,
+        'input_mb': round(sum(f.size for f in monthly_users_files.values()) / 1024 / 1024, 2)
+    }
+    results = []
+
+    def record(stage, elapsed, peak, rows, payload_kb=None):
+        results.append(dict(scenario, stage=stage, seconds=round(elapsed, 4), peak_mb=round(peak, 2), rows=rows,
+                            payload_kb=round(payload_kb, 1) if payload_kb is not None else None))
+
+    first_file = next(iter(monthly_users_files.values()))
+    (df, _), elapsed, peak = measure(read_csv_with_header_detection_and_clean, first_file)
+    record('read (1 archivo)', elapsed, peak, len(df))
+
+    monthly_results, elapsed, peak = measure(
+        process_all_monthly_data, {'cta': monthly_cta_files, 'users': monthly_users_files})
+    record('ingesta mensual', elapsed, peak, sum(len(r[0]) for r in monthly_results.values()))
+
+    analysis, elapsed, peak = measure(
+        analyze_monthly_files, monthly_cta_files, monthly_users_files)
+    record('pipeline completo (ingesta + merge + CTR)', elapsed, peak, len(analysis['merged_monthly']))
+
+    out_of_core, elapsed, peak = measure(
+        analyze_monthly_files_out_of_core, monthly_cta_files, monthly_users_files, memory_limit_mb=memory_limit_mb)
+    record('pipeline out-of-core', elapsed, peak, len(out_of_core['merged_monthly']))
+
+    # Lo que hace la app en cada rerun con la tabla de detalle: ordenar y recortar una página
+    _, elapsed, peak = measure(table_page, analysis['merged_monthly'], 1, TABLE_CONFIG['page_size'], 'CTR', False)
+    record('tabla de detalle (1 página)', elapsed, peak, len(analysis['merged_monthly']))
+
+    # Filtro por fuente (o por landing page sin fuentes): la primera selección construye el índice, las demás lo consultan
+    def new_index():
+        return DrillIndex(analysis['merged_monthly'], analysis['detail_cube'])
+    index = new_index()
+    dim = 'fuente' if 'fuente' in index.dims else 'landing_page'
+    selection = {dim: index.values(dim)[0]}
+    # Un índice nuevo en cada ejecución, para medir siempre la construcción
+    rows, elapsed, peak = measure(lambda: new_index().rows(**selection))
+    record('drill-down (construcción del índice)', elapsed, peak, len(analysis['merged_monthly']))
+    index.rows(**selection)
+    rows, elapsed, peak = measure(index.rows, **selection)
+    record('drill-down (1 selección)', elapsed, peak, len(rows))
+
+    # Intervalos y tests de todas las celdas landing page × mes (× fuente) en una pasada sobre los recuentos
+    cells = analysis['detail_cube'].cells
+    _, elapsed, peak = measure(lambda: (add_rate_intervals(cells.copy()), compare_to_rest(cells, 'CTR')))
+    record('intervalos de confianza y tests', elapsed, peak, len(cells))
+
+    # Alertas de anomalías sobre todas las series landing page (× fuente) × mes
+    alerts, elapsed, peak = measure(detect_anomalies, analysis['detail_cube'], 'CTR')
+    record('detección de anomalías', elapsed, peak, len(cells))
+
+    if include_charts:
+        # Importación diferida y fuera de la medición: app.py arranca Streamlit al importarse
+        import app
+        payload_kb, elapsed, peak = measure(_build_charts, app, analysis)
+        record('gráficos', elapsed, peak, len(analysis['merged_monthly']), payload_kb)
+    return results
+
+def print_report(results):
+    columns = ['layout', 'delimiter', 'pages', 'sources', 'months', 'input_mb', 'stage', 'seconds', 'peak_mb', 'rows', 'payload_kb']
+    widths = {col: max(len(col), *(len(str(r[col])) for r in results)) for col in columns}
+    print("  ".join(col.ljust(widths[col]) for col in columns))
+    for r in results:
+        print("  ".join(('' if r[col] is None else str(r[col])).ljust(widths[col]) for col in columns))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del pipeline de CTR con exports sintéticos de GA")
+    parser.add_argument('--pages', type=int, default=2000, help="Landing pages distintas por archivo")
+    parser.add_argument('--sources', type=int, default=10, help="Fuentes de tráfico distintas (formato de 3 columnas)")
+    parser.add_argument('--months', type=int, default=12, help="Meses consecutivos a generar (2 o más; pueden abarcar varios años)")
+    parser.add_argument('--layout', choices=['2', '3', 'both'], default='both', help="Formato de columnas del export")
+    parser.add_argument('--delimiter', choices=[',', ';', 'both'], default='both', help="Delimitador del CSV")
+    parser.add_argument('--memory-limit-mb', type=int, default=None, help="Techo de memoria del pipeline out-of-core")
+    parser.add_argument('--no-charts', action='store_true', help="No medir la construcción de gráficos")
+    parser.add_argument('--json', help="Ruta donde guardar los resultados en JSON")
+    args = parser.parse_args(argv)
+    if args.months < 2:
+        parser.error("--months debe ser al menos 2")
+
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    layouts = {'2': [False], '3': [True], 'both': [False, True]}[args.layout]
+    delimiters = [',', ';'] if args.delimiter == 'both' else [args.delimiter]
+
+    results = []
+    for with_source in layouts:
+        for delimiter in delimiters:
+            results += run_scenario(args.pages, args.sources, args.months, with_source, delimiter, not args.no_charts, args.memory_limit_mb)
+
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Carga masiva del análisis temporal: varios CSV o archivos ZIP en un solo paso.
+
+Cada archivo se clasifica como clicks CTA, usuarios o formularios enviados y se asigna a un periodo año-mes
+a partir del nombre (o de la ruta dentro del ZIP), del preámbulo que añade Google Analytics
+("# Fecha de inicio: 20240101") o de los nombres de columnas, sin parsear el cuerpo del CSV.
+"""
+import io
+import re
+import zipfile
+from pathlib import PurePosixPath
+
+from analytics_core import read_ga_preamble
+from column_schema import ALIASES, normalize_column_name
+from periods import parse_period, period_display, period_label
+
+DATA_TYPES = ['cta', 'forms', 'users']
+TYPE_LABELS = {'cta': 'Clicks CTA', 'forms': 'Formularios', 'users': 'Usuarios'}
+
+# Pistas en nombres de archivo y preámbulo; las de CTA y formularios tienen prioridad porque esos
+# exports suelen llamarse "usuarios que hicieron click en el CTA" o "usuarios que enviaron el formulario"
+TYPE_HINTS = {
+    'cta': ['cta', 'click', 'clic'],
+    'forms': ['form', 'envio', 'lead'],
+    'users': ['usuario', 'user', 'visita']
+}
+
+# Columnas que solo aparecen en un tipo de export (los formularios también aceptan
+# las columnas de usuarios como alternativa, así que esas siguen indicando usuarios)
+TYPE_COLUMNS = {
+    'cta': ALIASES['cta'] - ALIASES['users'] - ALIASES['forms'],
+    'forms': ALIASES['forms'] - ALIASES['users'] - ALIASES['cta'],
+    'users': ALIASES['users'] - ALIASES['cta']
+}
+
+PREAMBLE_DATE_PATTERNS = {
+    'start': re.compile(r'(?:fecha de inicio|start date)\s*:\s*(\d{4})(\d{2})(\d{2})', re.IGNORECASE),
+    'end': re.compile(r'(?:fecha de finalizaci[oó]n|end date)\s*:\s*(\d{4})(\d{2})(\d{2})', re.IGNORECASE)
+}
+
+class UploadMember(io.BytesIO):
+    """
+    Archivo extraído de un ZIP con la misma interfaz que un UploadedFile (BytesIO con name y size)
+    """
+    def __init__(self, data, name, file_id=None):
+        super().__init__(data)
+        self.name = name
+        self.size = len(data)
+        if file_id is not None:
+            # Versión estable entre reruns sin volver a calcular el hash del contenido
+            self.file_id = file_id
+
+def iter_upload_files(uploads):
+    """
+    Recorre los archivos subidos expandiendo los ZIP miembro a miembro (solo los .csv)
+    """
+    for upload in uploads:
+        if not upload.name.lower().endswith('.zip'):
+            yield upload
+            continue
+        upload.seek(0)
+        upload_id = getattr(upload, 'file_id', None)
+        with zipfile.ZipFile(upload) as archive:
+            for info in archive.infolist():
+                path = PurePosixPath(info.filename)
+                if info.is_dir() or path.suffix.lower() != '.csv' or '__MACOSX' in path.parts or path.name.startswith('.'):
+                    continue
+                with archive.open(info) as member:
+                    yield UploadMember(member.read(), f"{upload.name}/{info.filename}",
+                                       f"{upload_id}/{info.filename}" if upload_id else None)
+        upload.seek(0)
+
+def _tokens(text):
+    return re.split(r'[^a-z0-9ñ]+', text.lower())
+
+def _type_from_text(text):
+    tokens = _tokens(text)
+    for data_type in DATA_TYPES:
+        if any(token.startswith(hint) for token in tokens for hint in TYPE_HINTS[data_type]):
+            return data_type
+    return None
+
+def classify_data_type(name, preamble, header_line):
+    """
+    Tipo de datos ('cta', 'forms' o 'users') según el nombre, el preámbulo o las columnas; None si es ambiguo
+    """
+    data_type = _type_from_text(PurePosixPath(name).name) or _type_from_text(name) or _type_from_text(' '.join(preamble))
+    if data_type is not None or header_line is None:
+        return data_type
+    columns = {normalize_column_name(col) for col in re.split(r'[,;]', header_line)}
+    matches = [data_type for data_type in DATA_TYPES if columns & TYPE_COLUMNS[data_type]]
+    return matches[0] if len(matches) == 1 else None
+
+def _preamble_dates(preamble):
+    text = '\n'.join(preamble)
+    return {key: pattern.search(text) for key, pattern in PREAMBLE_DATE_PATTERNS.items()}
+
+def period_from_preamble(preamble):
+    """
+    Periodo 'YYYY-MM' según las fechas del preámbulo de GA, si el rango cae dentro de un único mes
+    """
+    dates = _preamble_dates(preamble)
+    if dates['start'] is None:
+        return None
+    start = dates['start'].groups()[:2]
+    if dates['end'] is not None and dates['end'].groups()[:2] != start:
+        return None
+    return period_label(*start)
+
+def period_for_file(name, preamble, default_year=None):
+    """
+    Periodo de un archivo: el mes del nombre si lo indica (con el año del nombre, del preámbulo
+    o default_year, en ese orden) y, si el nombre no dice nada, las fechas del preámbulo
+    """
+    start = _preamble_dates(preamble)['start']
+    year = int(start.group(1)) if start is not None else default_year
+    return parse_period(name, year) or period_from_preamble(preamble)
+
+def classify_files(files, default_year=None, data_type=None, assigned=None):
+    """
+    Clasifica los archivos por tipo de datos y periodo (ver period_for_file). Con data_type se fuerza
+    el tipo (uploaders por tipo) y con assigned se acumula sobre una clasificación previa.
+    Devuelve ({'cta': {periodo: archivo}, 'forms': {...}, 'users': {...}} en orden cronológico, [(nombre, motivo)] ignorados).
+    """
+    assigned = assigned if assigned is not None else {dt: {} for dt in DATA_TYPES}
+    skipped = []
+    for file in files:
+        preamble, header_line = read_ga_preamble(file)
+        if header_line is None:
+            skipped.append((file.name, "no parece un export de Google Analytics (sin fila de encabezados)"))
+            continue
+        file_type = data_type or classify_data_type(file.name, preamble, header_line)
+        if file_type is None:
+            skipped.append((file.name, "no se pudo saber si son clicks CTA, usuarios o formularios"))
+            continue
+        period = period_for_file(file.name, preamble, default_year)
+        if period is None:
+            skipped.append((file.name, "no se pudo deducir el mes"))
+        elif period in assigned[file_type]:
+            skipped.append((file.name, f"ya hay un archivo de {TYPE_LABELS[file_type]} para {period_display(period)}"))
+        else:
+            assigned[file_type][period] = file
+    return {dt: dict(sorted(periods.items())) for dt, periods in assigned.items()}, skipped
@@ -0,0 +1,198 @@
+"""
+Línea de comandos para ejecutar el análisis temporal de CTR sin Streamlit.
+
+Cada CSV se asigna a un periodo año-mes según su nombre (cta_2024-01.csv, usuarios_enero_2024.csv;
+con --year, también usuarios_enero.csv).
+
+Uso con una cuenta:
+    python cli.py --cta-dir datos/cta --users-dir datos/usuarios --output-dir salida
+
+Uso por lotes (cada subcarpeta de la raíz es una cuenta con carpetas cta/ y users/, y opcionalmente forms/):
+    python cli.py --batch clientes/ --output-dir salida
+
+Con --forms-dir (o una carpeta forms/ en lote) se calcula también la Conversión Efectiva:
+    python cli.py --cta-dir datos/cta --users-dir datos/usuarios --forms-dir datos/formularios --output-dir salida
+
+Con --store los meses normalizados se guardan en Parquet y con --from-store se reabren sin leer los CSV:
+    python cli.py --cta-dir datos/cta --users-dir datos/usuarios --store almacen --output-dir salida
+    python cli.py --from-store --store almacen --output-dir salida
+
+Para exports muy grandes, --out-of-core lee por bloques y agrega con un techo de memoria:
+    python cli.py --cta-dir datos/cta --users-dir datos/usuarios --out-of-core --memory-limit-mb 512 --output-dir salida
+
+Si algún mes de una landing page (y fuente) se desvía de forma anómala de los meses anteriores de su serie,
+se escribe también alertas_anomalias_ctr_{fecha} (y alertas_anomalias_conversion_{fecha} con formularios).
+
+Con --format se elige el formato de los resultados (csv, csv.gz, parquet o xlsx):
+    python cli.py --cta-dir datos/cta --users-dir datos/usuarios --output-dir salida --format parquet
+
+Con --profile se guarda en JSON el tiempo, las filas y (con --profile-memory) el pico de memoria de cada etapa:
+    python cli.py --cta-dir datos/cta --users-dir datos/usuarios --output-dir salida --profile diagnostico.json
+"""
+import argparse
+import logging
+import sys
+from contextlib import ExitStack
+from datetime import datetime
+from pathlib import Path
+
+from analytics_core import RATE_NUMERATORS, analyze_monthly_files, analyze_monthly_files_out_of_core, analyze_stored_months
+from anomalies import detect_anomalies
+from dataset_store import DatasetStore
+from exports import EXPORT_FORMATS, export_file_name, write_export
+from periods import assign_periods
+from profiling import StageProfiler, profile_stage
+
+logger = logging.getLogger('ctr_cli')
+
+def find_monthly_files(directory, default_year=None):
+    """
+    Asigna cada CSV de la carpeta a su periodo año-mes según el nombre del archivo, en orden cronológico
+    """
+    monthly_files, skipped = assign_periods(sorted(Path(directory).glob('*.csv')), default_year)
+    for path, reason in skipped:
+        logger.warning("Se ignora %s: %s", path, reason)
+    return monthly_files
+
+def run_account(cta_dir, users_dir, output_dir, max_workers=None, store=None, from_store=False, default_year=None,
+                out_of_core=False, memory_limit_mb=None, fmt='csv', forms_dir=None):
+    """
+    Procesa una cuenta y escribe los mismos archivos que los botones de descarga de la app, en el formato fmt.
+    Con forms_dir (CSV mensuales de formularios enviados) se añade la Conversión Efectiva.
+    Con from_store se analiza el historial guardado en el store en lugar de los CSV y con out_of_core
+    se usa el modo de memoria acotada.
+    Devuelve la lista de archivos escritos.
+    """
+    if from_store:
+        analysis = analyze_stored_months(store)
+    else:
+        cta_paths = find_monthly_files(cta_dir, default_year)
+        users_paths = find_monthly_files(users_dir, default_year)
+        forms_paths = find_monthly_files(forms_dir, default_year) if forms_dir else {}
+        complete_months = [month for month in users_paths if month in cta_paths]
+        if len(complete_months) < 2:
+            raise ValueError(f"Se necesitan datos completos de al menos 2 meses (encontrados: {len(complete_months)})")
+
+        with ExitStack() as stack:
+            monthly_cta_files = {month: stack.enter_context(open(path, 'rb')) for month, path in cta_paths.items()}
+            monthly_users_files = {month: stack.enter_context(open(path, 'rb')) for month, path in users_paths.items()}
+            monthly_forms_files = {month: stack.enter_context(open(path, 'rb')) for month, path in forms_paths.items()}
+            if out_of_core:
+                analysis = analyze_monthly_files_out_of_core(monthly_cta_files, monthly_users_files, memory_limit_mb=memory_limit_mb,
+                                                             monthly_forms_files=monthly_forms_files)
+            else:
+                analysis = analyze_monthly_files(monthly_cta_files, monthly_users_files, max_workers=max_workers, store=store,
+                                                 monthly_forms_files=monthly_forms_files)
+
+    if analysis is None:
+        raise ValueError("No se pudieron leer datos de clicks CTA y de usuarios")
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    date_suffix = datetime.now().strftime('%Y%m%d')
+    written = []
+
+    def export(df, base_name):
+        path = output_dir / export_file_name(base_name, fmt)
+        with profile_stage('exportación', path.name) as stage:
+            write_export(df, fmt, path)
+            stage['rows'] = len(df)
+        written.append(path)
+
+    export(analysis['consolidated_data'], f"analisis_consolidado_ctr_{date_suffix}")
+    if analysis['has_source_analysis']:
+        export(analysis['merged_monthly'], f"analisis_detallado_con_fuentes_{date_suffix}")
+
+    unmatched = analysis['unmatched']
+    if unmatched['users']:
+        logger.info("%d filas de usuarios sin clicks CTA (CTR 0)", unmatched['users'])
+    if len(unmatched['cta']):
+        # Clicks que el left join deja fuera del CTR
+        export(unmatched['cta'], f"clicks_cta_sin_usuarios_{date_suffix}")
+        logger.warning("%d filas de clicks CTA (%d clicks) sin correspondencia en usuarios",
+                       len(unmatched['cta']), unmatched['cta']['cta_clicks'].sum())
+    if len(unmatched.get('forms', [])):
+        # Envíos de formularios que no entran en la Conversión Efectiva
+        export(unmatched['forms'], f"formularios_sin_usuarios_{date_suffix}")
+        logger.warning("%d filas de formularios (%d envíos) sin correspondencia en usuarios",
+                       len(unmatched['forms']), unmatched['forms']['form_submissions'].sum())
+    if len(unmatched.get('forms_over_users', [])):
+        # Filas cuya Conversión Efectiva se acota al 100%
+        export(unmatched['forms_over_users'], f"formularios_sobre_usuarios_{date_suffix}")
+        logger.warning("%d filas con más formularios que usuarios (Conversión Efectiva acotada al 100%%)",
+                       len(unmatched['forms_over_users']))
+
+    # Meses anómalos de cada serie landing page (× fuente), de mayor a menor desviación
+    detail_cube = analysis['detail_cube']
+    for metric, label in [('CTR', 'ctr'), ('conversion_rate', 'conversion')]:
+        if RATE_NUMERATORS[metric] not in detail_cube.cells.columns:
+            continue
+        alerts = detect_anomalies(detail_cube, metric)
+        if len(alerts):
+            export(alerts, f"alertas_anomalias_{label}_{date_suffix}")
+            logger.warning("%d alertas de anomalías de %s (%d caídas)", len(alerts), metric, (alerts['direction'] == 'caída').sum())
+    return written
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Análisis temporal de CTR por landing page a partir de exports de Google Analytics")
+    parser.add_argument('--cta-dir', help="Carpeta con los CSV mensuales de clicks CTA")
+    parser.add_argument('--users-dir', help="Carpeta con los CSV mensuales de usuarios")
+    parser.add_argument('--forms-dir', help="Carpeta con los CSV mensuales de formularios enviados (opcional, para la Conversión Efectiva)")
+    parser.add_argument('--batch', help="Carpeta raíz con una subcarpeta por cuenta (cada una con cta/ y users/)")
+    parser.add_argument('--output-dir', required=True, help="Carpeta donde se escriben los resultados")
+    parser.add_argument('--year', type=int, default=None, help="Año de los archivos cuyo nombre solo indica el mes")
+    parser.add_argument('--workers', type=int, default=None, help="Hilos para leer los archivos mensuales")
+    parser.add_argument('--store', help="Carpeta del almacén Parquet de meses normalizados (en lote, una subcarpeta por cuenta)")
+    parser.add_argument('--from-store', action='store_true', help="Analizar el historial guardado en --store sin leer CSV")
+    parser.add_argument('--out-of-core', action='store_true', help="Leer por bloques y agregar con memoria acotada (exports muy grandes)")
+    parser.add_argument('--memory-limit-mb', type=int, default=None, help="Techo de memoria del modo --out-of-core (por defecto, el de app_config)")
+    parser.add_argument('--format', dest='fmt', choices=list(EXPORT_FORMATS), default='csv',
+                        help="Formato de los resultados (parquet requiere pyarrow; xlsx, xlsxwriter u openpyxl)")
+    parser.add_argument('--profile', help="Ruta del JSON con el diagnóstico de rendimiento por etapa")
+    parser.add_argument('--profile-memory', action='store_true', help="Medir también el pico de memoria de cada etapa (más lento)")
+    args = parser.parse_args(argv)
+    if args.out_of_core and (args.store or args.from_store):
+        parser.error("--out-of-core no usa el almacén; quita --store/--from-store")
+    if args.profile_memory and not args.profile:
+        parser.error("--profile-memory requiere --profile")
+    if args.from_store and not args.store:
+        parser.error("--from-store requiere --store")
+    if not args.batch and not args.from_store and not (args.cta_dir and args.users_dir):
+        parser.error("indica --batch o bien --cta-dir y --users-dir")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(message)s')
+
+    if args.batch:
+        accounts = [(path.name, path / 'cta', path / 'users', path / 'forms' if (path / 'forms').is_dir() else None)
+                    for path in sorted(Path(args.batch).iterdir()) if path.is_dir()]
+    else:
+        accounts = [(None, args.cta_dir, args.users_dir, args.forms_dir)]
+
+    failed = 0
+    with ExitStack() as stack:
+        profiler = stack.enter_context(StageProfiler(args.profile_memory)) if args.profile else None
+        for account, cta_dir, users_dir, forms_dir in accounts:
+            output_dir = Path(args.output_dir) / account if account else Path(args.output_dir)
+            try:
+                store = None
+                if args.store:
+                    store = DatasetStore(Path(args.store) / account if account else args.store)
+                with profile_stage('cuenta', account):
+                    written = run_account(cta_dir, users_dir, output_dir, args.workers, store, args.from_store, args.year,
+                                          args.out_of_core, args.memory_limit_mb, args.fmt, forms_dir)
+                for path in written:
+                    logger.info("%s: escrito %s", account or 'cuenta', path)
+            except Exception as e:
+                failed += 1
+                logger.error("%s: %s", account or 'cuenta', e)
+    
+    if profiler is not None:
+        Path(args.profile).write_text(profiler.to_json(), encoding='utf-8')
+        logger.info("Diagnóstico de rendimiento escrito en %s", args.profile)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Resolución de las columnas de los exports de GA a partir de app_config.CSV_COLUMNS.
+
+Las listas de alias se compilan una sola vez al importar el módulo en tablas de solo lectura
+(alias → papeles: página, fuente, clicks CTA, usuarios o formularios). Resolver un encabezado recorre
+sus columnas una sola vez y el resultado se guarda por firma del encabezado (nombres normalizados y
+tipo de datos), así que los exports repetidos con el mismo formato no vuelven a buscar columnas.
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+from types import MappingProxyType
+
+from app_config import CSV_COLUMNS
+
+# Lista de CSV_COLUMNS con los alias de cada papel; los de valor se llaman como el tipo de datos
+ROLE_COLUMNS = {
+    'page': 'page_columns',
+    'source': 'source_columns',
+    'cta': 'cta_columns',
+    'users': 'users_columns',
+    'forms': 'forms_columns'
+}
+VALUE_ROLES = ['cta', 'users', 'forms']
+
+# Encabezados distintos que se recuerdan ya resueltos
+SCHEMA_CACHE_SIZE = 256
+
+ColumnSchema = namedtuple('ColumnSchema', ['page', 'source', 'value'])
+
+def normalize_column_name(name):
+    return str(name).strip().lower()
+
+def _compile_column_roles(csv_columns):
+    roles = {}
+    for role, key in ROLE_COLUMNS.items():
+        for alias in csv_columns[key]:
+            roles.setdefault(normalize_column_name(alias), set()).add(role)
+    return MappingProxyType({alias: frozenset(alias_roles) for alias, alias_roles in roles.items()})
+
+# Papeles de cada alias; un mismo alias puede servir para varios tipos (p. ej. 'total de usuarios')
+COLUMN_ROLES = _compile_column_roles(CSV_COLUMNS)
+
+# Alias de cada papel
+ALIASES = MappingProxyType({
+    role: frozenset(alias for alias, alias_roles in COLUMN_ROLES.items() if role in alias_roles)
+    for role in ROLE_COLUMNS
+})
+
+# Detecta la fila de encabezados por los alias de página
+HEADER_PATTERN = re.compile('|'.join(re.escape(alias) for alias in sorted(ALIASES['page'])), re.IGNORECASE)
+
+def has_source_column(header):
+    """
+    Indica si un encabezado (ya normalizado) corresponde al formato de 3 columnas con fuente
+    """
+    return len(header) >= 3 and any(col in ALIASES['source'] for col in header)
+
+@lru_cache(maxsize=SCHEMA_CACHE_SIZE)
+def _resolve(header, data_type):
+    found = {}
+    wanted = ('page', 'source', data_type)
+    # Gana la primera columna del encabezado con cada papel
+    for col in header:
+        for role in COLUMN_ROLES.get(col, ()):
+            if role in wanted:
+                found.setdefault(role, col)
+    return ColumnSchema(found.get('page'), found.get('source'), found.get(data_type))
+
+def resolve_columns(columns, data_type):
+    """
+    Columnas de página, fuente y valor de un export de tipo data_type ('cta', 'users' o 'forms').
+    Los campos que no se encuentran quedan en None.
+    """
+    if data_type not in VALUE_ROLES:
+        raise ValueError(f"Tipo de datos desconocido: {data_type}")
+    return _resolve(tuple(normalize_column_name(col) for col in columns), data_type)
+
+def schema_cache_info():
+    """
+    Aciertos, fallos y tamaño de la caché de encabezados resueltos
+    """
+    return _resolve.cache_info()
@@ -0,0 +1,140 @@
+"""
+Almacén local en formato columnar (Parquet) de los archivos mensuales ya normalizados.
+
+Cada archivo se guarda con la forma de month_df tras la limpieza (fuente, landing_page y
+cta_clicks/total_users), en {raíz}/{tipo de datos}/{mes}/{hash del contenido}.parquet,
+para no volver a parsear el mismo export de GA y poder reabrir el historial sin los CSV.
+
+La versión vigente de cada mes no se deduce de las fechas de los archivos: {mes}/versions.json guarda
+los hashes de sus versiones, la vigente primero. Se actualiza de forma atómica cada vez que un mes se
+guarda o se vuelve a usar una versión ya guardada, y solo se conservan las STORE_CONFIG['max_versions']
+más recientes. Requiere pyarrow.
+"""
+import json
+import os
+import uuid
+from pathlib import Path
+
+import pandas as pd
+
+from app_config import STORE_CONFIG
+from profiling import profile_stage
+
+HAS_SOURCE_KEY = b'ctr_has_source'
+VERSIONS_FILE = 'versions.json'
+
+def _write_atomic(path, write):
+    # Escribe en un temporal del mismo directorio y lo renombra: otro proceso nunca ve un archivo a medias
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+class DatasetStore:
+    """
+    Almacén Parquet de meses normalizados, indexado por tipo de datos, mes y hash del contenido
+    """
+    def __init__(self, root, max_versions=None):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise ImportError("El almacén de datos requiere pyarrow (pip install pyarrow)") from e
+        self.root = Path(root)
+        self.max_versions = max(1, max_versions or STORE_CONFIG['max_versions'])
+
+    def path(self, data_type, month, content_hash):
+        return self.root / data_type / month / f"{content_hash}.parquet"
+
+    def versions(self, data_type, month):
+        """
+        Hashes de las versiones guardadas de un mes, de la vigente a la más antigua
+        """
+        month_dir = self.root / data_type / month
+        try:
+            return json.loads((month_dir / VERSIONS_FILE).read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            # Almacenes escritos antes de versions.json: se toma la última versión escrita
+            stored = sorted(month_dir.glob('*.parquet'), key=lambda p: p.stat().st_mtime, reverse=True)
+            return [p.stem for p in stored]
+
+    def _write_versions(self, data_type, month, versions):
+        path = self.root / data_type / month / VERSIONS_FILE
+        _write_atomic(path, lambda tmp_path: tmp_path.write_text(json.dumps(versions), encoding='utf-8'))
+
+    def set_current(self, data_type, month, content_hash):
+        """
+        Marca una versión ya guardada como la vigente del mes. Devuelve False si esa versión no está guardada.
+        """
+        if not self.path(data_type, month, content_hash).exists():
+            return False
+        versions = self.versions(data_type, month)
+        if versions[:1] != [content_hash]:
+            self._write_versions(data_type, month, [content_hash] + [v for v in versions if v != content_hash])
+        return True
+
+    def get(self, data_type, month, content_hash):
+        """
+        Devuelve (month_df, has_source) si el archivo ya está guardado, o None.
+        Un acierto hace que esa versión vuelva a ser la vigente del mes.
+        """
+        import pyarrow.parquet as pq
+        if not self.set_current(data_type, month, content_hash):
+            return None
+        table = pq.read_table(self.path(data_type, month, content_hash), memory_map=True)
+        metadata = table.schema.metadata or {}
+        return table.to_pandas(), metadata.get(HAS_SOURCE_KEY) == b'1'
+
+    def put(self, data_type, month, content_hash, month_df, has_source):
+        """
+        Guarda un mes normalizado como su versión vigente y elimina las versiones que pasan de max_versions.
+        Las escrituras son atómicas para que otro proceso nunca lea un archivo a medias.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        path = self.path(data_type, month, content_hash)
+        table = pa.Table.from_pandas(month_df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[HAS_SOURCE_KEY] = b'1' if has_source else b'0'
+        table = table.replace_schema_metadata(metadata)
+        _write_atomic(path, lambda tmp_path: pq.write_table(table, tmp_path))
+
+        versions = [content_hash] + [v for v in self.versions(data_type, month) if v != content_hash]
+        self._write_versions(data_type, month, versions[:self.max_versions])
+        for superseded in versions[self.max_versions:]:
+            self.path(data_type, month, superseded).unlink(missing_ok=True)
+
+    def months(self, data_type):
+        """
+        {mes: ruta de la versión vigente} para un tipo de datos
+        """
+        current = {}
+        base = self.root / data_type
+        if not base.exists():
+            return current
+        for month_dir in base.iterdir():
+            paths = (self.path(data_type, month_dir.name, v) for v in self.versions(data_type, month_dir.name))
+            path = next((p for p in paths if p.exists()), None)
+            if path is not None:
+                current[month_dir.name] = path
+        return current
+
+    def load(self, data_type, months=None):
+        """
+        Lee la versión vigente de cada mes guardado y devuelve (DataFrame con columna mes, has_source),
+        con la misma forma que process_monthly_data. months fija el orden y qué meses se incluyen.
+        """
+        import pyarrow.parquet as pq
+        stored = self.months(data_type)
+        months = [m for m in months if m in stored] if months is not None else sorted(stored)
+        frames = []
+        has_source_data = False
+        with profile_stage('lectura del almacén', data_type) as stage:
+            for month in months:
+                table = pq.read_table(stored[month], memory_map=True)
+                if (table.schema.metadata or {}).get(HAS_SOURCE_KEY) == b'1':
+                    has_source_data = True
+                frames.append(table.to_pandas().assign(mes=month))
+            stage['rows'] = sum(len(frame) for frame in frames)
+        if not frames:
+            return pd.DataFrame(), False
+        return pd.concat(frames, ignore_index=True), has_source_data
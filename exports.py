@@ -0,0 +1,120 @@
+"""
+Exportación de resultados a CSV, CSV comprimido (gzip), Parquet y Excel.
+
+Los archivos se escriben por bloques de filas sobre un archivo binario (en disco o en memoria), así que
+nunca se construye el texto completo del CSV; en la app solo se generan cuando el usuario los pide.
+Parquet requiere pyarrow y Excel, xlsxwriter u openpyxl.
+"""
+import gzip
+import importlib.util
+import io
+
+from app_config import EXPORT_CONFIG
+
+EXPORT_FORMATS = {
+    'csv': {'label': 'CSV', 'extension': 'csv', 'mime': 'text/csv'},
+    'csv.gz': {'label': 'CSV comprimido (gzip)', 'extension': 'csv.gz', 'mime': 'application/gzip'},
+    'parquet': {'label': 'Parquet', 'extension': 'parquet', 'mime': 'application/vnd.apache.parquet'},
+    'xlsx': {'label': 'Excel (XLSX)', 'extension': 'xlsx',
+             'mime': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'}
+}
+
+# Filas por hoja de Excel, encabezado incluido
+EXCEL_MAX_ROWS = 1_048_576
+
+def _excel_engine():
+    for engine in ['xlsxwriter', 'openpyxl']:
+        if importlib.util.find_spec(engine) is not None:
+            return engine
+    return None
+
+def available_formats():
+    """
+    Formatos que se pueden generar con las dependencias instaladas
+    """
+    formats = ['csv', 'csv.gz']
+    if importlib.util.find_spec('pyarrow') is not None:
+        formats.append('parquet')
+    if _excel_engine() is not None:
+        formats.append('xlsx')
+    return formats
+
+def export_file_name(base_name, fmt):
+    return f"{base_name}.{EXPORT_FORMATS[fmt]['extension']}"
+
+def _chunks(df, chunk_rows):
+    # Al menos un bloque para que un DataFrame vacío también escriba su encabezado
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield start, df.iloc[start:start + chunk_rows]
+
+def _write_csv(df, binary, chunk_rows):
+    text = io.TextIOWrapper(binary, encoding='utf-8', newline='')
+    try:
+        for start, chunk in _chunks(df, chunk_rows):
+            chunk.to_csv(text, header=start == 0, index=False)
+        text.flush()
+    finally:
+        # Soltar el archivo binario sin cerrarlo: lo cierra quien lo abrió
+        text.detach()
+
+def _write_parquet(df, target, chunk_rows):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("La exportación a Parquet requiere pyarrow (pip install pyarrow)") from e
+    writer = None
+    try:
+        for _, chunk in _chunks(df, chunk_rows):
+            # Un row group por bloque, todos con el esquema del primero
+            table = pa.Table.from_pandas(chunk, preserve_index=False, schema=writer.schema if writer else None)
+            if writer is None:
+                writer = pq.ParquetWriter(target, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+def _write_xlsx(df, target, chunk_rows):
+    import pandas as pd
+    engine = _excel_engine()
+    if engine is None:
+        raise ImportError("La exportación a Excel requiere xlsxwriter u openpyxl (pip install xlsxwriter)")
+    if len(df) + 1 > EXCEL_MAX_ROWS:
+        raise ValueError(f"Excel admite como máximo {EXCEL_MAX_ROWS - 1:,} filas por hoja; exporta en CSV o Parquet")
+    # Sin el modo constant_memory de xlsxwriter: pandas escribe las celdas por columnas, no por filas
+    with pd.ExcelWriter(target, engine=engine) as writer:
+        for start, chunk in _chunks(df, chunk_rows):
+            chunk.to_excel(writer, index=False, header=start == 0, startrow=start + 1 if start else 0)
+
+def write_export(df, fmt, target, chunk_rows=None):
+    """
+    Escribe df en el formato indicado ('csv', 'csv.gz', 'parquet' o 'xlsx') por bloques de chunk_rows filas.
+    target es una ruta o un archivo binario abierto para escritura.
+    """
+    chunk_rows = chunk_rows or EXPORT_CONFIG['chunk_rows']
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Formato de exportación desconocido: {fmt}")
+    if fmt == 'parquet':
+        return _write_parquet(df, target, chunk_rows)
+    if fmt == 'xlsx':
+        return _write_xlsx(df, target, chunk_rows)
+
+    binary = open(target, 'wb') if not hasattr(target, 'write') else target
+    try:
+        if fmt == 'csv.gz':
+            with gzip.GzipFile(fileobj=binary, mode='wb') as compressed:
+                _write_csv(df, compressed, chunk_rows)
+        else:
+            _write_csv(df, binary, chunk_rows)
+    finally:
+        if binary is not target:
+            binary.close()
+
+def export_bytes(df, fmt, chunk_rows=None):
+    """
+    Contenido del archivo exportado, para un botón de descarga
+    """
+    buffer = io.BytesIO()
+    write_export(df, fmt, buffer, chunk_rows)
+    return buffer.getvalue()
@@ -0,0 +1,93 @@
+"""
+Eje temporal del análisis: periodos año-mes con etiqueta 'YYYY-MM'.
+
+Las etiquetas se ordenan cronológicamente al ordenarlas como texto, así que sirven directamente
+como categorías ordenadas de la dimensión mes y permiten historiales de varios años sin que
+'enero' de dos años distintos colisione.
+"""
+import re
+
+import pandas as pd
+
+from app_config import MONTHS
+
+# Abreviaturas de tres letras (ene, feb, ..., dic)
+MONTH_ABBREVIATIONS = {month[:3]: number for number, month in enumerate(MONTHS, start=1)}
+
+NUMERIC_PERIOD_PATTERNS = [
+    # 2024-01, 2024_01, 202401 y 20240131
+    re.compile(r'(?<!\d)(?P<year>(?:19|20)\d{2})[-_./ ]?(?P<month>0[1-9]|1[0-2])(?:[-_./ ]?[0-3]\d)?(?!\d)'),
+    # 01-2024, 01_2024
+    re.compile(r'(?<!\d)(?P<month>0?[1-9]|1[0-2])[-_./](?P<year>(?:19|20)\d{2})(?!\d)')
+]
+YEAR_PATTERN = re.compile(r'(?<!\d)((?:19|20)\d{2})(?!\d)')
+
+def period_label(year, month):
+    return f"{int(year):04d}-{int(month):02d}"
+
+def _month_from_name(text):
+    """
+    Número de mes si el texto nombra exactamente un mes (nombre completo o abreviatura como palabra)
+    """
+    found = {number for number, month in enumerate(MONTHS, start=1) if month in text}
+    if not found:
+        found = {MONTH_ABBREVIATIONS[token] for token in re.split(r'[^a-zñ]+', text) if token in MONTH_ABBREVIATIONS}
+    return found.pop() if len(found) == 1 else None
+
+def parse_period(text, default_year=None):
+    """
+    Deduce el periodo 'YYYY-MM' de un texto (normalmente el nombre del archivo).
+    Acepta fechas numéricas (2024-01, 202401, 01-2024) o el nombre del mes con el año
+    ('enero_2024'); si solo aparece el mes se usa default_year. Devuelve None si no se puede deducir.
+    """
+    text = text.lower()
+    for pattern in NUMERIC_PERIOD_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return period_label(match.group('year'), match.group('month'))
+
+    month = _month_from_name(text)
+    if month is None:
+        return None
+    years = set(YEAR_PATTERN.findall(text))
+    if len(years) == 1:
+        return period_label(years.pop(), month)
+    if not years and default_year is not None:
+        return period_label(default_year, month)
+    return None
+
+def period_display(label):
+    """
+    Etiqueta legible de un periodo ('2024-01' -> 'enero 2024'); otros valores se devuelven igual
+    """
+    try:
+        year, month = str(label).split('-')
+        return f"{MONTHS[int(month) - 1]} {year}"
+    except (ValueError, IndexError):
+        return str(label)
+
+def period_axis(periods):
+    """
+    Convierte las etiquetas de periodo en fechas (primer día del mes) para usar un eje temporal real
+    en los gráficos; si alguna etiqueta no es un periodo se devuelven las etiquetas tal cual
+    """
+    periods = pd.Series(periods)
+    dates = pd.to_datetime(periods.astype(str), format='%Y-%m', errors='coerce')
+    return periods if dates.isna().any() else dates
+
+def assign_periods(files, default_year=None):
+    """
+    Asigna cada archivo (UploadedFile o Path, con atributo name) a su periodo según el nombre.
+    Devuelve ({periodo: archivo} en orden cronológico, [(archivo, motivo)] de los archivos ignorados).
+    """
+    assigned = {}
+    skipped = []
+    for file in files:
+        period = parse_period(file.name, default_year)
+        if period is None:
+            skipped.append((file, "no se pudo deducir el mes del nombre"))
+        elif period in assigned:
+            skipped.append((file, f"ya hay un archivo para {period_display(period)}"))
+        else:
+            assigned[period] = file
+    return dict(sorted(assigned.items())), skipped
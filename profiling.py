@@ -0,0 +1,129 @@
+"""
+Instrumentación por etapas del pipeline: tiempo de reloj, filas y pico de memoria de cada etapa.
+
+El núcleo marca sus etapas con profile_stage(); sin un StageProfiler activo no se mide nada y el coste
+es una consulta a una variable de contexto. El profiler activo se guarda en un ContextVar, así que cada
+sesión de Streamlit (un hilo por sesión) tiene el suyo y los hilos del pool de lectura lo heredan si se
+lanzan con contextvars.copy_context().run.
+"""
+import contextvars
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+_active_profiler = contextvars.ContextVar('active_profiler', default=None)
+
+class StageProfiler:
+    """
+    Registro de etapas de una ejecución. Con trace_memory se mide el pico de memoria con tracemalloc
+    (más lento); el pico es el del proceso durante la etapa, por encima de la memoria al empezarla.
+    """
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = []
+        self.started_at = None
+        self._open = []
+        self._lock = threading.Lock()
+        self._token = None
+        self._started_tracing = False
+        self._t0 = None
+
+    def __enter__(self):
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self._t0 = time.perf_counter()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._token = _active_profiler.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _active_profiler.reset(self._token)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return False
+
+    def _flush_peak(self):
+        # Reparte el pico observado desde el último reset entre todas las etapas abiertas
+        _, peak = tracemalloc.get_traced_memory()
+        for record in self._open:
+            record['_max_traced'] = max(record['_max_traced'], peak)
+
+    @contextmanager
+    def stage(self, name, detail=None):
+        """
+        Mide una etapa; el dict devuelto admite record['rows'] = n para anotar las filas procesadas
+        """
+        record = {
+            'stage': name,
+            'detail': detail,
+            'thread': threading.current_thread().name,
+            'start_s': round(time.perf_counter() - self._t0, 4),
+            'seconds': None,
+            'rows': None,
+            'peak_mb': None
+        }
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        with self._lock:
+            record['depth'] = sum(1 for r in self._open if r['thread'] == record['thread'])
+            if tracing:
+                self._flush_peak()
+                tracemalloc.reset_peak()
+                record['_start_traced'] = record['_max_traced'] = tracemalloc.get_traced_memory()[0]
+            self._open.append(record)
+            self.stages.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = round(time.perf_counter() - start, 4)
+            with self._lock:
+                if tracing and tracemalloc.is_tracing():
+                    self._flush_peak()
+                    record['peak_mb'] = round((record['_max_traced'] - record['_start_traced']) / 1024 / 1024, 2)
+                self._open.remove(record)
+
+    def report(self):
+        """
+        Etapas en orden de inicio, sin los campos internos
+        """
+        return [{key: value for key, value in r.items() if not key.startswith('_')} for r in self.stages]
+
+    def summary(self):
+        """
+        Totales por etapa: número de llamadas, segundos y filas sumados y el mayor pico, de más a menos lenta
+        """
+        totals = {}
+        for r in self.stages:
+            total = totals.setdefault(r['stage'], {'stage': r['stage'], 'calls': 0, 'seconds': 0.0, 'rows': None, 'peak_mb': None})
+            total['calls'] += 1
+            total['seconds'] = round(total['seconds'] + (r['seconds'] or 0), 4)
+            if r['rows'] is not None:
+                total['rows'] = (total['rows'] or 0) + r['rows']
+            if r['peak_mb'] is not None:
+                total['peak_mb'] = max(total['peak_mb'] or 0, r['peak_mb'])
+        return sorted(totals.values(), key=lambda t: t['seconds'], reverse=True)
+
+    def to_json(self):
+        return json.dumps({
+            'started_at': self.started_at,
+            'trace_memory': self.trace_memory,
+            'summary': self.summary(),
+            'stages': self.report()
+        }, ensure_ascii=False, indent=2)
+
+@contextmanager
+def profile_stage(name, detail=None):
+    """
+    Marca una etapa en el profiler activo; sin profiler activo devuelve un dict que se descarta
+    """
+    profiler = _active_profiler.get()
+    if profiler is None:
+        yield {}
+        return
+    with profiler.stage(name, detail) as record:
+        yield record
@@ -0,0 +1,139 @@
+"""
+Intervalos de confianza y tests de significación de las tasas (CTR y Conversión Efectiva), vectorizados.
+
+Se calculan en una sola pasada de NumPy sobre los recuentos ya agregados de cada fila (clicks o formularios
+y total_users), así que cuestan lo mismo para 12 meses que para decenas de miles de landing pages × meses
+× fuentes. Una tasa con pocos usuarios tiene un intervalo ancho: ordenar por su límite inferior evita que
+una página con 3 usuarios y 2 clicks quede por delante de otra con 50.000 usuarios.
+
+Los intervalos bayesianos usan scipy si está instalado; sin él, la aproximación normal de la posterior Beta.
+"""
+import importlib.util
+from statistics import NormalDist
+
+import numpy as np
+
+from analytics_core import RATE_DENOMINATOR, RATE_NUMERATORS
+from app_config import SIGNIFICANCE_CONFIG
+
+# Coeficientes de la aproximación de erfc de Abramowitz y Stegun (7.1.26), error absoluto < 1.5e-7
+_ERFC_P = 0.3275911
+_ERFC_COEFFICIENTS = [1.061405429, -1.453152027, 1.421413741, -0.284496736, 0.254829592]
+
+def z_value(confidence):
+    """
+    Cuantil normal del intervalo bilateral con el nivel de confianza indicado (1.96 para 0.95)
+    """
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+def _normal_sf(z):
+    # P(Z > z) para z >= 0
+    x = np.asarray(z, dtype=float) / np.sqrt(2)
+    t = 1 / (1 + _ERFC_P * x)
+    polynomial = np.zeros_like(t)
+    for coefficient in _ERFC_COEFFICIENTS:
+        polynomial = polynomial * t + coefficient
+    return 0.5 * polynomial * t * np.exp(-x ** 2)
+
+def _counts(successes, trials):
+    trials = np.asarray(trials, dtype=float)
+    # Los clicks (o envíos) por encima de los usuarios se acotan al total: como proporción no pasan del 100%
+    successes = np.minimum(np.asarray(successes, dtype=float), trials)
+    # Sin usuarios la proporción no está definida
+    return successes, np.where(trials > 0, trials, np.nan)
+
+def wilson_interval(successes, trials, confidence=None):
+    """
+    Intervalo de Wilson de successes / trials, como arrays (límite inferior, límite superior) en [0, 1]
+    """
+    successes, trials = _counts(successes, trials)
+    z = z_value(confidence or SIGNIFICANCE_CONFIG['confidence'])
+    p = successes / trials
+    denominator = 1 + z ** 2 / trials
+    center = (p + z ** 2 / (2 * trials)) / denominator
+    margin = z * np.sqrt(p * (1 - p) / trials + z ** 2 / (4 * trials ** 2)) / denominator
+    return np.clip(center - margin, 0, 1), np.clip(center + margin, 0, 1)
+
+def bayesian_interval(successes, trials, confidence=None, prior=None):
+    """
+    Intervalo de credibilidad central de la posterior Beta(a + éxitos, b + fracasos), en [0, 1]
+    """
+    successes, trials = _counts(successes, trials)
+    confidence = confidence or SIGNIFICANCE_CONFIG['confidence']
+    a, b = prior or SIGNIFICANCE_CONFIG['prior']
+    alpha, beta = a + successes, b + trials - successes
+    tail = (1 - confidence) / 2
+    if importlib.util.find_spec('scipy') is not None:
+        from scipy.stats import beta as beta_distribution
+        low, high = beta_distribution.ppf(tail, alpha, beta), beta_distribution.ppf(1 - tail, alpha, beta)
+    else:
+        mean = alpha / (alpha + beta)
+        sd = np.sqrt(alpha * beta / ((alpha + beta) ** 2 * (alpha + beta + 1)))
+        z = z_value(confidence)
+        low, high = mean - z * sd, mean + z * sd
+    return np.clip(low, 0, 1), np.clip(high, 0, 1)
+
+INTERVAL_METHODS = {'wilson': wilson_interval, 'bayes': bayesian_interval}
+
+def two_proportion_test(successes_a, trials_a, successes_b, trials_b):
+    """
+    Test z de dos proporciones con varianza agrupada, elemento a elemento: (z, p-valor bilateral)
+    """
+    successes_a, trials_a = _counts(successes_a, trials_a)
+    successes_b, trials_b = _counts(successes_b, trials_b)
+    pooled = (successes_a + successes_b) / (trials_a + trials_b)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (successes_a / trials_a - successes_b / trials_b) / np.sqrt(pooled * (1 - pooled) * (1 / trials_a + 1 / trials_b))
+    return z, np.minimum(2 * _normal_sf(np.abs(z)), 1)
+
+def rate_intervals(df, metric, confidence=None, method=None):
+    """
+    Límites (%) del intervalo de la tasa (CTR o conversion_rate) de cada fila, a partir de sus recuentos
+    """
+    method = method or SIGNIFICANCE_CONFIG['method']
+    if method not in INTERVAL_METHODS:
+        raise ValueError(f"Método de intervalo desconocido: {method}")
+    low, high = INTERVAL_METHODS[method](df[RATE_NUMERATORS[metric]].to_numpy(), df[RATE_DENOMINATOR].to_numpy(), confidence)
+    return low * 100, high * 100
+
+def add_rate_intervals(df, confidence=None, method=None):
+    """
+    Añade a df las columnas {tasa}_low y {tasa}_high (%) de cada tasa cuyos recuentos están presentes
+    """
+    for rate_col, count_col in RATE_NUMERATORS.items():
+        if count_col in df.columns and RATE_DENOMINATOR in df.columns:
+            df[f'{rate_col}_low'], df[f'{rate_col}_high'] = rate_intervals(df, rate_col, confidence, method)
+    return df
+
+def compare_rows(df, metric, label_a, label_b):
+    """
+    Test de dos proporciones entre dos filas de df (por etiqueta del índice): (z, p-valor)
+    """
+    counts = df.loc[[label_a, label_b], [RATE_NUMERATORS[metric], RATE_DENOMINATOR]].to_numpy(dtype=float)
+    z, p_value = two_proportion_test(counts[0, 0], counts[0, 1], counts[1, 0], counts[1, 1])
+    return float(z), float(p_value)
+
+def compare_to_rest(df, metric):
+    """
+    Test de cada fila contra el resto de filas juntas: arrays (z, p-valor) alineados con df
+    """
+    trials = df[RATE_DENOMINATOR].to_numpy(dtype=float)
+    successes = np.minimum(df[RATE_NUMERATORS[metric]].to_numpy(dtype=float), trials)
+    return two_proportion_test(successes, trials, successes.sum() - successes, trials.sum() - trials)
+
+def is_significant(p_value, confidence=None):
+    return p_value < 1 - (confidence or SIGNIFICANCE_CONFIG['confidence'])
+
+def top_rates(df, metric, n, by_lower_bound=None, confidence=None, method=None):
+    """
+    Las n filas con mayor tasa observada o, con by_lower_bound, con mayor límite inferior del intervalo,
+    con las columnas {tasa}_low y {tasa}_high añadidas. Los intervalos se calculan para todas las filas
+    en una pasada, pero solo se copian las n seleccionadas.
+    """
+    if by_lower_bound is None:
+        by_lower_bound = SIGNIFICANCE_CONFIG['rank_by_lower_bound']
+    low, high = rate_intervals(df, metric, confidence, method)
+    key = low if by_lower_bound else df[metric].to_numpy(dtype=float)
+    # Orden estable de mayor a menor (empates en orden de aparición, filas sin datos al final)
+    order = np.argsort(-key, kind='stable')[:n]
+    return df.iloc[order].assign(**{f'{metric}_low': low[order], f'{metric}_high': high[order]})
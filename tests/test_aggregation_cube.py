@@ -0,0 +1,52 @@
+"""
+Las tasas del cubo de agregados son el cociente de las sumas (ponderadas) o, con weighted=False,
+la media simple de la tasa de cada fila, en cualquier nivel de agregación.
+"""
+import pandas as pd
+import pytest
+
+from analytics_core import AggregationCube, add_rates, mean_of_rates, rate_of_sums
+
+def merged():
+    df = pd.DataFrame({
+        'mes': ['2024-01', '2024-01', '2024-01', '2024-02', '2024-02'],
+        'fuente': ['google', 'bing', 'google', 'google', 'bing'],
+        'landing_page': ['/a', '/a', '/b', '/a', '/b'],
+        'total_users': [1000, 3, 200, 500, 0],
+        'cta_clicks': [10, 2, 40, 25, 0],
+        'form_submissions': [5, 1, 2, 0, 0],
+    })
+    return add_rates(df)
+
+def test_rates_are_ratio_of_sums():
+    df = merged()
+    cube = AggregationCube(df)
+
+    # Σclicks / Σusuarios, no la media de las tasas por fila
+    assert cube.overall_rate('CTR') == pytest.approx(77 / 1703 * 100)
+    assert cube.overall_rate('CTR') == pytest.approx(rate_of_sums(df, 'CTR'))
+    by_page = cube.rate(['landing_page'], 'CTR')
+    assert by_page['/a'] == pytest.approx(37 / 1503 * 100)
+    # /b de 2024-02 no tiene usuarios y solo aporta a las sumas
+    assert by_page['/b'] == pytest.approx(40 / 200 * 100)
+    assert cube.rate(['mes'], 'conversion_rate')['2024-01'] == pytest.approx(8 / 1203 * 100)
+
+def test_mean_of_rates_skips_rows_without_users():
+    df = merged()
+    cube = AggregationCube(df)
+
+    # Media simple de 1%, 66.67%, 20% y 5%; la fila sin usuarios no cuenta
+    expected = (1 + 200 / 3 + 20 + 5) / 4
+    assert cube.overall_mean('CTR') == pytest.approx(expected)
+    assert cube.overall_mean('CTR') == pytest.approx(mean_of_rates(df, 'CTR'))
+    assert cube.mean(['landing_page'], 'CTR')['/a'] == pytest.approx((1 + 200 / 3 + 5) / 3)
+    assert cube.overall_mean('CTR') > cube.overall_rate('CTR')
+
+def test_rollups_match_cube_of_grouped_rows():
+    df = merged()
+    summary = AggregationCube(df).summary(['fuente'])
+    grouped = add_rates(df.groupby('fuente')[['total_users', 'cta_clicks', 'form_submissions']].sum())
+
+    pd.testing.assert_frame_equal(summary[['total_users', 'cta_clicks', 'form_submissions']], grouped[['total_users', 'cta_clicks', 'form_submissions']],
+                                  check_names=False)
+    assert summary['CTR'].round(2).tolist() == grouped['CTR'].tolist()
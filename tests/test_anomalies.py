@@ -0,0 +1,66 @@
+"""
+detect_anomalies compara cada mes con la ventana de meses anteriores de su serie y solo alerta de
+desviaciones mayores que el ruido de muestreo.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from analytics_core import AggregationCube, add_rates
+from anomalies import MAD_SCALE, detect_anomalies
+
+MONTHS = [f'2024-{m:02d}' for m in range(1, 9)]
+
+def merged(series):
+    """
+    series: {(fuente, landing_page): [(usuarios, clicks) por mes]}
+    """
+    rows = [
+        {'mes': month, 'fuente': source, 'landing_page': page, 'total_users': users, 'cta_clicks': clicks}
+        for (source, page), values in series.items()
+        for month, (users, clicks) in zip(MONTHS, values)
+    ]
+    return add_rates(pd.DataFrame(rows))
+
+def steady(users, ctr, noise):
+    return [(users, round(users * (ctr + d) / 100)) for d in noise]
+
+NOISE = [0.0, 0.2, -0.1, 0.1, -0.2, 0.0, 0.1, -0.1]
+
+def test_drop_is_detected_against_window_median():
+    big = steady(10000, 10, NOISE)
+    big[6] = (10000, 200)
+    cube = AggregationCube(merged({('google', '/a'): big, ('bing', '/b'): steady(10000, 5, NOISE)}))
+
+    alerts = detect_anomalies(cube, 'CTR', method='mad', window=6, min_history=3, threshold=3.5, min_users=100)
+
+    assert alerts[['mes', 'fuente', 'landing_page', 'direction']].values.tolist() == [['2024-07', 'google', '/a', 'caída']]
+    # Referencia: mediana de los 6 meses anteriores; la escala es la MAD o, si es mayor, el ruido de muestreo
+    # de la tasa con los usuarios del mes y la proporción conjunta de la ventana
+    previous = np.array([10.0, 10.2, 9.9, 10.1, 9.8, 10.0])
+    center = np.median(previous)
+    proportion = (previous.sum() * 100 + 0.5) / (60000 + 1)
+    scale = max(MAD_SCALE * np.median(np.abs(previous - center)), np.sqrt(proportion * (1 - proportion) / 10000) * 100)
+    alert = alerts.iloc[0]
+    assert alert['baseline'] == pytest.approx(center)
+    assert alert['change'] == pytest.approx(2.0 - center)
+    assert alert['score'] == pytest.approx((2.0 - center) / scale)
+    assert alert['total_users'] == 10000
+
+def test_small_series_and_short_history_do_not_alert():
+    small = steady(60, 10, NOISE)
+    small[6] = (60, 30)
+    early = steady(10000, 10, NOISE)
+    early[1] = (10000, 3000)
+    cube = AggregationCube(merged({('google', '/poca'): small, ('google', '/pronto'): early}))
+
+    # /poca no llega a min_users y /pronto cambia en el segundo mes, sin historial suficiente
+    assert detect_anomalies(cube, 'CTR', method='mad', window=6, min_history=3, threshold=3.5, min_users=100).empty
+    # Sin mínimo de usuarios, el salto de /poca supera incluso el ruido de muestreo con 60 usuarios
+    alerts = detect_anomalies(cube, 'CTR', method='zscore', window=6, min_history=3, threshold=3.5, min_users=0)
+    assert alerts[['landing_page', 'mes', 'direction']].values.tolist() == [['/poca', '2024-07', 'subida']]
+
+def test_unknown_method():
+    cube = AggregationCube(merged({('google', '/a'): steady(1000, 10, NOISE)}))
+    with pytest.raises(ValueError):
+        detect_anomalies(cube, 'CTR', method='iqr')
@@ -0,0 +1,81 @@
+"""
+Clasificación de la carga masiva por tipo de datos y periodo, a partir del nombre, del preámbulo de GA
+o de las columnas, también para los CSV dentro de un ZIP.
+"""
+import io
+import zipfile
+
+from bulk_upload import UploadMember, classify_files, iter_upload_files
+
+def ga_file(name, header, preamble=("# Export de GA",)):
+    lines = list(preamble) + [header, "/a,1"]
+    return UploadMember("\n".join(lines).encode('utf-8'), name)
+
+def names(assigned):
+    return {data_type: {period: file.name for period, file in periods.items()} for data_type, periods in assigned.items()}
+
+def test_classify_by_name():
+    files = [
+        ga_file('Clicks_CTA_2024-02.csv', 'page_path,clicks'),
+        ga_file('usuarios_2024-01.csv', 'page_path,usuarios'),
+        # "usuarios que enviaron el formulario": la pista de formularios gana a la de usuarios
+        ga_file('usuarios_formulario_enero_2024.csv', 'page_path,usuarios'),
+        ga_file('usuarios_2024-02.csv', 'page_path,usuarios'),
+    ]
+    assigned, skipped = classify_files(files)
+    assert names(assigned) == {
+        'cta': {'2024-02': 'Clicks_CTA_2024-02.csv'},
+        'forms': {'2024-01': 'usuarios_formulario_enero_2024.csv'},
+        'users': {'2024-01': 'usuarios_2024-01.csv', '2024-02': 'usuarios_2024-02.csv'},
+    }
+    assert list(assigned['users']) == ['2024-01', '2024-02']
+    assert skipped == []
+
+def test_classify_by_preamble_and_columns():
+    preamble = ("# Fecha de inicio: 20240301", "# Fecha de finalización: 20240331")
+    files = [
+        ga_file('export.csv', 'page_path,clicks', preamble),
+        # Solo el mes en el nombre: el año sale del preámbulo
+        ga_file('informe_abril.csv', 'page_path,formularios', ("# Fecha de inicio: 20230401",)),
+    ]
+    assigned, skipped = classify_files(files)
+    assert names(assigned) == {'cta': {'2024-03': 'export.csv'}, 'forms': {'2023-04': 'informe_abril.csv'}, 'users': {}}
+    assert skipped == []
+
+def test_skipped_files():
+    two_months = ("# Fecha de inicio: 20240101", "# Fecha de finalización: 20240229")
+    files = [
+        UploadMember(b"sin encabezados\n1,2\n", 'notas.csv'),
+        ga_file('export.csv', 'page_path,total de usuarios'),
+        ga_file('usuarios.csv', 'page_path,usuarios', two_months),
+        ga_file('usuarios_2024-01.csv', 'page_path,usuarios'),
+        ga_file('usuarios_enero_2024.csv', 'page_path,usuarios'),
+    ]
+    assigned, skipped = classify_files(files)
+    assert names(assigned)['users'] == {'2024-01': 'usuarios_2024-01.csv'}
+    assert [name for name, _ in skipped] == ['notas.csv', 'export.csv', 'usuarios.csv', 'usuarios_enero_2024.csv']
+    assert 'ya hay un archivo de Usuarios para enero 2024' in skipped[-1][1]
+
+def test_forced_type_accumulates_on_previous_classification():
+    assigned, _ = classify_files([ga_file('usuarios_2024-01.csv', 'page_path,usuarios')])
+    assigned, skipped = classify_files([ga_file('enero_2024.csv', 'page_path,total de usuarios')], data_type='cta', assigned=assigned)
+    assert names(assigned) == {'cta': {'2024-01': 'enero_2024.csv'}, 'forms': {}, 'users': {'2024-01': 'usuarios_2024-01.csv'}}
+    assert skipped == []
+
+def test_zip_members():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('cta/2024-01.csv', "page_path,clicks\n/a,1\n")
+        archive.writestr('usuarios/2024-01.csv', "page_path,usuarios\n/a,5\n")
+        archive.writestr('__MACOSX/cta/._2024-01.csv', "x")
+        archive.writestr('leeme.txt', "x")
+    upload = UploadMember(buffer.getvalue(), 'historial.zip', file_id='abc')
+
+    members = list(iter_upload_files([upload, ga_file('formularios_2024-01.csv', 'page_path,formularios')]))
+    assert [member.name for member in members] == ['historial.zip/cta/2024-01.csv', 'historial.zip/usuarios/2024-01.csv',
+                                                   'formularios_2024-01.csv']
+    assert members[0].file_id == 'abc/cta/2024-01.csv'
+
+    assigned, skipped = classify_files(members)
+    assert {data_type: list(periods) for data_type, periods in assigned.items()} == {'cta': ['2024-01'], 'forms': ['2024-01'], 'users': ['2024-01']}
+    assert skipped == []
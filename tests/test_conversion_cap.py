@@ -0,0 +1,32 @@
+"""
+La Conversión Efectiva no pasa del 100%: las filas con más formularios que usuarios se acotan y se informan.
+"""
+import io
+
+from analytics_core import analyze_monthly_files, analyze_monthly_files_out_of_core
+
+def ga_export(rows, metric):
+    lines = ["# Export de GA", f"Fuente de la sesión,page_path,{metric}", ",Total,0"]
+    lines += [f"{source},{page},{value}" for source, page, value in rows]
+    return io.BytesIO("\n".join(lines).encode('utf-8'))
+
+def monthly_exports():
+    users = {'2024-01': [('google', '/a', 10), ('google', '/b', 20)]}
+    cta = {'2024-01': [('google', '/a', 2), ('google', '/b', 5)]}
+    forms = {'2024-01': [('google', '/a', 12), ('google', '/b', 4)]}
+    return ({month: ga_export(rows, 'clicks') for month, rows in cta.items()},
+            {month: ga_export(rows, 'Total de usuarios') for month, rows in users.items()},
+            {month: ga_export(rows, 'formularios') for month, rows in forms.items()})
+
+def test_conversion_capped_and_reported():
+    for analyze in [analyze_monthly_files, analyze_monthly_files_out_of_core]:
+        cta, users, forms = monthly_exports()
+        analysis = analyze(cta, users, monthly_forms_files=forms)
+
+        merged = analysis['merged_monthly'].set_index('landing_page')
+        assert merged.loc['/a', ['form_submissions', 'conversion_rate']].tolist() == [10, 100.0]
+        assert merged.loc['/b', ['form_submissions', 'conversion_rate']].tolist() == [4, 20.0]
+        assert analysis['consolidated_data']['conversion_rate'].max() <= 100
+
+        over_users = analysis['unmatched']['forms_over_users']
+        assert over_users[['landing_page', 'total_users', 'form_submissions']].astype(object).values.tolist() == [['/a', 10, 12]]
@@ -0,0 +1,42 @@
+"""
+Almacén Parquet: la versión vigente de cada mes es la última guardada o usada, no la de fecha más reciente.
+"""
+import io
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from analytics_core import ParseCache, load_monthly_file
+from dataset_store import DatasetStore
+
+def month_df(users):
+    return pd.DataFrame({'fuente': ['google'], 'landing_page': ['/a'], 'total_users': [users]})
+
+def test_get_hit_makes_version_current_again(tmp_path):
+    store = DatasetStore(tmp_path)
+    store.put('users', '2024-01', 'a', month_df(10), True)
+    store.put('users', '2024-01', 'b', month_df(20), True)
+    assert store.get('users', '2024-01', 'a') is not None
+
+    loaded, has_source = store.load('users')
+    assert has_source
+    assert loaded['total_users'].tolist() == [10]
+
+def test_superseded_versions_are_pruned(tmp_path):
+    store = DatasetStore(tmp_path, max_versions=2)
+    for i, content_hash in enumerate(['a', 'b', 'c']):
+        store.put('users', '2024-01', content_hash, month_df(i), False)
+    assert store.versions('users', '2024-01') == ['c', 'b']
+    assert sorted(p.stem for p in (tmp_path / 'users' / '2024-01').glob('*.parquet')) == ['b', 'c']
+
+def test_parse_cache_hit_updates_store(tmp_path):
+    # Volver al export A con A aún en la caché de lectura: el almacén también debe volver a A
+    store = DatasetStore(tmp_path)
+    cache = ParseCache(64 * 1024 * 1024)
+    exports = {users: f"page_path,Total de usuarios\n/a,{users}\n".encode('utf-8') for users in (10, 20)}
+    for users in (10, 20, 10):
+        load_monthly_file(io.BytesIO(exports[users]), 'users', cache, store, '2024-01')
+    loaded, _ = store.load('users')
+    assert loaded['total_users'].tolist() == [10]
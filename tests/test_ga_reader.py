@@ -0,0 +1,75 @@
+"""
+Lectura de exports de GA: los lectores con el parser de pandas descartan las mismas filas que el lector fila a fila original.
+"""
+import csv
+import io
+
+import pandas as pd
+import pytest
+
+from analytics_core import read_csv_streaming, read_csv_with_header_detection_and_clean
+
+def reference_read(text):
+    """
+    Lector fila a fila original (csv.reader), que sirve de referencia
+    """
+    lines = text.splitlines()
+    header_row = next(i for i, line in enumerate(lines)
+                      if any(alias in line.lower() for alias in ['page_path', 'pagina', 'url', 'ruta']) and (',' in line or ';' in line))
+    delimiter = ',' if lines[header_row].count(',') >= lines[header_row].count(';') else ';'
+    header = [h.strip().lower() for h in lines[header_row].split(delimiter)]
+    has_source = len(header) >= 3 and any(col in header for col in ['fuente', 'fuente de la sesión', 'source', 'canal', 'channel', 'medium'])
+    n_cols = 3 if has_source else 2
+    data = []
+    for row in csv.reader(lines[header_row + 1:], delimiter=delimiter):
+        if len(row) < n_cols:
+            continue
+        row = [field.strip() for field in row[:n_cols]]
+        page, value = row[-2], row[-1]
+        if not page or page.lower() in ('total', 'totales') or value.lower() in ('total', 'totales'):
+            continue
+        data.append(row)
+    return pd.DataFrame(data, columns=header[:n_cols]), has_source
+
+GA4_FOOTER = "\n# ----------------------------------------\n# Serie temporal\n# ----------------------------------------\nÍndice de fecha,Total de usuarios\n0,120\n"
+
+EXPORTS = {
+    '2 columnas con filas cortas': (
+        "# Export de GA\npage_path,Total de usuarios\n/a\n/b,\n/c,5\n\n/d,4,sobra\n\"/e,f\",2\nTotal,9\n/g, 3"
+    ),
+    '3 columnas con filas cortas': (
+        "fuente,page_path,Total de usuarios\ngoogle,/a,10\ngoogle,/b\ndirect\ngoogle,,7\n,/c,3\nbing,/d,Totales\n"
+    ),
+    'GA4 con secciones tras la tabla': (
+        "# Informe\n# Fecha de inicio: 20240101\nRuta de la página,Total de usuarios\n/a,10\n/b,20\nTotales,30" + GA4_FOOTER
+    ),
+    'solo filas cortas tras el encabezado': (
+        "page_path,Total de usuarios\n# ----------------------------------------\n# Serie temporal\n/a\n"
+    ),
+    'punto y coma con CRLF': (
+        "pagina;Fuente;Total de usuarios\r\n/a;google;10\r\n/b;google\r\n# Serie temporal\r\n/c;direct;4\r\n"
+    ),
+}
+
+@pytest.mark.parametrize('name', list(EXPORTS))
+def test_same_rows_as_reference_reader(name):
+    text = EXPORTS[name]
+    df, has_source = read_csv_with_header_detection_and_clean(io.BytesIO(text.encode('utf-8')), streaming=False)
+    expected, expected_has_source = reference_read(text)
+    assert has_source == expected_has_source
+    pd.testing.assert_frame_equal(df.reset_index(drop=True), expected, check_dtype=False)
+
+@pytest.mark.parametrize('name', list(EXPORTS))
+@pytest.mark.parametrize('chunk_rows', [1, 3, None])
+def test_streaming_matches_reference_reader(name, chunk_rows):
+    # Bloques de 1 y 3 filas: las filas cortas y los totales caen en bloques distintos
+    text = EXPORTS[name]
+    df, has_source = read_csv_streaming(io.BytesIO(text.encode('utf-8')), chunk_rows)
+    expected, expected_has_source = reference_read(text)
+    assert has_source == expected_has_source
+    pd.testing.assert_frame_equal(df.reset_index(drop=True), expected, check_dtype=False)
+
+def test_short_rows_and_comments_never_become_pages():
+    df, _ = read_csv_with_header_detection_and_clean(io.BytesIO(EXPORTS['GA4 con secciones tras la tabla'].encode('utf-8')))
+    assert not df['ruta de la página'].str.startswith('#').any()
+    assert (df['total de usuarios'] != '').all()
@@ -0,0 +1,63 @@
+"""
+IncrementalMonthlyAnalysis da el mismo resultado que recalcular todo al añadir, reemplazar o quitar meses
+y al cambiar el formato de los archivos (con o sin fuente).
+"""
+import io
+
+import pandas as pd
+
+from analytics_core import IncrementalMonthlyAnalysis, analyze_monthly_files
+
+def ga_export(rows, metric, with_source=True):
+    if with_source:
+        lines = ["# Export de GA", f"Fuente de la sesión,page_path,{metric}", ",Total,0"]
+        lines += [f"{source},{page},{value}" for source, page, value in rows]
+    else:
+        lines = ["# Export de GA", f"page_path,{metric}", "Total,0"]
+        lines += [f"{page},{value}" for _, page, value in rows]
+    return io.BytesIO("\n".join(lines).encode('utf-8'))
+
+def month_rows(seed, n_pages=40):
+    return [(f'src{i % 3}', f'/p{i}', (i * 7 + seed) % 30 + 1) for i in range(n_pages)]
+
+def monthly_exports(seeds, without_source=()):
+    """
+    Archivos de CTA, usuarios y formularios por mes; cada semilla da un contenido distinto
+    y los meses de without_source se exportan sin la columna de fuente
+    """
+    cta, users, forms = {}, {}, {}
+    for month, seed in seeds.items():
+        rows = month_rows(seed)
+        with_source = month not in without_source
+        users[month] = ga_export([(s, p, v + 50) for s, p, v in rows], 'Total de usuarios', with_source)
+        cta[month] = ga_export(rows[::2] + [('src9', '/solo-cta', seed + 1)], 'clicks', with_source)
+        forms[month] = ga_export(rows[::5], 'formularios', with_source)
+    return cta, users, forms
+
+def assert_same_analysis(a, b):
+    for key in ['merged_monthly', 'consolidated_data']:
+        pd.testing.assert_frame_equal(a[key].astype(object), b[key].astype(object))
+    for key in ['detail_cube', 'consolidated_cube']:
+        pd.testing.assert_frame_equal(a[key].cells.reset_index().astype(object), b[key].cells.reset_index().astype(object))
+    assert a['has_source_analysis'] == b['has_source_analysis']
+    assert a['unmatched']['users'] == b['unmatched']['users']
+    for side in ['cta', 'forms']:
+        pd.testing.assert_frame_equal(a['unmatched'][side].astype(object), b['unmatched'][side].astype(object))
+
+def test_incremental_matches_full_recompute():
+    incremental = IncrementalMonthlyAnalysis()
+    steps = [
+        ({'2024-01': 1, '2024-02': 2}, (), ['2024-01', '2024-02']),
+        ({'2024-01': 1, '2024-02': 2, '2024-03': 3}, (), ['2024-03']),     # mes nuevo
+        ({'2024-01': 1, '2024-02': 5, '2024-03': 3}, (), ['2024-02']),     # archivo reemplazado
+        ({'2024-01': 1, '2024-03': 3}, (), []),                            # mes quitado
+        ({'2024-01': 1, '2024-03': 3}, ('2024-03',), ['2024-03']),         # un mes pasa a no tener fuente
+        ({'2024-01': 1, '2024-03': 3}, ('2024-01', '2024-03'), ['2024-01']),
+    ]
+    for seeds, without_source, changed in steps:
+        cta, users, forms = monthly_exports(seeds, without_source)
+        result = incremental.update(cta, users, monthly_forms_files=forms)
+        assert incremental.last_changed == changed
+
+        cta, users, forms = monthly_exports(seeds, without_source)
+        assert_same_analysis(result, analyze_monthly_files(cta, users, monthly_forms_files=forms))
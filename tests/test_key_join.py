@@ -0,0 +1,66 @@
+"""
+KeyJoin da el mismo resultado que pandas.merge con claves únicas (lookup alineado) y con claves repetidas
+(merge genérico), y registra las claves sin correspondencia de cada lado.
+"""
+import pandas as pd
+import pytest
+
+from analytics_core import KeyJoin, encode_dimensions
+
+KEYS = ['landing_page', 'mes', 'fuente']
+
+def frames():
+    users = pd.DataFrame({
+        'fuente': ['google', 'google', 'bing', 'direct'],
+        'landing_page': ['/a', '/b', '/a', '/c'],
+        'mes': '2024-01',
+        'total_users': [10, 20, 30, 40],
+    })
+    cta = pd.DataFrame({
+        'fuente': ['bing', 'google', 'google'],
+        'landing_page': ['/a', '/a', '/solo-cta'],
+        'mes': '2024-01',
+        'cta_clicks': [3, 1, 9],
+    })
+    forms = pd.DataFrame({
+        'fuente': ['direct', 'bing'],
+        'landing_page': ['/c', '/x'],
+        'mes': '2024-01',
+        'form_submissions': [2, 5],
+    })
+    return users, cta, forms
+
+def reference_merge(users, *sides):
+    merged = users
+    for side in sides:
+        merged = merged.merge(side, on=KEYS, how='left')
+    return merged
+
+@pytest.mark.parametrize('encoded', [False, True])
+def test_unique_keys_use_aligned_lookup(encoded):
+    users, cta, forms = frames()
+    if encoded:
+        users, cta, forms = encode_dimensions([users, cta, forms])
+    join = KeyJoin(users, cta, KEYS, forms)
+
+    assert all(positions is not None for positions in join.positions.values())
+    pd.testing.assert_frame_equal(join.merged().astype(object), reference_merge(users, cta, forms).astype(object))
+    assert join.lookup('cta_clicks', 0).tolist() == [1, 0, 3, 0]
+
+def test_repeated_keys_fall_back_to_merge():
+    users, cta, forms = frames()
+    cta = pd.concat([cta, cta.iloc[[0]]], ignore_index=True)
+    join = KeyJoin(users, cta, KEYS, forms)
+
+    assert join.positions['cta'] is None
+    pd.testing.assert_frame_equal(join.merged().astype(object), reference_merge(users, cta, forms).astype(object))
+    with pytest.raises(ValueError):
+        join.lookup('cta_clicks')
+
+def test_unmatched_keys_report():
+    users, cta, forms = frames()
+    unmatched = KeyJoin(users, cta, KEYS, forms).unmatched()
+
+    assert unmatched['users'] == 2
+    assert unmatched['cta'][['fuente', 'landing_page', 'cta_clicks']].values.tolist() == [['google', '/solo-cta', 9]]
+    assert unmatched['forms'][['fuente', 'landing_page', 'form_submissions']].values.tolist() == [['bing', '/x', 5]]
@@ -0,0 +1,40 @@
+"""
+El modo out-of-core da el mismo resultado que el análisis en memoria, también con claves repetidas en un archivo.
+"""
+import io
+
+import pandas as pd
+
+from analytics_core import analyze_monthly_files, analyze_monthly_files_out_of_core
+
+def ga_export(rows, metric):
+    lines = ["# Export de GA", f"Fuente de la sesión,page_path,{metric}", ",Total,0"]
+    lines += [f"{source},{page},{value}" for source, page, value in rows]
+    return io.BytesIO("\n".join(lines).encode('utf-8'))
+
+def monthly_exports(n_pages=1500):
+    cta, users = {}, {}
+    for month, offset in [('2024-01', 0), ('2024-02', 7)]:
+        rows = [('google', f'/p{i}', (i + offset) % 50 + 1) for i in range(n_pages)]
+        # Claves repetidas, algunas solo tras pasar a minúsculas y quitar espacios, separadas por más de un bloque
+        repeated = [('google', '/a', 5), ('Google', '/A ', 4), (' google', '/a', 6), ('bing', '/p3', 2)]
+        users[month] = ga_export(repeated[:2] + rows + repeated[2:], 'Total de usuarios')
+        cta[month] = ga_export([('google', '/a', 1), ('GOOGLE', '/a', 2)] + rows[::3] + [('direct', '/solo-cta', 9)], 'clicks')
+    return cta, users
+
+def test_repeated_keys_match_in_memory():
+    cta, users = monthly_exports()
+    in_memory = analyze_monthly_files(cta, users)
+    out_of_core = analyze_monthly_files_out_of_core(cta, users, memory_limit_mb=1)
+
+    for key in ['merged_monthly', 'consolidated_data']:
+        pd.testing.assert_frame_equal(in_memory[key].astype(object), out_of_core[key].astype(object))
+    for key in ['detail_cube', 'consolidated_cube']:
+        pd.testing.assert_frame_equal(in_memory[key].cells.reset_index().astype(object),
+                                      out_of_core[key].cells.reset_index().astype(object))
+    assert in_memory['unmatched']['users'] == out_of_core['unmatched']['users']
+    pd.testing.assert_frame_equal(in_memory['unmatched']['cta'].astype(object), out_of_core['unmatched']['cta'].astype(object))
+
+    merged = in_memory['merged_monthly']
+    google_a = merged[(merged['fuente'] == 'google') & (merged['landing_page'] == '/a') & (merged['mes'] == '2024-01')]
+    assert google_a[['total_users', 'cta_clicks']].values.tolist() == [[15, 3]]
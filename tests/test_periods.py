@@ -0,0 +1,46 @@
+"""
+Deducción del periodo 'YYYY-MM' a partir del nombre de los archivos.
+"""
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from periods import assign_periods, parse_period, period_axis, period_display
+
+@pytest.mark.parametrize('name, expected', [
+    ('usuarios_2024-01.csv', '2024-01'),
+    ('cta_2024_12.csv', '2024-12'),
+    ('export_202403.csv', '2024-03'),
+    ('export_20240331.csv', '2024-03'),
+    ('clicks 03-2023.csv', '2023-03'),
+    ('clicks_3.2023.csv', '2023-03'),
+    ('Usuarios_Enero_2024.csv', '2024-01'),
+    ('cta-sep-2023.csv', '2023-09'),
+    ('Formularios Diciembre.csv', None),
+    ('usuarios_2024-13.csv', None),
+    ('usuarios.csv', None),
+    # Dos meses o dos años en el nombre: ambiguo
+    ('enero_febrero_2024.csv', None),
+    ('enero_2023_2024.csv', None),
+])
+def test_parse_period(name, expected):
+    assert parse_period(name) == expected
+
+def test_parse_period_default_year():
+    assert parse_period('Formularios Diciembre.csv', default_year=2023) == '2023-12'
+    # El año del nombre tiene prioridad
+    assert parse_period('usuarios_marzo_2022.csv', default_year=2023) == '2022-03'
+
+def test_period_display_and_axis():
+    assert period_display('2024-01') == 'enero 2024'
+    assert period_display('Total') == 'Total'
+    assert period_axis(['2024-01', '2024-02']).tolist() == [pd.Timestamp('2024-01-01'), pd.Timestamp('2024-02-01')]
+    assert period_axis(['2024-01', 'enero']).tolist() == ['2024-01', 'enero']
+
+def test_assign_periods():
+    files = [SimpleNamespace(name=name) for name in ['b_2024-02.csv', 'a_2024-01.csv', 'c_2024-01.csv', 'sin_fecha.csv']]
+    assigned, skipped = assign_periods(files)
+    assert {period: file.name for period, file in assigned.items()} == {'2024-01': 'a_2024-01.csv', '2024-02': 'b_2024-02.csv'}
+    assert list(assigned) == ['2024-01', '2024-02']
+    assert [file.name for file, _ in skipped] == ['c_2024-01.csv', 'sin_fecha.csv']
@@ -0,0 +1,62 @@
+"""
+Intervalos de Wilson y bayesianos y test z de dos proporciones contra valores conocidos.
+"""
+import math
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from significance import bayesian_interval, compare_rows, top_rates, two_proportion_test, wilson_interval, z_value
+
+def test_z_value():
+    assert z_value(0.95) == pytest.approx(1.959964, abs=1e-6)
+    assert z_value(0.99) == pytest.approx(2.575829, abs=1e-6)
+
+def test_wilson_interval():
+    low, high = wilson_interval(np.array([10, 0, 100]), np.array([100, 10, 100]), 0.95)
+    # 10/100: (0.0552, 0.1744); 0/10: el límite inferior es 0 y el superior z²/(n + z²)
+    assert low[0] == pytest.approx(0.05523, abs=1e-4)
+    assert high[0] == pytest.approx(0.17437, abs=1e-4)
+    assert low[1] == pytest.approx(0, abs=1e-12)
+    assert high[1] == pytest.approx(1.959964 ** 2 / (10 + 1.959964 ** 2), abs=1e-6)
+    assert high[2] == pytest.approx(1, abs=1e-12)
+
+def test_wilson_interval_caps_successes_and_skips_empty_rows():
+    low, high = wilson_interval(np.array([12, 3]), np.array([10, 0]), 0.95)
+    assert high[0] == pytest.approx(1, abs=1e-12)
+    assert np.isnan(low[1]) and np.isnan(high[1])
+
+def test_bayesian_interval_is_beta_quantile():
+    pytest.importorskip('scipy')
+    # Beta(1, 11): cuantil q = 1 - (1 - q) ** (1 / 11)
+    low, high = bayesian_interval(np.array([0]), np.array([10]), 0.95, prior=(1, 1))
+    assert low[0] == pytest.approx(1 - 0.975 ** (1 / 11), abs=1e-6)
+    assert high[0] == pytest.approx(1 - 0.025 ** (1 / 11), abs=1e-6)
+
+def test_bayesian_interval_large_counts():
+    # Con muchos usuarios la posterior Beta(501, 501) es casi normal (con o sin scipy)
+    low, high = bayesian_interval(np.array([500]), np.array([1000]), 0.95, prior=(1, 1))
+    margin = 1.959964 * math.sqrt(0.25 / 1003)
+    assert low[0] == pytest.approx(0.5 - margin, abs=1e-3)
+    assert high[0] == pytest.approx(0.5 + margin, abs=1e-3)
+
+def test_two_proportion_test():
+    z, p_value = two_proportion_test(np.array([50, 30]), np.array([100, 100]), np.array([40, 30]), np.array([100, 100]))
+    # Varianza agrupada: p = 0.45, z = 0.1 / sqrt(0.45 · 0.55 · 0.02)
+    expected_z = 0.1 / math.sqrt(0.45 * 0.55 * 0.02)
+    assert z[0] == pytest.approx(expected_z, abs=1e-9)
+    assert p_value[0] == pytest.approx(2 * (1 - NormalDist().cdf(expected_z)), abs=1e-6)
+    assert z[1] == 0 and p_value[1] == pytest.approx(1, abs=1e-6)
+
+def test_compare_rows_and_top_rates():
+    df = pd.DataFrame({'total_users': [3, 50000, 1000], 'cta_clicks': [2, 20000, 100]}, index=['/poco', '/mucho', '/bajo'])
+    df['CTR'] = df['cta_clicks'] / df['total_users'] * 100
+
+    z, p_value = compare_rows(df, 'CTR', '/mucho', '/bajo')
+    assert z > 0 and p_value < 0.001
+
+    # Por límite inferior la página con 3 usuarios no encabeza el ranking; por la tasa observada sí
+    assert top_rates(df, 'CTR', 2, by_lower_bound=True, confidence=0.95).index.tolist() == ['/mucho', '/poco']
+    assert top_rates(df, 'CTR', 1, by_lower_bound=False).index.tolist() == ['/poco']